@@ -9,6 +9,33 @@ import sciunit
 import matplotlib.pyplot as plt
 
 
+class VmStats(object):
+    """Summary statistics of one membrane potential trace.
+
+    Computed once, in one vectorized pass over the samples: the mean and
+    standard deviation from the raw array, and all quantiles from a single
+    selection (np.partition) instead of one sort per percentile.
+    """
+
+    def __init__(self, vm):
+        values = np.asarray(vm.magnitude if hasattr(vm, 'magnitude') else vm,
+                            dtype=float).ravel()
+        self.units = getattr(vm, 'units', pq.dimensionless)
+        self.mean = values.mean()
+        self.std = values.std()
+        self.initial = vm[0]
+        n = len(values)
+        # order statistics needed by linear interpolation (numpy's default)
+        positions = np.array([0.25, 0.5, 0.75]) * (n - 1)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, n - 1)
+        selected = np.partition(values, np.unique(np.concatenate([lower, upper])))
+        frac = positions - lower
+        q25, median, q75 = selected[lower] + frac * (selected[upper] - selected[lower])
+        self.median = median
+        self.iqr = q75 - q25
+
+
 class ProducesMembranePotential(sciunit.Capability):
     """Indicates that the model produces a somatic membrane potential."""
 
@@ -16,32 +43,45 @@ class ProducesMembranePotential(sciunit.Capability):
         """Must return a neo.core.AnalogSignal."""
         raise NotImplementedError()
 
+    def get_vm_stats(self, **kwargs):
+        """Return the VmStats of the current membrane potential.
+
+        The statistics are cached against the trace object itself, so they
+        are recomputed only after a new simulation produced a new trace.
+        """
+        vm = self.get_membrane_potential(**kwargs)
+        cached = getattr(self, '_vm_stats', None)
+        if cached is None or cached[0] is not vm:
+            cached = (vm, VmStats(vm))
+            self._vm_stats = cached
+        return cached[1]
+
+    def invalidate_vm_stats(self):
+        """Drop the cached statistics, e.g. after modifying a trace in place."""
+        self._vm_stats = None
+
     def get_mean_vm(self, **kwargs):
         """Get the mean membrane potential."""
-        vm = self.get_membrane_potential(**kwargs)
-        return np.mean(vm.base)
+        return self.get_vm_stats(**kwargs).mean
 
     def get_median_vm(self, **kwargs):
         """Get the median membrane potential."""
-        vm = self.get_membrane_potential(**kwargs)
-        return np.median(vm.base)
+        return self.get_vm_stats(**kwargs).median
 
     def get_std_vm(self, **kwargs):
         """Get the standard deviation of the membrane potential."""
-        vm = self.get_membrane_potential(**kwargs)
-        return np.std(vm.base)
+        return self.get_vm_stats(**kwargs).std
 
     def get_iqr_vm(self, **kwargs):
         """Get the inter-quartile range of the membrane potential."""
-        vm = self.get_membrane_potential(**kwargs)
-        return (np.percentile(vm, 75) - np.percentile(vm, 25))*vm.units
+        stats = self.get_vm_stats(**kwargs)
+        return stats.iqr*stats.units
 
     def get_initial_vm(self, **kwargs):
         """Return a quantity corresponding to the starting membrane potential.
         This will in some cases be the resting potential.
         """
-        vm = self.get_membrane_potential(**kwargs)
-        return vm[0]  # A neo.core.AnalogSignal object
+        return self.get_vm_stats(**kwargs).initial  # A neo.core.AnalogSignal object
 
     def plot_membrane_potential(self, ax=None, ylim=(None, None), **kwargs):
         """Plot the membrane potential."""
@@ -1,10 +1,32 @@
 """
 JITHUB models
+
+Models and backends are imported on first use (PEP 562), so that
+`from jithub import IzhiModel` loads the Izhikevich backend only, not
+the MAT (matplotlib, scipy) or ADEXP modules.
 """
-#import .models
-from jithub.models.model_classes import IzhiModel, MATModel, ADEXPModel
-from jithub.models.backends import izhikevich
-from jithub.models.backends import mat_nu
-from jithub.models.backends import adexp
+import importlib
+
+_LAZY = {
+    "IzhiModel": "jithub.models",
+    "MATModel": "jithub.models",
+    "ADEXPModel": "jithub.models",
+    "izhikevich": "jithub.models.backends.izhikevich",
+    "mat_nu": "jithub.models.backends.mat_nu",
+    "adexp": "jithub.models.backends.adexp",
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = importlib.import_module(_LAZY[name])
+    value = module if module.__name__.endswith("." + name) else getattr(module, name)
+    globals()[name] = value
+    return value
+
 
-#from .backends import izhikevich
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,3 @@
+"""
+Compiled analysis kernels that work directly on raw (batched) voltage arrays.
+"""
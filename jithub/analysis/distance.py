@@ -0,0 +1,199 @@
+"""
+Compiled distances between batches of voltage traces and target traces.
+
+Every row of a (n_models, n_steps) voltage matrix is scored against a
+target trace (one shared target, or one per row) in a single parallel
+pass:
+
+  rmse  root mean squared difference of the samples,
+  dtw   dynamic time warping: the squared differences summed along the
+        cheapest monotone alignment of the two traces within a band of
+        +- band ms, divided by the number of samples and square rooted.
+        It is never larger than rmse and forgives small spike time shifts.
+
+With spike_window=(before, after) only windows around the target spikes
+are scored: the window of the k-th target spike is compared with the
+same window around the k-th spike of the model (or, when the model has
+fewer spikes, with the model trace at the target spike time). This
+scores spike shapes independently of spike timing.
+
+Targets recorded with another sampling period are linearly resampled
+onto the model grid first; samples outside the overlap of the two
+traces are not scored.
+"""
+import numpy as np
+from numba import jit, prange
+
+from .spikes import as_array, batch_spike_times, count_crossings, fill_crossings
+
+METRICS = ("rmse", "dtw")
+
+
+@jit(nopython=True)
+def squared_error(x, y):
+    total = 0.0
+    for i in range(x.shape[0]):
+        r = x[i] - y[i]
+        total += r * r
+    return total
+
+
+@jit(nopython=True)
+def dtw_cost(x, y, band, prev, cur):
+    """
+    Squared error along the cheapest alignment of x and y (same length)
+    that never pairs samples more than band apart. prev and cur are
+    scratch rows at least as long as x.
+    """
+    n = x.shape[0]
+    for i in range(n):
+        lo = max(0, i - band)
+        hi = min(n - 1, i + band)
+        for j in range(lo, hi + 1):
+            r = x[i] - y[j]
+            if i == 0:
+                best = 0.0 if j == 0 else cur[j - 1]
+            else:
+                # the previous row is only filled within its own band
+                best = np.inf
+                if j - 1 >= max(0, i - 1 - band):
+                    best = prev[j - 1]
+                if j <= i - 1 + band and prev[j] < best:
+                    best = prev[j]
+                if j > lo and cur[j - 1] < best:
+                    best = cur[j - 1]
+            cur[j] = best + r * r
+        prev, cur = cur, prev
+    return prev[n - 1]
+
+
+@jit(nopython=True)
+def segment_cost(x, y, dtw, band, prev, cur):
+    if dtw:
+        return dtw_cost(x, y, band, prev, cur)
+    return squared_error(x, y)
+
+
+@jit(nopython=True, parallel=True)
+def batch_distance(vm, targets, target_rows, n, dtw, band):
+    """
+    Distance of the first n samples of every row of vm to its target row
+    (targets[target_rows[row]]).
+    """
+    out = np.empty(vm.shape[0])
+    for row in prange(vm.shape[0]):
+        prev = np.empty(n if dtw else 0)
+        cur = np.empty(n if dtw else 0)
+        cost = segment_cost(vm[row, :n], targets[target_rows[row], :n], dtw, band, prev, cur)
+        out[row] = np.sqrt(cost / n) if n > 0 else np.nan
+    return out
+
+
+@jit(nopython=True, parallel=True)
+def batch_window_distance(vm, targets, target_rows, n, spikes, offsets, before, after,
+                          threshold, dt, dtw, band):
+    """
+    Distance of every row of vm to its target over windows of before +
+    after samples around the target spikes (spikes[offsets[t]:offsets[t +
+    1]], in ms), each aligned with the matching spike of the model row.
+    Rows whose target has no spikes score NaN.
+    """
+    length = before + after
+    out = np.empty(vm.shape[0])
+    for row in prange(vm.shape[0]):
+        trace = vm[row, :n]
+        target = targets[target_rows[row], :n]
+        wanted = spikes[offsets[target_rows[row]]:offsets[target_rows[row] + 1]]
+        own = np.empty(count_crossings(trace, threshold, dt, 0.0))
+        fill_crossings(trace, threshold, dt, 0.0, 0.0, own)
+        prev = np.empty(length if dtw else 0)
+        cur = np.empty(length if dtw else 0)
+        cost = 0.0
+        count = 0
+        for k in range(wanted.shape[0]):
+            t_start = int(wanted[k] / dt) - before + 1
+            m_start = t_start
+            if k < own.shape[0]:
+                m_start = int(own[k] / dt) - before + 1
+            # clip both windows by the same amount
+            skip = max(0, -t_start, -m_start)
+            stop = length - max(0, t_start + length - n, m_start + length - n)
+            if stop <= skip:
+                continue
+            cost += segment_cost(trace[m_start + skip:m_start + stop],
+                                 target[t_start + skip:t_start + stop], dtw, band, prev, cur)
+            count += stop - skip
+        out[row] = np.sqrt(cost / count) if count > 0 else np.nan
+    return out
+
+
+def resample(trace, dt, new_dt, t_start=0.0, new_t_start=0.0):
+    """
+    Linear interpolation of traces (1D or one per row) sampled every dt ms
+    from t_start onto the grid new_t_start + k * new_dt that lies within
+    them.
+    """
+    trace = np.asarray(trace, dtype=np.float64)
+    end = t_start + (trace.shape[-1] - 1) * dt
+    n = int(np.floor((end - new_t_start) / new_dt + 1e-9)) + 1
+    first = int(np.ceil((t_start - new_t_start) / new_dt - 1e-9))
+    times = new_t_start + np.arange(max(first, 0), max(n, 0)) * new_dt
+    old = t_start + np.arange(trace.shape[-1]) * dt
+    if trace.ndim == 1:
+        return np.interp(times, old, trace)
+    return np.array([np.interp(times, old, row) for row in trace])
+
+
+def prepare_target(target, dt, target_dt=None):
+    """
+    Targets (a trace, one per row or an AnalogSignal) as a C-contiguous
+    2D float array on the model grid (t = 0, dt, ...); a target starting
+    after t = 0 is padded at the front with its first sample.
+    """
+    if target_dt is None and not hasattr(target, "sampling_period"):
+        target_dt = dt
+    target, target_dt, t_start = as_array(target, target_dt)
+    target = np.atleast_2d(target)
+    if target_dt != dt or t_start != 0.0:
+        if t_start > 0.0:
+            lead = int(np.ceil(t_start / dt - 1e-9))
+            target = np.hstack([np.repeat(target[:, :1], lead, axis=1),
+                                resample(target, target_dt, dt, t_start, lead * dt)])
+        else:
+            target = resample(target, target_dt, dt, t_start, 0.0)
+    return np.ascontiguousarray(target)
+
+
+def trace_distance(vm, target, dt=None, target_dt=None, metric="rmse", band=5.0,
+                   spike_window=None, threshold=0.0):
+    """
+    Distance of each model trace to the target, see the module docstring.
+    vm: a trace, a (n_models, n_steps) array or an AnalogSignal sampled
+    every dt ms from t = 0. target: one trace or one per model (array or
+    AnalogSignal), sampled every target_dt ms (default dt).
+    metric: "rmse" or "dtw"; band: the DTW band in ms.
+    spike_window: optional (before, after) ms around the target spikes.
+    Returns a float for a single trace, else an (n_models,) array.
+    """
+    if metric not in METRICS:
+        raise ValueError("metric must be one of %s, got %r" % (METRICS, metric))
+    vm, dt, _ = as_array(vm, dt)
+    single = vm.ndim == 1
+    vm = np.atleast_2d(vm)
+    targets = prepare_target(target, dt, target_dt)
+    if targets.shape[0] not in (1, vm.shape[0]):
+        raise ValueError("%d targets for %d traces" % (targets.shape[0], vm.shape[0]))
+    target_rows = np.arange(vm.shape[0]) % targets.shape[0]
+    n = min(vm.shape[1], targets.shape[1])
+    dtw = metric == "dtw"
+    band = int(round(float(band) / dt))
+    if spike_window is None:
+        out = batch_distance(vm, targets, target_rows, n, dtw, band)
+    else:
+        before, after = (int(round(float(w) / dt)) for w in spike_window)
+        if before < 0 or after < 0 or before + after == 0:
+            raise ValueError("spike_window must be two non-negative durations, got %r" % (spike_window,))
+        spikes, offsets = batch_spike_times(targets[:, :n], float(threshold), dt, 0.0, 0.0)
+        out = batch_window_distance(vm, targets, target_rows, n, spikes, offsets, before, after,
+                                    float(threshold), dt, dtw, band)
+    return float(out[0]) if single else out
@@ -0,0 +1,197 @@
+"""
+One-pass compiled electrophysiology feature extraction.
+
+All features of a trace are gathered in a single walk over its samples
+(the only look-back is a scan over the rising phase of each action
+potential to find its half-height). Batches of traces (one per row) are
+processed in parallel, and the result is a NumPy structured array with one
+record per trace and one float field per requested feature. Undefined
+features (e.g. the ISI of a trace with a single spike) are NaN.
+
+Spikes are upward crossings of threshold, as in jithub.analysis.spikes.
+AP onset is where dV/dt first rises above dvdt_threshold before the
+crossing (or the sample before the crossing if it never does).
+"""
+import numpy as np
+from numba import jit, prange
+
+from .spikes import as_array, crossing_time
+
+FEATURE_NAMES = (
+    "spike_count",  # number of spikes
+    "mean_rate",  # Hz over the whole trace
+    "first_spike_latency",  # ms after stim_start
+    "mean_isi",  # ms
+    "isi_cv",  # std / mean of the ISIs
+    "adaptation_index",  # mean of (isi[k+1] - isi[k]) / (isi[k+1] + isi[k])
+    "ap_peak",  # mean peak voltage, mV
+    "ap_amplitude",  # mean peak - onset, mV
+    "ap_width",  # mean full width at half amplitude, ms
+    "ahp_depth",  # mean onset - following trough, mV
+)
+N_FEATURES = len(FEATURE_NAMES)
+WIDTH = FEATURE_NAMES.index("ap_width")
+
+
+@jit(nopython=True)
+def trace_features(vm, dt, t_start, threshold, dvdt_threshold, stim_start, want_width, out):
+    """Fill out (length N_FEATURES) with the features of one trace."""
+    n = vm.shape[0]
+    n_spikes = 0
+    first = np.nan
+    last = np.nan
+    isi_sum = 0.0
+    isi_sq = 0.0
+    prev_isi = np.nan
+    adapt_sum = 0.0
+    n_adapt = 0
+    peak_sum = 0.0
+    amp_sum = 0.0
+    width_sum = 0.0
+    n_width = 0
+    ahp_sum = 0.0
+    n_ahp = 0
+
+    in_spike = False
+    armed = False
+    onset_v = 0.0
+    onset_i = 0
+    peak = 0.0
+    peak_i = 0
+    trough = np.inf
+    prev_onset = np.nan
+    falling = False
+    half = 0.0
+    rise_t = 0.0
+
+    for i in range(1, n):
+        v0 = vm[i - 1]
+        v1 = vm[i]
+        if falling and v0 > half >= v1:
+            width_sum += crossing_time(vm, i, half, dt, t_start) - rise_t
+            n_width += 1
+            falling = False
+        if not in_spike:
+            if v1 < trough:
+                trough = v1
+            if not armed and (v1 - v0) / dt >= dvdt_threshold:
+                armed = True
+                onset_v = v0
+                onset_i = i - 1
+            elif armed and v1 < v0 and v1 < threshold:
+                armed = False
+            if v0 <= threshold < v1:
+                t = crossing_time(vm, i, threshold, dt, t_start)
+                if not armed:
+                    onset_v = v0
+                    onset_i = i - 1
+                armed = False
+                if n_spikes == 0:
+                    first = t
+                else:
+                    isi = t - last
+                    isi_sum += isi
+                    isi_sq += isi * isi
+                    if prev_isi == prev_isi and isi + prev_isi > 0:
+                        adapt_sum += (isi - prev_isi) / (isi + prev_isi)
+                        n_adapt += 1
+                    prev_isi = isi
+                if prev_onset == prev_onset:
+                    ahp_sum += prev_onset - trough
+                    n_ahp += 1
+                last = t
+                n_spikes += 1
+                in_spike = True
+                falling = False
+                peak = v1
+                peak_i = i
+        else:
+            if v1 > peak:
+                peak = v1
+                peak_i = i
+            if v1 <= threshold:
+                in_spike = False
+                amp = peak - onset_v
+                peak_sum += peak
+                amp_sum += amp
+                prev_onset = onset_v
+                trough = v1
+                if want_width:
+                    half = onset_v + 0.5 * amp
+                    for j in range(peak_i, onset_i, -1):
+                        if vm[j - 1] < half <= vm[j]:
+                            rise_t = crossing_time(vm, j, half, dt, t_start)
+                            falling = True
+                            break
+                    if falling and v0 > half >= v1:
+                        width_sum += crossing_time(vm, i, half, dt, t_start) - rise_t
+                        n_width += 1
+                        falling = False
+    if in_spike:
+        # the trace ends during a spike
+        peak_sum += peak
+        amp_sum += peak - onset_v
+        prev_onset = onset_v
+    if prev_onset == prev_onset and trough < np.inf and not in_spike:
+        ahp_sum += prev_onset - trough
+        n_ahp += 1
+
+    duration = (n - 1) * dt
+    out[0] = n_spikes
+    out[1] = n_spikes / (duration / 1000.0) if duration > 0 else np.nan
+    out[2] = first - stim_start
+    out[3] = np.nan
+    out[4] = np.nan
+    out[5] = np.nan
+    if n_spikes > 1:
+        mean_isi = isi_sum / (n_spikes - 1)
+        out[3] = mean_isi
+        var = max(isi_sq / (n_spikes - 1) - mean_isi * mean_isi, 0.0)
+        out[4] = np.sqrt(var) / mean_isi if mean_isi > 0 else np.nan
+    if n_adapt > 0:
+        out[5] = adapt_sum / n_adapt
+    out[6] = peak_sum / n_spikes if n_spikes else np.nan
+    out[7] = amp_sum / n_spikes if n_spikes else np.nan
+    out[8] = width_sum / n_width if n_width else np.nan
+    out[9] = ahp_sum / n_ahp if n_ahp else np.nan
+
+
+@jit(nopython=True, parallel=True)
+def batch_features(vm, dt, t_start, threshold, dvdt_threshold, stim_start, want_width):
+    """Features of every row of a 2D array of traces, shape (rows, N_FEATURES)."""
+    out = np.empty((vm.shape[0], N_FEATURES))
+    for row in prange(vm.shape[0]):
+        trace_features(vm[row], dt, t_start, threshold, dvdt_threshold, stim_start,
+                       want_width, out[row])
+    return out
+
+
+def feature_dtype(features=FEATURE_NAMES):
+    return np.dtype([(name, np.float64) for name in features])
+
+
+def extract_features(vm, features=None, threshold=0.0, dvdt_threshold=20.0,
+                     stim_start=0.0, dt=None):
+    """
+    Compute features (default: all of FEATURE_NAMES) for a trace, a 2D
+    array of traces (one per row) or an AnalogSignal.
+    Returns a structured array with one record per trace (a 0-d record
+    for a single trace).
+    """
+    if features is None:
+        features = FEATURE_NAMES
+    unknown = [f for f in features if f not in FEATURE_NAMES]
+    if unknown:
+        raise ValueError("unknown features: %s" % ", ".join(unknown))
+    vm, dt, t_start = as_array(vm, dt)
+    single = vm.ndim == 1
+    values = batch_features(np.atleast_2d(vm), dt, t_start, float(threshold),
+                            float(dvdt_threshold), float(stim_start) + t_start,
+                            "ap_width" in features)
+    if tuple(features) == FEATURE_NAMES:
+        result = values.view(feature_dtype())[:, 0]
+    else:
+        result = np.empty(len(values), dtype=feature_dtype(features))
+        for name in features:
+            result[name] = values[:, FEATURE_NAMES.index(name)]
+    return result[0] if single else result
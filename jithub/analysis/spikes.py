@@ -0,0 +1,128 @@
+"""
+Compiled spike detection shared by every backend.
+
+A spike is an upward threshold crossing, vm[i-1] <= threshold < vm[i],
+which is the convention of elephant's threshold_detection. Crossing times
+are linearly interpolated between the two samples that bracket the
+threshold, and crossings closer than a refractory period to the previous
+accepted spike are ignored.
+
+Traces may be 1D (one trace), 2D (one trace per row) or neo AnalogSignals.
+Plain arrays carry no sampling period, so dt (ms) must be given with them.
+Times are returned in ms as plain floats.
+"""
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True)
+def crossing_time(vm, i, threshold, dt, t_start):
+    """Interpolated time of the crossing between samples i - 1 and i."""
+    rise = vm[i] - vm[i - 1]
+    frac = 0.0
+    if rise > 0:
+        frac = (threshold - vm[i - 1]) / rise
+    return t_start + dt * (i - 1 + frac)
+
+
+@jit(nopython=True)
+def count_crossings(vm, threshold, dt, refractory):
+    n = 0
+    last = -np.inf
+    for i in range(1, vm.shape[0]):
+        if vm[i - 1] <= threshold < vm[i]:
+            t = crossing_time(vm, i, threshold, dt, 0.0)
+            if t - last >= refractory:
+                n += 1
+                last = t
+    return n
+
+
+@jit(nopython=True)
+def fill_crossings(vm, threshold, dt, refractory, t_start, out):
+    n = 0
+    last = -np.inf
+    for i in range(1, vm.shape[0]):
+        if vm[i - 1] <= threshold < vm[i]:
+            t = crossing_time(vm, i, threshold, dt, t_start)
+            if t - last >= refractory:
+                out[n] = t
+                n += 1
+                last = t
+    return n
+
+
+@jit(nopython=True)
+def detect_spikes(vm, threshold, dt, refractory, t_start):
+    """Interpolated spike times of a single trace."""
+    out = np.empty(count_crossings(vm, threshold, dt, refractory))
+    fill_crossings(vm, threshold, dt, refractory, t_start, out)
+    return out
+
+
+@jit(nopython=True, parallel=True)
+def batch_spike_counts(vm, threshold, dt, refractory):
+    """Spike count of every row of a 2D array of traces."""
+    counts = np.zeros(vm.shape[0], dtype=np.int64)
+    for row in prange(vm.shape[0]):
+        counts[row] = count_crossings(vm[row], threshold, dt, refractory)
+    return counts
+
+
+@jit(nopython=True, parallel=True)
+def batch_spike_times(vm, threshold, dt, refractory, t_start):
+    """
+    Spike times of every row of a 2D array of traces, in ragged form:
+    the spikes of row r are times[offsets[r]:offsets[r + 1]].
+    """
+    counts = batch_spike_counts(vm, threshold, dt, refractory)
+    offsets = np.zeros(vm.shape[0] + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    times = np.empty(offsets[-1])
+    for row in prange(vm.shape[0]):
+        fill_crossings(vm[row], threshold, dt, refractory, t_start,
+                       times[offsets[row]:offsets[row + 1]])
+    return times, offsets
+
+
+def as_array(vm, dt=None):
+    """
+    Strip a neo AnalogSignal (or quantities array) down to a float array
+    and its sampling period and start time in ms. dt overrides the
+    sampling period of a signal and is required for anything else.
+    """
+    t_start = 0.0
+    if hasattr(vm, "sampling_period"):
+        if dt is None:
+            dt = float(vm.sampling_period.rescale("ms").magnitude)
+        t_start = float(vm.t_start.rescale("ms").magnitude)
+        # neo stores channels as columns
+        vm = vm.magnitude.T
+        if vm.ndim == 2 and vm.shape[0] == 1:
+            vm = vm[0]
+    elif hasattr(vm, "magnitude"):
+        vm = vm.magnitude
+    if dt is None:
+        raise ValueError("dt (ms) is required for traces without a sampling period")
+    vm = np.ascontiguousarray(vm, dtype=np.float64)
+    return vm, float(dt), t_start
+
+
+def spike_times(vm, threshold=0.0, refractory=0.0, dt=None):
+    """
+    Interpolated spike times (ms). For a 2D array of traces a list with
+    one array per row is returned.
+    """
+    vm, dt, t_start = as_array(vm, dt)
+    if vm.ndim == 2:
+        times, offsets = batch_spike_times(vm, float(threshold), dt, float(refractory), t_start)
+        return [times[offsets[r]:offsets[r + 1]] for r in range(vm.shape[0])]
+    return detect_spikes(vm, float(threshold), dt, float(refractory), t_start)
+
+
+def spike_count(vm, threshold=0.0, refractory=0.0, dt=None):
+    """Number of spikes of a trace, or an array of counts for 2D input."""
+    vm, dt, _ = as_array(vm, dt)
+    if vm.ndim == 2:
+        return batch_spike_counts(vm, float(threshold), dt, float(refractory))
+    return int(count_crossings(vm, float(threshold), dt, float(refractory)))
@@ -0,0 +1,3 @@
+"""
+Headless regression and performance suites for the jithub kernels.
+"""
@@ -0,0 +1,217 @@
+"""
+Headless version of the Izhikevich (2004) "20 behaviours" figure
+(https://www.izhikevich.org/publications/whichmod.htm, figure1.m).
+
+Every behaviour is simulated without plotting, its qualitative features
+(spike count, burst count, first spike latency) are checked against the
+stored reference in izhikevich2004_reference.json, and the wall time and
+simulated milliseconds per wall second are reported for each backend.
+
+Usage:
+    python -m jithub.benchmarks.izhikevich2004 [--backend numba] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from jithub.models.backends.izhikevich_elaborate_dynamics import get_2004_vm
+
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), "izhikevich2004_reference.json")
+
+# spikes closer than this (ms) belong to the same burst
+BURST_ISI = 10.0
+# tolerance on the first spike latency (ms)
+LATENCY_TOLERANCE = 1.0
+
+##
+# The compiled kernel and the same code run by the Python interpreter.
+##
+BACKENDS = OrderedDict([
+    ("numba", get_2004_vm),
+    ("python", get_2004_vm.py_func),
+])
+
+
+def pulses(t, onsets, width, amplitude, baseline=0.0):
+    """Rectangular pulses of a given width, open intervals as in figure1.m."""
+    I = np.full(len(t), float(baseline))
+    for onset in onsets:
+        I[(t > onset) & (t < onset + width)] = amplitude
+    return I
+
+
+def accommodation_current(t):
+    I = np.zeros(len(t))
+    I[t < 200] = t[t < 200] / 25.0
+    late = (t >= 300) & (t < 312.5)
+    I[late] = (t[late] - 300) / 12.5 * 4
+    return I
+
+
+def behaviour(title, a, b, c, d, v_init, t_stop, dt, current, u_init=None,
+              k1=5.0, k0=140.0, accommodation=False):
+    return dict(title=title, a=a, b=b, c=c, d=d, v_init=v_init,
+                u_init=b * v_init if u_init is None else u_init,
+                t_stop=t_stop, dt=dt, current=current,
+                k1=k1, k0=k0, accommodation=accommodation)
+
+
+BEHAVIOURS = OrderedDict([
+    ("A", behaviour("(A) tonic spiking", 0.02, 0.2, -65, 6, -70, 100, 0.25,
+                    lambda t: np.where(t > 10, 14.0, 0.0))),
+    ("B", behaviour("(B) phasic spiking", 0.02, 0.25, -65, 6, -64, 200, 0.25,
+                    lambda t: np.where(t > 20, 0.5, 0.0))),
+    ("C", behaviour("(C) tonic bursting", 0.02, 0.2, -50, 2, -70, 220, 0.25,
+                    lambda t: np.where(t > 22, 15.0, 0.0))),
+    ("D", behaviour("(D) phasic bursting", 0.02, 0.25, -55, 0.05, -64, 200, 0.2,
+                    lambda t: np.where(t > 20, 0.6, 0.0))),
+    ("E", behaviour("(E) mixed mode", 0.02, 0.2, -55, 4, -70, 160, 0.25,
+                    lambda t: np.where(t > 16, 10.0, 0.0))),
+    ("F", behaviour("(F) spike frequency adaptation", 0.01, 0.2, -65, 8, -70, 85, 0.25,
+                    lambda t: np.where(t > 8.5, 30.0, 0.0))),
+    ("G", behaviour("(G) Class 1 excitable", 0.02, -0.1, -55, 6, -60, 300, 0.25,
+                    lambda t: np.where(t > 30, 0.075 * (t - 30), 0.0),
+                    k1=4.1, k0=108.0)),
+    ("H", behaviour("(H) Class 2 excitable", 0.2, 0.26, -65, 0, -64, 300, 0.25,
+                    lambda t: np.where(t > 30, -0.5 + 0.015 * (t - 30), -0.5))),
+    ("I", behaviour("(I) spike latency", 0.02, 0.2, -65, 6, -70, 100, 0.2,
+                    lambda t: pulses(t, [10], 3, 7.04))),
+    ("J", behaviour("(J) subthreshold oscillations", 0.05, 0.26, -60, 0, -62, 200, 0.25,
+                    lambda t: pulses(t, [20], 5, 2.0))),
+    ("K", behaviour("(K) resonator", 0.1, 0.26, -60, -1, -62, 400, 0.25,
+                    lambda t: pulses(t, [40, 60, 280, 320], 4, 0.65))),
+    ("L", behaviour("(L) integrator", 0.02, -0.1, -55, 6, -60, 100, 0.25,
+                    lambda t: pulses(t, [100 / 11.0, 100 / 11.0 + 5, 70, 80], 2, 9.0),
+                    k1=4.1, k0=108.0)),
+    ("M", behaviour("(M) rebound spike", 0.03, 0.25, -60, 4, -64, 200, 0.2,
+                    lambda t: pulses(t, [20], 5, -15.0))),
+    ("N", behaviour("(N) rebound burst", 0.03, 0.25, -52, 0, -64, 200, 0.2,
+                    lambda t: pulses(t, [20], 5, -15.0))),
+    ("O", behaviour("(O) threshold variability", 0.03, 0.25, -60, 4, -64, 100, 0.25,
+                    lambda t: pulses(t, [10, 80], 5, 1.0) + pulses(t, [70], 5, -6.0))),
+    ("P", behaviour("(P) bistability", 0.1, 0.26, -60, 0, -61, 300, 0.25,
+                    lambda t: pulses(t, [300 / 8.0, 216], 5, 1.24, baseline=0.24))),
+    ("Q", behaviour("(Q) depolarizing after-potential", 1.0, 0.2, -60, -21, -70, 50, 0.1,
+                    lambda t: np.where(np.abs(t - 10) < 1, 20.0, 0.0))),
+    ("R", behaviour("(R) accommodation", 0.02, 1.0, -55, 4, -65, 400, 0.5,
+                    accommodation_current, u_init=-16.0, accommodation=True)),
+    ("S", behaviour("(S) inhibition-induced spiking", -0.02, -1.0, -60, 8, -63.8, 350, 0.5,
+                    lambda t: np.where((t < 50) | (t > 250), 80.0, 75.0))),
+    ("T", behaviour("(T) inhibition-induced bursting", -0.026, -1.0, -45, -2, -63.8, 350, 0.5,
+                    lambda t: np.where((t < 50) | (t > 250), 80.0, 75.0))),
+])
+
+
+def stimulus(name):
+    """Return the time axis and injected current of a behaviour."""
+    spec = BEHAVIOURS[name]
+    t = np.arange(0, spec["t_stop"] + spec["dt"] / 2.0, spec["dt"])
+    return t, np.asarray(spec["current"](t), dtype=np.float64)
+
+
+def simulate(name, backend="numba"):
+    """Simulate one behaviour, returns (t, vm)."""
+    spec = BEHAVIOURS[name]
+    t, I = stimulus(name)
+    vm = BACKENDS[backend](I, spec["dt"], spec["a"], spec["b"], spec["c"], spec["d"],
+                           spec["v_init"], spec["u_init"], 0.04, spec["k1"], spec["k0"],
+                           spec["accommodation"])
+    return t, vm
+
+
+def spike_features(t, vm, burst_isi=BURST_ISI):
+    """Spike count, burst count and first spike latency of a trace."""
+    spike_times = t[np.flatnonzero(vm >= 30)]
+    n_bursts = 0
+    if len(spike_times):
+        n_bursts = 1 + int(np.sum(np.diff(spike_times) > burst_isi))
+    first_spike = float(spike_times[0]) if len(spike_times) else None
+    return {"n_spikes": int(len(spike_times)), "n_bursts": n_bursts,
+            "first_spike": first_spike}
+
+
+def load_reference(path=REFERENCE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_features(features, expected):
+    """True when the qualitative features agree with the reference."""
+    if features["n_spikes"] != expected["n_spikes"]:
+        return False
+    if features["n_bursts"] != expected["n_bursts"]:
+        return False
+    if expected["first_spike"] is None or features["first_spike"] is None:
+        return features["first_spike"] == expected["first_spike"]
+    return abs(features["first_spike"] - expected["first_spike"]) <= LATENCY_TOLERANCE
+
+
+def run_gallery(backends=tuple(BACKENDS), behaviours=tuple(BEHAVIOURS), repeat=3,
+                reference=None):
+    """
+    Simulate every behaviour with every backend.
+    Returns one result dict per (behaviour, backend) with the measured
+    features, whether they match the reference, the best wall time of
+    repeat runs (after one untimed warm-up call, which absorbs JIT
+    compilation) and the simulated milliseconds per wall second.
+    """
+    if reference is None:
+        reference = load_reference()
+    results = []
+    for backend in backends:
+        for name in behaviours:
+            t, vm = simulate(name, backend)
+            best = np.inf
+            for _ in range(repeat):
+                t1 = time.perf_counter()
+                simulate(name, backend)
+                best = min(best, time.perf_counter() - t1)
+            features = spike_features(t, vm)
+            expected = reference.get(name)
+            results.append(dict(
+                behaviour=name,
+                title=BEHAVIOURS[name]["title"],
+                backend=backend,
+                ok=expected is not None and check_features(features, expected),
+                wall_time=best,
+                sim_ms_per_s=BEHAVIOURS[name]["t_stop"] / best if best > 0 else np.inf,
+                **features
+            ))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                        help="backend to run (repeatable), default all")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--update-reference", action="store_true",
+                        help="overwrite the stored reference with the numba results")
+    args = parser.parse_args(argv)
+
+    if args.update_reference:
+        reference = OrderedDict(
+            (name, spike_features(*simulate(name))) for name in BEHAVIOURS)
+        with open(REFERENCE_PATH, "w") as f:
+            json.dump(reference, f, indent=2)
+            f.write("\n")
+
+    results = run_gallery(backends=args.backend or tuple(BACKENDS), repeat=args.repeat)
+    for r in results:
+        print("{backend:>7} {title:<36} spikes={n_spikes:<3} bursts={n_bursts:<3} "
+              "{status:<4} {wall_time:.2e} s  {sim_ms_per_s:.3g} ms/s".format(
+                  status="ok" if r["ok"] else "FAIL", **r))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+Throughput benchmarks of the simulation backends.
+
+Every case (IZHI celltypes 1-7, ADEXP, MAT, and HH when NEURON is
+installed) is measured in a fresh interpreter, so kernels compiled by an
+earlier case do not hide the compile cost of a later one:
+
+  * compile_s: the first call minus a steady-state call;
+  * single: simulated ms per wall second of backend.inject_square_current,
+    the whole path a test goes through;
+  * batched: simulated ms (summed over models) per wall second of
+    batched.simulate_square on n_models rows (IZHI and ADEXP only);
+  * batched_soa: the same with the structure of arrays kernels;
+  * peak_rss_mb: the resident set high-water mark of the case;
+  * threads: batched throughput against the numba thread count;
+  * trace_length: single call throughput against the stimulus duration.
+
+Results are written as JSON. compare() lists the metrics of a run that
+got worse than an earlier run by more than a tolerance.
+
+Usage:
+    python -m jithub.benchmarks.throughput [--case IZHI-3] [--json out.json]
+                                           [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CASES = OrderedDict(
+    [("IZHI-%d" % celltype, dict(model="IZHI", celltype=celltype, amplitude=300.0))
+     for celltype in range(1, 8)]
+    + [
+        ("ADEXP", dict(model="ADEXP", amplitude=300.0)),
+        ("MAT", dict(model="MAT", amplitude=100.0)),
+        ("HH", dict(model="HH", amplitude=100.0)),
+    ]
+)
+
+DEFAULTS = dict(
+    delay=10.0,
+    duration=500.0,
+    dt=0.25,
+    n_models=256,
+    min_time=0.2,
+    lengths=(100.0, 1000.0, 10000.0),
+    threads=None,
+)
+
+# metric -> True when larger is better
+METRICS = OrderedDict([
+    ("single.sim_ms_per_s", True),
+    ("batched.sim_ms_per_s", True),
+    ("batched_soa.sim_ms_per_s", True),
+    ("compile_s", False),
+    ("peak_rss_mb", False),
+])
+
+
+def make_backend(case):
+    """A backend instance of case, set up for its square pulse."""
+    spec = CASES[case]
+    if spec["model"] == "IZHI":
+        from jithub.models.backends.izhikevich import JIT_IZHIBackend
+
+        backend = JIT_IZHIBackend()
+        backend.set_attrs({"celltype": spec["celltype"]})
+        return backend
+    if spec["model"] == "ADEXP":
+        from jithub.models.backends.adexp import JIT_ADEXPBackend
+
+        return JIT_ADEXPBackend()
+    if spec["model"] == "MAT":
+        from jithub.models.backends.mat_nu import JIT_MATBackend
+
+        return JIT_MATBackend()
+    from sciunit.models import RunnableModel
+    from sciunit.models.backends import register_backends
+    from jithub.models.backends.neuron_hh import NEURONHHBackend
+
+    register_backends({"NEURONHH": NEURONHHBackend})
+    return RunnableModel("HH", backend="NEURONHH")._backend
+
+
+def single_call(case, backend, duration, dt, delay=DEFAULTS["delay"]):
+    """Callable running one square pulse simulation, and its simulated ms."""
+    import quantities as pq
+
+    spec = CASES[case]
+    amplitude = spec["amplitude"] * pq.pA
+    if spec["model"] == "MAT":
+        # fixed 1 ms step
+        return lambda: backend.inject_square_current(amplitude, delay, duration), delay + duration
+    if spec["model"] == "HH":
+        current = {"amplitude": amplitude, "delay": delay * pq.ms, "duration": duration * pq.ms}
+        return lambda: backend.inject_square_current(current), delay + duration
+    return (
+        lambda: backend.inject_square_current(
+            amplitude=amplitude, delay=delay * pq.ms, duration=duration * pq.ms,
+            padding=0 * pq.ms, dt=dt),
+        delay + duration,
+    )
+
+
+def batched_call(case, n_models, duration, dt, delay=DEFAULTS["delay"], layout="aos"):
+    """
+    Callable running n_models copies of case through the batched square
+    pulse kernel (of layout "aos" or "soa") and the simulated ms it
+    covers, or None when the model has no batched kernel.
+    """
+    from jithub.models.backends.batched import simulate_square
+    from jithub.models.params import IzhiParameters, AdexpParameters
+
+    spec = CASES[case]
+    if spec["model"] == "IZHI":
+        row = IzhiParameters(celltype=spec["celltype"]).as_array()
+    elif spec["model"] == "ADEXP":
+        row = AdexpParameters().as_array()
+    else:
+        return None
+    params = np.repeat(row[np.newaxis], n_models, axis=0)
+    run = lambda: simulate_square(spec["model"], params, spec["amplitude"], delay, duration, 0.0, dt,
+                                  layout=layout)
+    return run, (delay + duration) * n_models
+
+
+def steady_state(run, min_time=DEFAULTS["min_time"], min_repeats=3):
+    """Median wall time of repeated calls of run (at least min_time in total)."""
+    times = []
+    began = time.perf_counter()
+    while len(times) < min_repeats or time.perf_counter() - began < min_time:
+        t1 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t1)
+    return float(np.median(times))
+
+
+def throughput(run, sim_ms, **kwargs):
+    wall = steady_state(run, **kwargs)
+    return {"wall_s": wall, "sim_ms_per_s": sim_ms / wall if wall > 0 else float("inf")}
+
+
+def peak_rss_mb():
+    """High-water mark of this process' resident set, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2.0 ** 20 if sys.platform == "darwin" else 2.0 ** 10)
+
+
+def thread_counts(limit=None):
+    """1, 2, 4, ... up to the numba thread pool size."""
+    import numba
+
+    limit = limit or numba.config.NUMBA_NUM_THREADS
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def measure_case(case, delay=DEFAULTS["delay"], duration=DEFAULTS["duration"], dt=DEFAULTS["dt"],
+                 n_models=DEFAULTS["n_models"], min_time=DEFAULTS["min_time"],
+                 lengths=DEFAULTS["lengths"], threads=DEFAULTS["threads"]):
+    """Measure one case in this process, returns its result dict."""
+    import numba
+
+    result = OrderedDict(case=case, model=CASES[case]["model"], status="ok")
+    backend = make_backend(case)
+    run, sim_ms = single_call(case, backend, duration, dt, delay)
+    t1 = time.perf_counter()
+    run()
+    first = time.perf_counter() - t1
+    result["single"] = throughput(run, sim_ms, min_time=min_time)
+    result["compile_s"] = max(first - result["single"]["wall_s"], 0.0)
+
+    batched = batched_call(case, n_models, duration, dt, delay)
+    if batched is None:
+        result["batched"] = result["batched_soa"] = None
+        result["threads"] = []
+    else:
+        run, sim_ms = batched
+        t1 = time.perf_counter()
+        run()
+        first = time.perf_counter() - t1
+        result["batched"] = throughput(run, sim_ms, min_time=min_time)
+        result["batched_compile_s"] = max(first - result["batched"]["wall_s"], 0.0)
+        result["batched"]["n_models"] = n_models
+        result["threads"] = []
+        default_threads = numba.get_num_threads()
+        try:
+            for n in threads or thread_counts():
+                numba.set_num_threads(n)
+                result["threads"].append(dict(threads=n, **throughput(run, sim_ms, min_time=min_time)))
+        finally:
+            numba.set_num_threads(default_threads)
+        run, sim_ms = batched_call(case, n_models, duration, dt, delay, layout="soa")
+        run()
+        result["batched_soa"] = throughput(run, sim_ms, min_time=min_time)
+
+    result["trace_length"] = []
+    for length in lengths:
+        run, sim_ms = single_call(case, backend, length, dt, delay)
+        result["trace_length"].append(dict(duration=length, **throughput(run, sim_ms, min_time=min_time)))
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_case(case, timeout=None, **config):
+    """
+    Measure case in a fresh interpreter. A case that cannot run (e.g. HH
+    without NEURON) gives a result with status "error" and the reason.
+    """
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+    command = [sys.executable, "-m", "jithub.benchmarks.throughput", "--measure", case,
+               "--out", path, "--config", json.dumps(config)]
+    try:
+        proc = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=timeout)
+        if proc.returncode == 0:
+            with open(path) as f:
+                return json.load(f)
+        lines = proc.stderr.strip().splitlines()
+        error = lines[-1] if lines else "exit status %d" % proc.returncode
+    except subprocess.TimeoutExpired:
+        error = "timed out after %s s" % timeout
+    finally:
+        os.remove(path)
+    return OrderedDict(case=case, model=CASES[case]["model"], status="error", error=error)
+
+
+def environment():
+    import numba
+
+    try:
+        layer = numba.threading_layer()
+    except ValueError:  # no parallel kernel has run in this process
+        layer = None
+    return OrderedDict(
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        numba=numba.__version__,
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        numba_threads=numba.config.NUMBA_NUM_THREADS,
+        threading_layer=layer,
+    )
+
+
+def run_suite(cases=tuple(CASES), timeout=None, **config):
+    """Run every case, returns the JSON-able report."""
+    settings = dict(DEFAULTS)
+    settings.update(config)
+    settings["lengths"] = list(settings["lengths"])
+    return OrderedDict(
+        environment=environment(),
+        config=settings,
+        results=[run_case(case, timeout=timeout, **settings) for case in cases],
+    )
+
+
+def _metric(result, name):
+    value = result
+    for key in name.split("."):
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(baseline, current, tolerance=0.2):
+    """
+    Regressions of current against baseline (both run_suite reports):
+    one dict per (case, metric) that got worse by more than tolerance
+    (a fraction of the baseline value).
+    """
+    before = {r["case"]: r for r in baseline["results"] if r.get("status") == "ok"}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(result["case"])
+        if old is None or result.get("status") != "ok":
+            continue
+        for name, larger_is_better in METRICS.items():
+            a, b = _metric(old, name), _metric(result, name)
+            if a is None or b is None or a <= 0:
+                continue
+            change = (b - a) / a
+            if (-change if larger_is_better else change) > tolerance:
+                regressions.append(OrderedDict(case=result["case"], metric=name,
+                                               baseline=a, current=b, change=change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--case", action="append", choices=list(CASES),
+                        help="case to run (repeatable), default all")
+    parser.add_argument("--duration", type=float, default=DEFAULTS["duration"])
+    parser.add_argument("--dt", type=float, default=DEFAULTS["dt"])
+    parser.add_argument("--n-models", type=int, default=DEFAULTS["n_models"])
+    parser.add_argument("--min-time", type=float, default=DEFAULTS["min_time"],
+                        help="seconds of repeated calls per throughput measurement")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per case")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="report regressions against this earlier report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--config", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        # worker mode of run_case
+        try:
+            result = measure_case(args.measure, **json.loads(args.config))
+        except Exception as error:
+            message = str(error).strip().splitlines()
+            result = OrderedDict(case=args.measure, model=CASES[args.measure]["model"], status="error",
+                                 error="%s: %s" % (type(error).__name__, message[0] if message else ""))
+        with open(args.out, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    report = run_suite(cases=args.case or tuple(CASES), timeout=args.timeout,
+                       duration=args.duration, dt=args.dt, n_models=args.n_models,
+                       min_time=args.min_time)
+    for r in report["results"]:
+        if r["status"] != "ok":
+            print("{case:>8}  {error}".format(**r))
+            continue
+        batched = r["batched"]["sim_ms_per_s"] if r["batched"] else float("nan")
+        print("{:>8}  compile {:6.2f} s  single {:9.3g} ms/s  batched {:9.3g} ms/s  "
+              "peak {:7.1f} MB".format(r["case"], r["compile_s"], r["single"]["sim_ms_per_s"],
+                                       batched, r["peak_rss_mb"]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for r in regressions:
+            print("regression {case} {metric}: {baseline:.4g} -> {current:.4g} ({change:+.0%})".format(**r))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,27 @@
-from .backends import *
-from .model_classes import *
+"""
+Cell models and their simulation backends.
+
+The model classes are imported on first use, see jithub/__init__.py.
+"""
+import importlib
+
+_LAZY = {
+    "BPOModel": ".model_classes",
+    "IzhiModel": ".model_classes",
+    "ADEXPModel": ".adexp_model",
+    "MATModel": ".mat_model",
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,45 @@
+"""
+The adaptive exponential model as a BluePyOpt / NeuronUnit cell model,
+see jithub.models.model_classes.
+"""
+import collections
+
+from sciunit.models import RunnableModel
+from neuronunit.models.optimization_model_layer import OptimizationModel
+
+from .backends.adexp import JIT_ADEXPBackend
+from .backends.batched import ADEXP_PARAM_NAMES
+from .model_classes import BPOModel
+
+
+class ADEXPModel(JIT_ADEXPBackend,BPOModel,OptimizationModel,RunnableModel):
+    kernel = "ADEXP"
+    kernel_params = ADEXP_PARAM_NAMES
+
+    def __init__(self, name="not_None", params=None):
+        self.default_attrs = {}
+        self.default_attrs['cm']=0.281
+        self.default_attrs['v_spike']=-40.0
+        self.default_attrs['v_reset']=-70.6
+        self.default_attrs['v_rest']=-70.6
+        self.default_attrs['tau_m']=9.3667
+        self.default_attrs['a']=4.0
+        self.default_attrs['b']=0.0805
+        self.default_attrs['delta_T']=2.0
+        self.default_attrs['tau_w']=144.0
+        self.default_attrs['v_thresh']=-50.4
+        self.default_attrs['spike_delta']=30
+
+        if params is not None:
+            self.params = collections.OrderedDict(**params)
+        else:
+            self.params = self.default_attrs
+        self._attrs = self.params
+        BPOModel.__init__(self,name)
+        OptimizationModel.__init__(self,attrs=self.params,backend=self)
+        RunnableModel._backend = JIT_ADEXPBackend
+        self.morphology = None
+        RunnableModel.morphology = None
+        RunnableModel.mechanisms = None
+        self.ampl = 0
+        self._attrs = self.params
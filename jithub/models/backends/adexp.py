@@ -1,26 +1,38 @@
+import os
 from neo import AnalogSignal
 #import numpy as np
 import quantities as pq
 #import numpy
 import cython
-from elephant.spike_train_generation import threshold_detection
 from numba import jit
 from sciunit.models.backends import Backend
 from sciunit.models import RunnableModel
 from typing import Any, Dict, List, Optional, Tuple, Type, Union, Text
 from numba import float64, float32, guvectorize
 from numba import guvectorize, jit, float64, void
+from .noise import simulate_noisy_trials
+from ..cache import cached_prefix, cached_result
+from ..profiling import phase, profiled
+from ..scheduler import scheduler_for
+from ..params import AdexpParameters
+from ..precision import precision_dtype
+from .batched import adexp_square_segment, evaluate_adexp_square
 
 
 ##
-# if cuda is available make numpy == cupy.
+# numpy, or cupy when JITHUB_CUPY=1 and a CUDA device is present. The
+# device probe starts the CUDA driver, which takes seconds, so it is
+# only made on request.
 ##
-try:
-    from numba import cuda
-    device = cuda.get_current_device()
-    import cupy as np
-except:
-    import numpy as np
+import numpy as np
+
+if os.environ.get("JITHUB_CUPY") == "1":
+    try:
+        from numba import cuda
+        device = cuda.get_current_device()
+        import cupy as np
+    except Exception:
+        pass
 
 # code once originated with this repository:
 # https://github.com/ericjang/pyN, of which it now resembles very little.
@@ -158,6 +170,8 @@ def evaluate_vm_collection(arr, vm):
 
 class JIT_ADEXPBackend:
     name = "ADEXP"
+    # "float32" keeps the state and the returned trace in single precision
+    precision = "float64"
 
     def __init__(self, attrs={}):
         self.vM = None
@@ -176,10 +190,9 @@ class JIT_ADEXPBackend:
         self.default_attrs["spike_delta"] = 30
         self.default_attrs["dt"] = 0.25
 
-        if type(attrs) is not type(None):
-            self._attrs = attrs
-        if not len(self._attrs):  # is None:
-            self._attrs = self.default_attrs
+        self._attrs = AdexpParameters(self.default_attrs)
+        if attrs:
+            self._attrs = self._attrs.replace(attrs)
         self._vec_attrs = []
 
     def set_stop_time(self, stop_time=650 * pq.ms):
@@ -195,46 +208,48 @@ class JIT_ADEXPBackend:
         -- Synpopsis: simulate model
         -- outputs vm and spike count
         """
-        N = 1
-        w = 1
-        time_trace = np.arange(0, T, dt)
-        len_time_trace = len(time_trace)
-        spike_raster = np.zeros((1, len_time_trace))
-        v_rest = attrs["v_rest"]
-        v_reset = attrs["v_reset"]
-        tau_m = attrs["tau_m"]
-        delta_T = attrs["delta_T"]
-        spike_delta = attrs["spike_delta"]
-
-        a = attrs["a"]
-        b = attrs["b"]
-        v_thresh = attrs["v_thresh"]
-        cm = attrs["cm"]
-        tau_w = attrs["tau_w"]
-        amp = I_ext["pA"]
-        start = I_ext["start"]
-        stop = I_ext["stop"]
-
-        vm, n_spikes = evaluate_vm(
-            time_trace,
-            dt,
-            T,
-            w,
-            b,
-            a,
-            spike_delta,
-            spike_raster,
-            v_reset,
-            v_rest,
-            tau_m,
-            tau_w,
-            v_thresh,
-            delta_T,
-            cm,
-            amp,
-            start,
-            stop,
-        )
+        with phase(self, "stimulus"):
+            N = 1
+            w = 1
+            time_trace = np.arange(0, T, dt)
+            len_time_trace = len(time_trace)
+            spike_raster = np.zeros((1, len_time_trace))
+            v_rest = attrs["v_rest"]
+            v_reset = attrs["v_reset"]
+            tau_m = attrs["tau_m"]
+            delta_T = attrs["delta_T"]
+            spike_delta = attrs["spike_delta"]
+
+            a = attrs["a"]
+            b = attrs["b"]
+            v_thresh = attrs["v_thresh"]
+            cm = attrs["cm"]
+            tau_w = attrs["tau_w"]
+            amp = I_ext["pA"]
+            start = I_ext["start"]
+            stop = I_ext["stop"]
+
+        with phase(self, "kernel"):
+            vm, n_spikes = evaluate_vm(
+                time_trace,
+                dt,
+                T,
+                w,
+                b,
+                a,
+                spike_delta,
+                spike_raster,
+                v_reset,
+                v_rest,
+                tau_m,
+                tau_w,
+                v_thresh,
+                delta_T,
+                cm,
+                amp,
+                start,
+                stop,
+            )
         return [vm, n_spikes]
 
     def get_spike_count(self):
@@ -242,13 +257,19 @@ class JIT_ADEXPBackend:
 
     @property
     def attrs(self):
+        if not isinstance(self._attrs, AdexpParameters):
+            # set directly to a dict, e.g. by ADEXPModel
+            self._attrs = AdexpParameters(self.default_attrs).replace(self._attrs or {})
         return self._attrs
 
     @attrs.setter
     def attrs(self, attrs):
-        self.default_attrs.update(attrs)
-        attrs = self.default_attrs
-        self._attrs = attrs
+        """Merge attrs into the current parameters, building a new AdexpParameters."""
+        if isinstance(attrs, AdexpParameters):
+            self._attrs = attrs
+        else:
+            self._attrs = self.attrs.replace(attrs or {})
+        attrs = self._attrs
         if hasattr(self, "model"):
             if not hasattr(self.model, "attrs"):
                 self.model.attrs = {}
@@ -267,6 +288,7 @@ class JIT_ADEXPBackend:
         """
         self.tstop = float(stop_time.rescale(pq.ms))
 
+    @profiled
     def inject_square_current(
         self,
         amplitude=100 * pq.pA,
@@ -295,14 +317,122 @@ class JIT_ADEXPBackend:
             self.attrs["dt"]
         else:
             dt = 0.1
-        vm, n_spikes = self.simulate(attrs=self.attrs, T=tMax, dt=dt, I_ext=stim)
-        vM = AnalogSignal(vm, units=pq.mV, sampling_period=dt * pq.ms)
+        with phase(self, "cache"):
+            key = dict(stim, kind="square", T=tMax, dt=dt)
+            if self.precision != "float64":
+                key["precision"] = self.precision
+            cached, store = cached_result(self, key)
+        if cached is not None:
+            with phase(self, "wrap"):
+                self.vM = AnalogSignal(np.array(cached["vm"]), units=pq.mV, sampling_period=dt * pq.ms)
+            self.n_spikes = int(cached["n_spikes"])
+            return self.vM
+        n_steps = len(np.arange(0, tMax, dt))
+        # samples before the pulse
+        quiet = min(int(np.searchsorted(np.arange(n_steps) * dt, delay)), n_steps)
+        with phase(self, "cache"):
+            prefix, store_prefix = cached_prefix(
+                self, {"samples": quiet, "dt": dt, "precision": self.precision})
+        if store_prefix is not None and quiet > 0:
+            ##
+            # Resume from the state at the end of the delay, which is
+            # shared by every pulse with the same delay.
+            ##
+            with phase(self, "kernel"):
+                params = np.asarray(self.attrs.as_array(), dtype=precision_dtype(self.precision))
+                real = params.dtype.type
+                vm = np.empty(n_steps, params.dtype)
+                if prefix is None:
+                    state = adexp_square_segment(params, params[2], real(1.0), False, amplitude, delay,
+                                                 delay + duration, 0, quiet, dt, vm)
+                else:
+                    vm[:quiet] = prefix["vm"]
+                    v, w, spiked = prefix["state"]
+                    state = (v, w, bool(spiked), int(prefix["n_spikes"]))
+                # numba hands float32 results back as Python floats
+                n_spikes = state[3] + adexp_square_segment(
+                    params, real(state[0]), real(state[1]), state[2], amplitude, delay, delay + duration,
+                    quiet, n_steps, dt, vm)[3]
+            if prefix is None:
+                with phase(self, "cache"):
+                    store_prefix({"vm": vm[:quiet], "state": np.array(state[:3], params.dtype),
+                                  "n_spikes": state[3]})
+        elif self.precision == "float64":
+            vm, n_spikes = self.simulate(attrs=self.attrs, T=tMax, dt=dt, I_ext=stim)
+        else:
+            ##
+            # The population kernel follows the same update rule with the
+            # state held in the requested precision.
+            ##
+            with phase(self, "kernel"):
+                params = np.asarray(self.attrs.as_array(), dtype=precision_dtype(self.precision))
+                vms, counts = evaluate_adexp_square(
+                    params[np.newaxis], amplitude, delay, delay + duration,
+                    len(np.arange(0, tMax, dt)), dt
+                )
+            vm, n_spikes = vms[0], int(counts[0])
+        with phase(self, "cache"):
+            store({"vm": vm, "n_spikes": n_spikes})
+        with phase(self, "wrap"):
+            vM = AnalogSignal(vm, units=pq.mV, sampling_period=dt * pq.ms)
 
         self.vM = vM
         self.n_spikes = n_spikes
 
         return self.vM
 
+    @profiled
+    def inject_noisy_current(
+        self,
+        mean=100 * pq.pA,
+        std=10 * pq.pA,
+        tau=5 * pq.ms,
+        delay=10 * pq.ms,
+        duration=500 * pq.ms,
+        padding=0 * pq.ms,
+        dt=0.25,
+        seed=0,
+    ):
+        """Inputs: mean and std of an Ornstein-Uhlenbeck current with time constant tau
+        (tau = 0 gives white noise), switched on between delay and delay + duration.
+        The noise is drawn inside the compiled kernel from seed, so the same seed
+        always reproduces the same trace.
+        """
+        with phase(self, "kernel"):
+            vm, counts = simulate_noisy_trials(
+                "ADEXP",
+                self.attrs,
+                [seed],
+                mean=float(mean),
+                sigma=float(std),
+                tau=float(tau),
+                delay=float(delay),
+                duration=float(duration),
+                padding=float(padding),
+                dt=dt,
+            )
+        self.set_stop_time(stop_time=(float(delay) + float(duration) + float(padding)) * pq.ms)
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(vm[0, 0], units=pq.mV, sampling_period=dt * pq.ms)
+        self.n_spikes = int(counts[0, 0])
+        return self.vM
+
+    async def simulate_async(self, params=None, stimulus=None, **kwargs):
+        """
+        Square current injection for asyncio callers: concurrent requests
+        are coalesced into batched kernel calls, see jithub.models.scheduler.
+        params defaults to self.attrs, the stimulus is a dict (or keyword
+        arguments) of amplitude, delay, duration, padding, dt, simulated
+        in self.precision.
+        Returns the membrane potential without touching self.vM.
+        """
+        stimulus = dict(stimulus or {}, **kwargs)
+        vm, _ = await scheduler_for("ADEXP").simulate(
+            self.attrs if params is None else params, stimulus, self.precision
+        )
+        dt = float(stimulus.get("dt", 0.25))
+        return AnalogSignal(vm, units=pq.mV, sampling_period=dt * pq.ms)
+
     def _backend_run(self):
         results = {}
         results["vm"] = self.vM.magnitude
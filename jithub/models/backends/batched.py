@@ -0,0 +1,558 @@
+"""
+Flat parameter layouts and single-step update rules shared by the
+batched (population / multi-trial) kernels.
+
+The single cell kernels in izhikevich.py, izhikevich_elaborate_dynamics.py
+and adexp.py integrate a whole trace at once. The functions here advance
+one model by one time step, so that kernels which loop over many models
+(in parallel) can reuse exactly the same dynamics.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+from numba import jit, prange
+
+from ...analysis.spikes import batch_spike_times
+
+##
+# Column order of a parameter matrix, one row per model.
+##
+IZHI_PARAM_NAMES = ("C", "a", "b", "c", "d", "k", "vPeak", "vr", "vt", "celltype")
+ADEXP_PARAM_NAMES = (
+    "cm",
+    "v_reset",
+    "v_rest",
+    "tau_m",
+    "a",
+    "b",
+    "delta_T",
+    "tau_w",
+    "v_thresh",
+    "spike_delta",
+)
+
+
+def param_matrix(attrs_list, names, dtype=np.float64):
+    """
+    Stack a list of attribute dictionaries (or BluePyOpt parameter dicts)
+    into a 2D parameter matrix whose columns follow names. ParameterSets
+    in the same column order are copied as they are.
+    """
+    if isinstance(attrs_list, Mapping):
+        attrs_list = [attrs_list]
+    matrix = np.empty((len(attrs_list), len(names)), dtype=dtype)
+    for row, attrs in enumerate(attrs_list):
+        if tuple(getattr(attrs, "names", ())) == tuple(names):
+            matrix[row] = attrs.as_array()
+            continue
+        for col, name in enumerate(names):
+            value = attrs[name]
+            if hasattr(value, "value"):
+                value = value.value
+            matrix[row, col] = float(value)
+    return matrix
+
+
+def square_indices(delay, duration, padding, dt):
+    """
+    Sample indices of a square pulse, computed exactly as
+    JIT_IZHIBackend.inject_square_current lays out its current array.
+    Returns (n_steps, start_index, stop_index), the pulse covers
+    start_index <= i < stop_index.
+    """
+    tMax = float(delay) + float(duration) + float(padding)
+    N = int(tMax * 1 / dt)
+    delay_ind = int((float(delay) / tMax) * N)
+    duration_ind = int((float(duration) / tMax) * N)
+    return N, delay_ind, delay_ind + duration_ind - 1
+
+
+@jit(nopython=True)
+def izhi_step(celltype, v, u, I, dt, C, a, b, c, d, k, vPeak, vr, vt):
+    """
+    One forward Euler step of the Izhikevich (2007) model.
+    Returns (v_next, u_next, spiked, v_spike) where v_spike is the value
+    the *current* sample must be overwritten with when spiked is True,
+    mirroring the v[i] = vPeak convention of the single cell kernels.
+    """
+    v_next = v + dt * (k * (v - vr) * (v - vt) - u + I) / C
+    spiked = False
+    v_spike = v
+    if celltype <= 3:
+        u_next = u + dt * a * (b * (v - vr) - u)
+        if v_next >= vPeak:
+            spiked = True
+            v_spike = vPeak
+            v_next = c
+            u_next = u_next + d
+    elif celltype == 4:
+        u_next = u + dt * a * (b * (v - vr) - u)
+        if v_next > (vPeak - 0.1 * u_next):
+            spiked = True
+            v_spike = vPeak - 0.1 * u_next
+            v_next = c + 0.04 * u_next
+            if (u + d) < 670:
+                u_next = u_next + d
+            else:
+                u_next = 670.0
+    elif celltype == 5:
+        if v_next < d:
+            u_next = u + dt * a * (0 - u)
+        else:
+            u_next = u + dt * a * ((0.025 * (v - d) ** 3) - u)
+        if v_next >= vPeak:
+            spiked = True
+            v_spike = vPeak
+            v_next = c
+    elif celltype == 6:
+        if v_next > -65:
+            b_ = 0.0
+        else:
+            b_ = 15.0
+        u_next = u + dt * a * (b_ * (v - vr) - u)
+        if v_next > (vPeak + 0.1 * u_next):
+            spiked = True
+            v_spike = vPeak + 0.1 * u_next
+            v_next = c - 0.1 * u_next
+            u_next = u_next + d
+    else:
+        if v_next > -65:
+            b_ = 2.0
+        else:
+            b_ = 10.0
+        u_next = u + dt * a * (b_ * (v - vr) - u)
+        if v_next >= vPeak:
+            spiked = True
+            v_spike = vPeak
+            v_next = c
+            u_next = u_next + d
+    return v_next, u_next, spiked, v_spike
+
+
+@jit(nopython=True)
+def izhi_quiet_prefix(celltype, I, dt, C, a, b, c, d, k, vPeak, vr, vt):
+    """
+    Leading samples of a current array the Izhikevich kernels can skip:
+    those before the first input, provided the initial state v = vr,
+    u = 0 is a fixed point of a step without input (it is unless a
+    celltype 5 cell has vr >= d). v stays at vr over them.
+    """
+    real = I.dtype.type
+    n = 0
+    while n < I.shape[0] - 1 and I[n] == 0:
+        n += 1
+    if n > 0:
+        v = real(vr)
+        u = real(0.0)
+        v_next, u_next, spiked, _ = izhi_step(celltype, v, u, real(0.0), real(dt), C, a, b, c, d, k, vPeak, vr, vt)
+        if spiked or real(v_next) != v or real(u_next) != u:
+            return 0
+    return n
+
+
+@jit(nopython=True)
+def adexp_step(
+    v, w, spiked, I, dt, cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta
+):
+    """
+    One step of the adaptive exponential model, as integrated by
+    adexp.evaluate_vm. spiked is the spike flag of the previous step.
+    Returns (v_next, w_next, spiked_next).
+    """
+    if spiked:
+        v = v_reset
+        w += b
+    dv = (
+        ((v_rest - v) + delta_T * np.exp((v - v_thresh) / delta_T)) / tau_m
+        + (I - w) / cm
+    ) * dt
+    v += dv
+    w += dt * (a * (v - v_rest) - w) / tau_w * dt
+    if v > v_thresh:
+        return spike_delta, w, True
+    return v, w, False
+
+
+@jit(nopython=True, parallel=True, nogil=True)
+def evaluate_izhi_square(params, amplitude, start, stop, n_steps, dt):
+    """
+    Square pulse responses of an Izhikevich population, one row per model,
+    identical to JIT_IZHIBackend.inject_square_current.
+    Returns vm (n_models, n_steps) and spike counts (n_models,).
+    The state is kept in the dtype of params (float64 or float32).
+    """
+    real = params.dtype.type
+    vm = np.empty((params.shape[0], n_steps), params.dtype)
+    counts = np.zeros(params.shape[0], dtype=np.int64)
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    for m in prange(params.shape[0]):
+        C, a, b, c, d, k, vPeak, vr, vt = params[m, :9]
+        celltype = int(round(params[m, 9]))
+        v = vr
+        u = zero
+        ##
+        # Before the pulse there is no input: when a step leaves the
+        # initial state unchanged the cell is at rest, every sample up to
+        # the pulse is v and integration starts at the pulse.
+        ##
+        skip = 0
+        if start > 0:
+            v_next, u_next, spiked, _ = izhi_step(celltype, v, u, zero, step, C, a, b, c, d, k, vPeak, vr, vt)
+            if not spiked and real(v_next) == v and real(u_next) == u:
+                skip = min(start, n_steps - 1)
+                vm[m, :skip] = v
+        for i in range(skip, n_steps - 1):
+            vm[m, i] = v
+            I = amplitude_ if start <= i < stop else zero
+            v_next, u_next, spiked, v_spike = izhi_step(celltype, v, u, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+            v = real(v_next)
+            u = real(u_next)
+            if spiked:
+                counts[m] += 1
+                vm[m, i] = v_spike
+        if n_steps > 0:
+            vm[m, n_steps - 1] = v
+    return vm, counts
+
+
+@jit(nopython=True, parallel=True, nogil=True)
+def evaluate_adexp_square(params, amplitude, start, stop, n_steps, dt):
+    """
+    Square pulse responses of an adaptive exponential population, the
+    current is on while start <= t <= stop (ms) as in adexp.evaluate_vm.
+    Returns vm (n_models, n_steps) and spike counts (n_models,).
+    The state is kept in the dtype of params (float64 or float32), pulse
+    timing is always computed in float64.
+    """
+    real = params.dtype.type
+    vm = np.empty((params.shape[0], n_steps), params.dtype)
+    counts = np.zeros(params.shape[0], dtype=np.int64)
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    for m in prange(params.shape[0]):
+        cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta = params[m, :10]
+        v = v_rest
+        w = real(1.0)
+        spiked = False
+        for i in range(n_steps):
+            t = i * dt
+            I = amplitude_ if start <= t <= stop else zero
+            v_next, w_next, spiked = adexp_step(
+                v, w, spiked, I, step, cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta
+            )
+            v = real(v_next)
+            w = real(w_next)
+            if spiked:
+                counts[m] += 1
+            vm[m, i] = v
+    return vm, counts
+
+
+@jit(nopython=True)
+def izhi_square_segment(row, v, u, amplitude, start, stop, first, last, n_steps, dt, out):
+    """
+    Samples first ... last - 1 of the square pulse response of one
+    Izhikevich model (a parameter row), as evaluate_izhi_square records
+    them, starting from the state (v, u) at sample first. out is indexed
+    like the full trace. Returns the state at sample last and the number
+    of spikes on the way.
+    """
+    real = row.dtype.type
+    C, a, b, c, d, k, vPeak, vr, vt = row[:9]
+    celltype = int(round(row[9]))
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    n = 0
+    for i in range(first, last):
+        if i == n_steps - 1:
+            out[i] = v
+            break
+        out[i] = v
+        I = amplitude_ if start <= i < stop else zero
+        v_next, u_next, spiked, v_spike = izhi_step(celltype, v, u, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+        v = real(v_next)
+        u = real(u_next)
+        if spiked:
+            n += 1
+            out[i] = v_spike
+    return v, u, n
+
+
+@jit(nopython=True)
+def adexp_square_segment(row, v, w, spiked, amplitude, start, stop, first, last, dt, out):
+    """
+    Samples first ... last - 1 of the square pulse response of one
+    adaptive exponential model, as evaluate_adexp_square records them,
+    starting from the state (v, w, spiked) left by sample first - 1.
+    Returns the state after sample last - 1 and the number of spikes.
+    """
+    real = row.dtype.type
+    cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta = row[:10]
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    n = 0
+    for i in range(first, last):
+        t = i * dt
+        I = amplitude_ if start <= t <= stop else zero
+        v_next, w_next, spiked = adexp_step(
+            v, w, spiked, I, step, cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta
+        )
+        v = real(v_next)
+        w = real(w_next)
+        if spiked:
+            n += 1
+        out[i] = v
+    return v, w, spiked, n
+
+##
+# Structure of arrays kernels: the population state lives in contiguous
+# v / u / w arrays and every model of a block advances one time step
+# before the next step starts. Spikes and resets are selected with masks
+# instead of branches, so the loop over models has no control flow and
+# LLVM can vectorize it. The update rules are the same expressions as
+# izhi_step / adexp_step, so results match the per model kernels.
+##
+SOA_BLOCK = 256
+
+
+@jit(nopython=True, error_model="numpy")
+def izhi_step_masked(celltype, v, u, I, dt, C, a, b, c, d, k, vPeak, vr, vt):
+    """
+    izhi_step without branches on the spike condition: both outcomes are
+    computed and selected. Returns (v_next, u_next, spiked, v_sample)
+    where v_sample is the value recorded for the current sample.
+    """
+    v_next = v + dt * (k * (v - vr) * (v - vt) - u + I) / C
+    if celltype <= 3:
+        u_next = u + dt * a * (b * (v - vr) - u)
+        spiked = v_next >= vPeak
+        v_sample = vPeak if spiked else v
+        u_reset = u_next + d
+        v_reset = c
+    elif celltype == 4:
+        u_next = u + dt * a * (b * (v - vr) - u)
+        peak = vPeak - 0.1 * u_next
+        spiked = v_next > peak
+        v_sample = peak if spiked else v
+        v_reset = c + 0.04 * u_next
+        u_reset = u_next + d if (u + d) < 670 else 670.0
+    elif celltype == 5:
+        u_low = u + dt * a * (0 - u)
+        u_high = u + dt * a * ((0.025 * (v - d) ** 3) - u)
+        u_next = u_low if v_next < d else u_high
+        spiked = v_next >= vPeak
+        v_sample = vPeak if spiked else v
+        u_reset = u_next
+        v_reset = c
+    elif celltype == 6:
+        b_ = 0.0 if v_next > -65 else 15.0
+        u_next = u + dt * a * (b_ * (v - vr) - u)
+        peak = vPeak + 0.1 * u_next
+        spiked = v_next > peak
+        v_sample = peak if spiked else v
+        v_reset = c - 0.1 * u_next
+        u_reset = u_next + d
+    else:
+        b_ = 2.0 if v_next > -65 else 10.0
+        u_next = u + dt * a * (b_ * (v - vr) - u)
+        spiked = v_next >= vPeak
+        v_sample = vPeak if spiked else v
+        u_reset = u_next + d
+        v_reset = c
+    v_next = v_reset if spiked else v_next
+    u_next = u_reset if spiked else u_next
+    return v_next, u_next, spiked, v_sample
+
+
+@jit(nopython=True, error_model="numpy", inline="always")
+def izhi_block_step(celltype, v, u, n, out, I, dt, C, a, b, c, d, k, vPeak, vr, vt):
+    """
+    Advance a block of models (state v, u, spike counts n, parameter
+    columns C ... vt) by one step and record the samples into out. Inlined
+    with a constant celltype, so the loop body is free of branches.
+    """
+    real = v.dtype.type
+    for j in range(v.shape[0]):
+        v_next, u_next, spiked, v_sample = izhi_step_masked(
+            celltype, v[j], u[j], I, dt, C[j], a[j], b[j], c[j], d[j], k[j], vPeak[j], vr[j], vt[j]
+        )
+        out[j] = v_sample
+        v[j] = real(v_next)
+        u[j] = real(u_next)
+        n[j] += spiked
+
+
+@jit(nopython=True, parallel=True, nogil=True, error_model="numpy")
+def evaluate_izhi_square_soa(params, celltype, amplitude, start, stop, n_steps, dt):
+    """
+    Structure of arrays variant of evaluate_izhi_square for a population
+    of one celltype. Blocks of SOA_BLOCK models run in parallel, inside a
+    block the time loop is outside and the (vectorized) model loop inside.
+    Returns vm (n_steps, n_models), time major, and spike counts.
+    """
+    real = params.dtype.type
+    n_models = params.shape[0]
+    columns = np.ascontiguousarray(params.T)
+    vm = np.empty((n_steps, n_models), params.dtype)
+    counts = np.zeros(n_models, dtype=np.int64)
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    n_blocks = (n_models + SOA_BLOCK - 1) // SOA_BLOCK
+    for block in prange(n_blocks):
+        lo = block * SOA_BLOCK
+        hi = min(lo + SOA_BLOCK, n_models)
+        C, a, b, c, d = columns[0, lo:hi], columns[1, lo:hi], columns[2, lo:hi], columns[3, lo:hi], columns[4, lo:hi]
+        k, vPeak, vr, vt = columns[5, lo:hi], columns[6, lo:hi], columns[7, lo:hi], columns[8, lo:hi]
+        v = vr.copy()
+        u = np.zeros(hi - lo, params.dtype)
+        n = np.zeros(hi - lo, dtype=np.int64)
+        # skip the quiet samples before the pulse when the whole block is at rest
+        skip = min(start, n_steps - 1) if start > 0 else 0
+        for j in range(hi - lo):
+            v_next, u_next, spiked, _ = izhi_step(celltype, v[j], u[j], zero, step, C[j], a[j], b[j], c[j],
+                                                  d[j], k[j], vPeak[j], vr[j], vt[j])
+            if spiked or real(v_next) != v[j] or real(u_next) != u[j]:
+                skip = 0
+        for i in range(skip):
+            vm[i, lo:hi] = v
+        for i in range(skip, n_steps - 1):
+            I = amplitude_ if start <= i < stop else zero
+            out = vm[i, lo:hi]
+            if celltype <= 3:
+                izhi_block_step(1, v, u, n, out, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+            elif celltype == 4:
+                izhi_block_step(4, v, u, n, out, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+            elif celltype == 5:
+                izhi_block_step(5, v, u, n, out, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+            elif celltype == 6:
+                izhi_block_step(6, v, u, n, out, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+            else:
+                izhi_block_step(7, v, u, n, out, I, step, C, a, b, c, d, k, vPeak, vr, vt)
+        if n_steps > 0:
+            vm[n_steps - 1, lo:hi] = v
+        counts[lo:hi] = n
+    return vm, counts
+
+
+@jit(nopython=True, parallel=True, nogil=True, error_model="numpy")
+def evaluate_adexp_square_soa(params, amplitude, start, stop, n_steps, dt):
+    """
+    Structure of arrays variant of evaluate_adexp_square, see
+    evaluate_izhi_square_soa. Returns vm (n_steps, n_models), time major,
+    and spike counts.
+    """
+    real = params.dtype.type
+    n_models = params.shape[0]
+    columns = np.ascontiguousarray(params.T)
+    cm, v_reset, v_rest, tau_m, a = columns[0], columns[1], columns[2], columns[3], columns[4]
+    b, delta_T, tau_w, v_thresh, spike_delta = columns[5], columns[6], columns[7], columns[8], columns[9]
+    vm = np.empty((n_steps, n_models), params.dtype)
+    counts = np.zeros(n_models, dtype=np.int64)
+    amplitude_ = real(amplitude)
+    zero = real(0.0)
+    step = real(dt)
+    n_blocks = (n_models + SOA_BLOCK - 1) // SOA_BLOCK
+    for block in prange(n_blocks):
+        lo = block * SOA_BLOCK
+        hi = min(lo + SOA_BLOCK, n_models)
+        v = v_rest[lo:hi].copy()
+        w = np.ones(hi - lo, params.dtype)
+        spiked = np.zeros(hi - lo, dtype=np.bool_)
+        n = np.zeros(hi - lo, dtype=np.int64)
+        for i in range(n_steps):
+            t = i * dt
+            I = amplitude_ if start <= t <= stop else zero
+            out = vm[i, lo:hi]
+            for j in range(hi - lo):
+                m = lo + j
+                v_ = v_reset[m] if spiked[j] else v[j]
+                w_ = w[j] + b[m] if spiked[j] else w[j]
+                dv = (
+                    ((v_rest[m] - v_) + delta_T[m] * np.exp((v_ - v_thresh[m]) / delta_T[m])) / tau_m[m]
+                    + (I - w_) / cm[m]
+                ) * step
+                v_ += dv
+                w_ += step * (a[m] * (v_ - v_rest[m]) - w_) / tau_w[m] * step
+                spike = v_ > v_thresh[m]
+                v[j] = real(spike_delta[m] if spike else v_)
+                w[j] = real(w_)
+                spiked[j] = spike
+                n[j] += spike
+                out[j] = v[j]
+        counts[lo:hi] = n
+    return vm, counts
+
+
+def split_celltypes(params):
+    """Row indices of each Izhikevich celltype in a parameter matrix, {celltype: rows}."""
+    celltypes = np.rint(params[:, 9]).astype(np.int64)
+    return {int(ct): np.flatnonzero(celltypes == ct) for ct in np.unique(celltypes)}
+
+
+def simulate_square(model, params, amplitude, delay, duration, padding=0.0, dt=0.25,
+                    precision="float64", layout="aos", sink=None, threshold=0.0):
+    """
+    Square current injection into every row of a parameter matrix in one
+    parallel kernel. model: "IZHI" or "ADEXP", params: parameter matrix
+    (columns as IZHI_PARAM_NAMES / ADEXP_PARAM_NAMES) or attribute dicts.
+    precision: "float64" or "float32", the dtype of the state and of vm.
+    layout: "aos" integrates model by model, "soa" steps the whole
+    population together (see evaluate_izhi_square_soa), which pays off
+    for large populations; the traces are the same.
+    sink: optional TraceStore writer; every trace is appended to it with
+    its parameter row and the spike times found by upward crossings of
+    threshold.
+    Returns (vm, spike_counts) with shapes (n_models, n_steps), (n_models,).
+    With layout="soa" vm may be a transposed (Fortran ordered) view.
+    """
+    from ..precision import precision_dtype
+
+    if layout not in ("aos", "soa"):
+        raise ValueError("layout must be 'aos' or 'soa', got %r" % (layout,))
+    dtype = precision_dtype(precision)
+    amplitude, delay = float(amplitude), float(delay)
+    duration, padding = float(duration), float(padding)
+    if model == "IZHI":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, IZHI_PARAM_NAMES)
+        params = np.ascontiguousarray(params, dtype=dtype)
+        n_steps, start, stop = square_indices(delay, duration, padding, dt)
+        if layout == "aos":
+            vm, counts = evaluate_izhi_square(params, amplitude, start, stop, n_steps, dt)
+        else:
+            groups = split_celltypes(params)
+            if len(groups) == 1:
+                (celltype, _), = groups.items()
+                vm, counts = evaluate_izhi_square_soa(params, celltype, amplitude, start, stop, n_steps, dt)
+                vm = vm.T
+            else:
+                vm = np.empty((len(params), n_steps), dtype)
+                counts = np.empty(len(params), np.int64)
+                for celltype, rows in groups.items():
+                    vm_rows, counts[rows] = evaluate_izhi_square_soa(
+                        params[rows], celltype, amplitude, start, stop, n_steps, dt
+                    )
+                    vm[rows] = vm_rows.T
+    elif model == "ADEXP":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, ADEXP_PARAM_NAMES)
+        params = np.ascontiguousarray(params, dtype=dtype)
+        n_steps = len(np.arange(0, delay + duration + padding, dt))
+        if layout == "aos":
+            vm, counts = evaluate_adexp_square(params, amplitude, delay, delay + duration, n_steps, dt)
+        else:
+            vm, counts = evaluate_adexp_square_soa(params, amplitude, delay, delay + duration, n_steps, dt)
+            vm = vm.T
+    else:
+        raise ValueError("batched square pulses are only implemented for IZHI and ADEXP, not %s" % model)
+    if sink is not None:
+        traces = np.ascontiguousarray(vm)
+        times, offsets = batch_spike_times(traces, float(threshold), float(dt), 0.0, 0.0)
+        sink.append(traces, params, times, offsets)
+    return vm, counts
@@ -0,0 +1,443 @@
+"""
+Parameter gradients of square pulse responses by forward sensitivity
+equations.
+
+Together with the state (v, u or v, w) the kernels carry its derivatives
+with respect to every continuous parameter and advance them with the
+exact derivative of each Euler step (forward mode).
+
+The hard spike reset of the batched kernels makes the trace jump when a
+spike moves from one step to the next, so these kernels smooth the reset
+over one time step instead:
+
+  * the threshold crossing time is interpolated linearly inside the step,
+  * the model is reset at that time and integrated for the rest of the
+    step from the reset state,
+  * the spike peak is shared between the two samples around the crossing
+    in proportion to how close it is to each (a tent).
+
+The trace is then a continuous function of the parameters and a shift
+of the crossing time carries over into the state after the reset (the
+saltation of the continuous model), so sensitivities do not blow up at
+spikes. When a crossing falls at the end of a step the result is that of
+the hard reset; in general traces differ from the batched kernels by
+less than one step of integration around each spike.
+
+Gradients are taken with respect to IZHI_GRAD_NAMES / ADEXP_GRAD_NAMES,
+the parameter columns without celltype. Branches of the Izhikevich cell
+types (the u nullcline switches of types 5-7 and the u cap of type 4)
+are treated as piecewise: their derivative is taken inside the branch.
+"""
+from collections import namedtuple
+
+import numpy as np
+from numba import jit, prange
+
+from .batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES, param_matrix, square_indices
+
+IZHI_GRAD_NAMES = IZHI_PARAM_NAMES[:9]
+ADEXP_GRAD_NAMES = ADEXP_PARAM_NAMES
+
+SquareGradients = namedtuple("SquareGradients", ("vm", "loss", "grad", "sensitivities"))
+
+
+@jit(nopython=True)
+def izhi_euler_tangent(celltype, v, u, dv, du, h, dh, I, C, a, b, d, k, vr, vt, dv_out, du_out):
+    """
+    Euler step of length h of the Izhikevich model and of its tangents
+    dv, du (d state / d IZHI_GRAD_NAMES); dh is the tangent of h. The new
+    tangents are written to dv_out, du_out (which may be dv, du).
+    Returns the new (v, u).
+    """
+    F = (k * (v - vr) * (v - vt) - u + I) / C
+    v_next = v + h * F
+    Fv = k * ((v - vr) + (v - vt)) / C
+    Fu = -1.0 / C
+    bb = b
+    if celltype == 6:
+        bb = 0.0 if v_next > -65 else 15.0
+    elif celltype == 7:
+        bb = 2.0 if v_next > -65 else 10.0
+    G_b = 0.0
+    G_d = 0.0
+    G_vr = 0.0
+    if celltype == 5:
+        if v_next < d:
+            G = -a * u
+            Gv = 0.0
+            G_a = -u
+        else:
+            cube = 0.025 * (v - d) ** 3
+            G = a * (cube - u)
+            Gv = a * 0.075 * (v - d) ** 2
+            G_a = cube - u
+            G_d = -Gv
+    else:
+        G = a * (bb * (v - vr) - u)
+        Gv = a * bb
+        G_a = bb * (v - vr) - u
+        G_vr = -a * bb
+        if celltype <= 4:
+            G_b = a * (v - vr)
+    Gu = -a
+    u_next = u + h * G
+    for p in range(9):
+        dv_p = dv[p]
+        du_p = du[p]
+        dv_out[p] = dv_p + h * (Fv * dv_p + Fu * du_p) + dh[p] * F
+        du_out[p] = du_p + h * (Gv * dv_p + Gu * du_p) + dh[p] * G
+    dv_out[0] -= h * F / C
+    dv_out[5] += h * (v - vr) * (v - vt) / C
+    dv_out[7] -= h * k * (v - vt) / C
+    dv_out[8] -= h * k * (v - vr) / C
+    du_out[1] += h * G_a
+    du_out[2] += h * G_b
+    du_out[4] += h * G_d
+    du_out[7] += h * G_vr
+    return v_next, u_next
+
+
+@jit(nopython=True)
+def adexp_euler_tangent(v, w, dv, dw, h, dh, I, dt, cm, v_rest, tau_m, a, delta_T, tau_w, v_thresh,
+                        dv_out, dw_out):
+    """
+    Step of length h of the adaptive exponential model as in adexp_step
+    (w is advanced with the new v and an extra factor dt) and of its
+    tangents, see izhi_euler_tangent. Returns the new (v, w).
+    """
+    E = np.exp((v - v_thresh) / delta_T)
+    F = ((v_rest - v) + delta_T * E) / tau_m + (I - w) / cm
+    Fv = (E - 1.0) / tau_m
+    Fw = -1.0 / cm
+    v_next = v + h * F
+    for p in range(10):
+        dv_out[p] = dv[p] + h * (Fv * dv[p] + Fw * dw[p]) + dh[p] * F
+    dv_out[0] -= h * (I - w) / (cm * cm)
+    dv_out[2] += h / tau_m
+    dv_out[3] -= h * ((v_rest - v) + delta_T * E) / (tau_m * tau_m)
+    dv_out[6] += h * E * (1.0 - (v - v_thresh) / delta_T) / tau_m
+    dv_out[8] -= h * E / tau_m
+    G = (a * (v_next - v_rest) - w) / tau_w
+    w_next = w + h * dt * G
+    for p in range(10):
+        dw_out[p] = dw[p] + h * dt * (a * dv_out[p] - dw[p]) / tau_w + dh[p] * dt * G
+    dw_out[2] -= h * dt * a / tau_w
+    dw_out[4] += h * dt * (v_next - v_rest) / tau_w
+    dw_out[7] -= h * dt * G / tau_w
+    return v_next, w_next
+
+
+@jit(nopython=True)
+def crossing(g0, g1, dg0, dg1, dfrac):
+    """
+    Fraction of a step at which g, linear from g0 to g1 >= 0, crosses 0,
+    with its tangent written to dfrac. A step starting above 0 crosses at 0.
+    """
+    if g0 >= 0:
+        dfrac[:] = 0.0
+        return 0.0
+    span = g0 - g1
+    for p in range(dfrac.shape[0]):
+        dfrac[p] = (g0 * dg1[p] - g1 * dg0[p]) / (span * span)
+    return g0 / span
+
+
+@jit(nopython=True, parallel=True, nogil=True)
+def izhi_square_gradients(params, amplitude, start, stop, n_steps, dt, target, record):
+    """
+    Izhikevich population with the smoothed reset of the module docstring
+    under the square pulse of evaluate_izhi_square.
+    target: (1 or n_models, n_steps or 0) traces, the loss of each model is
+    the mean squared difference to its (or the only) target row.
+    Returns vm (n_models, n_steps), loss (n_models,), the loss gradient
+    (n_models, 9) and, when record is True, dvm/dparams (n_models,
+    n_steps, 9), else an empty array.
+    """
+    n_models = params.shape[0]
+    P = 9
+    vm = np.empty((n_models, n_steps))
+    loss = np.zeros(n_models)
+    grad = np.zeros((n_models, P))
+    sens = np.zeros((n_models, n_steps if record else 0, P))
+    has_target = target.shape[1] > 0
+    target_rows = np.arange(n_models) % target.shape[0]
+    for m in prange(n_models):
+        C, a, b, c, d, k, vPeak, vr, vt = params[m, :9]
+        celltype = int(round(params[m, 9]))
+        tr = target_rows[m]
+        # the peak and reset of types 4 and 6 depend on u
+        if celltype == 4:
+            pk, vk, dk = -0.1, 0.04, 1.0
+        elif celltype == 5:
+            pk, vk, dk = 0.0, 0.0, 0.0
+        elif celltype == 6:
+            pk, vk, dk = 0.1, -0.1, 1.0
+        else:
+            pk, vk, dk = 0.0, 0.0, 1.0
+        v = vr
+        u = 0.0
+        dv = np.zeros(P)
+        du = np.zeros(P)
+        dv[7] = 1.0
+        zero = np.zeros(P)
+        dvn = np.zeros(P)
+        dun = np.zeros(P)
+        dg0 = np.zeros(P)
+        dg1 = np.zeros(P)
+        dfrac = np.zeros(P)
+        dv_c = np.zeros(P)
+        du_c = np.zeros(P)
+        dv_r = np.zeros(P)
+        du_r = np.zeros(P)
+        dh = np.zeros(P)
+        dsample = np.zeros(P)
+        # tail of a spike in the previous step: weight, its tangent, the peak
+        tail = 0.0
+        dtail = np.zeros(P)
+        tail_peak = 0.0
+        dtail_peak = np.zeros(P)
+        for i in range(n_steps):
+            sample = v
+            for p in range(P):
+                dsample[p] = dv[p]
+            if tail > 0.0:
+                for p in range(P):
+                    dsample[p] += dtail[p] * (tail_peak - sample) + tail * (dtail_peak[p] - dsample[p])
+                sample += tail * (tail_peak - sample)
+            tail = 0.0
+            if i < n_steps - 1:
+                I = amplitude if start <= i < stop else 0.0
+                v_next, u_next = izhi_euler_tangent(
+                    celltype, v, u, dv, du, dt, zero, I, C, a, b, d, k, vr, vt, dvn, dun
+                )
+                g1 = v_next - (vPeak + pk * u_next)
+                if g1 >= 0:
+                    g0 = v - (vPeak + pk * u)
+                    for p in range(P):
+                        dg0[p] = dv[p] - pk * du[p] - (1.0 if p == 6 else 0.0)
+                        dg1[p] = dvn[p] - pk * dun[p] - (1.0 if p == 6 else 0.0)
+                    frac = crossing(g0, g1, dg0, dg1, dfrac)
+                    # state at the crossing
+                    v_c = v + frac * (v_next - v)
+                    u_c = u + frac * (u_next - u)
+                    for p in range(P):
+                        dv_c[p] = dv[p] + dfrac[p] * (v_next - v) + frac * (dvn[p] - dv[p])
+                        du_c[p] = du[p] + dfrac[p] * (u_next - u) + frac * (dun[p] - du[p])
+                    # head of the spike on this sample
+                    head = 1.0 - frac
+                    for p in range(P):
+                        dsample[p] += -dfrac[p] * (v_c - sample) + head * (dv_c[p] - dsample[p])
+                    sample += head * (v_c - sample)
+                    # reset at the crossing, then the rest of the step
+                    capped = celltype == 4 and (u + d) >= 670
+                    v_r = c + vk * u_c
+                    u_r = 670.0 if capped else u_c + dk * d
+                    for p in range(P):
+                        dv_r[p] = vk * du_c[p] + (1.0 if p == 3 else 0.0)
+                        du_r[p] = 0.0 if capped else du_c[p] + (dk if p == 4 else 0.0)
+                        dh[p] = -dfrac[p] * dt
+                    v, u = izhi_euler_tangent(
+                        celltype, v_r, u_r, dv_r, du_r, head * dt, dh, I, C, a, b, d, k, vr, vt, dv, du
+                    )
+                    tail = frac
+                    tail_peak = v_c
+                    for p in range(P):
+                        dtail[p] = dfrac[p]
+                        dtail_peak[p] = dv_c[p]
+                else:
+                    v, u = v_next, u_next
+                    for p in range(P):
+                        dv[p] = dvn[p]
+                        du[p] = dun[p]
+            vm[m, i] = sample
+            if record:
+                for p in range(P):
+                    sens[m, i, p] = dsample[p]
+            if has_target:
+                r = sample - target[tr, i]
+                loss[m] += r * r
+                for p in range(P):
+                    grad[m, p] += 2.0 * r * dsample[p]
+        if has_target and n_steps > 0:
+            loss[m] /= n_steps
+            for p in range(P):
+                grad[m, p] /= n_steps
+    return vm, loss, grad, sens
+
+
+@jit(nopython=True, parallel=True, nogil=True)
+def adexp_square_gradients(params, amplitude, start, stop, n_steps, dt, target, record):
+    """
+    Adaptive exponential population with the smoothed reset of the module
+    docstring under the square pulse of evaluate_adexp_square, see
+    izhi_square_gradients. Gradients are taken with respect to all 10
+    parameter columns. Samples are taken at the end of each step, so the
+    tail of a spike falls on the sample before the crossing.
+    """
+    n_models = params.shape[0]
+    P = 10
+    vm = np.empty((n_models, n_steps))
+    loss = np.zeros(n_models)
+    grad = np.zeros((n_models, P))
+    sens = np.zeros((n_models, n_steps if record else 0, P))
+    has_target = target.shape[1] > 0
+    target_rows = np.arange(n_models) % target.shape[0]
+    for m in prange(n_models):
+        cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta = params[m, :10]
+        tr = target_rows[m]
+        v = v_rest
+        w = 1.0
+        dv = np.zeros(P)
+        dw = np.zeros(P)
+        dv[2] = 1.0
+        zero = np.zeros(P)
+        dvn = np.zeros(P)
+        dwn = np.zeros(P)
+        dg0 = np.zeros(P)
+        dg1 = np.zeros(P)
+        dfrac = np.zeros(P)
+        dv_r = np.zeros(P)
+        dw_r = np.zeros(P)
+        dh = np.zeros(P)
+        # the previous sample is written once this step is known
+        pending = 0.0
+        dpending = np.zeros(P)
+        for i in range(n_steps + 1):
+            if i < n_steps:
+                t = i * dt
+                I = amplitude if start <= t <= stop else 0.0
+                v_next, w_next = adexp_euler_tangent(
+                    v, w, dv, dw, dt, zero, I, dt, cm, v_rest, tau_m, a, delta_T, tau_w, v_thresh, dvn, dwn
+                )
+                g1 = v_next - v_thresh
+                frac = 1.0
+                if g1 > 0:
+                    g0 = v - v_thresh
+                    for p in range(P):
+                        dg0[p] = dv[p] - (1.0 if p == 8 else 0.0)
+                        dg1[p] = dvn[p] - (1.0 if p == 8 else 0.0)
+                    frac = crossing(g0, g1, dg0, dg1, dfrac)
+                    # tail of the spike on the previous sample
+                    if i > 0:
+                        for p in range(P):
+                            dpending[p] += -dfrac[p] * (spike_delta - pending) + (1.0 - frac) * (
+                                (1.0 if p == 9 else 0.0) - dpending[p])
+                        pending += (1.0 - frac) * (spike_delta - pending)
+                    # reset at the crossing, then the rest of the step
+                    w_c = w + frac * (w_next - w)
+                    for p in range(P):
+                        dv_r[p] = 1.0 if p == 1 else 0.0
+                        dw_r[p] = dw[p] + dfrac[p] * (w_next - w) + frac * (dwn[p] - dw[p]) + (
+                            1.0 if p == 5 else 0.0)
+                        dh[p] = -dfrac[p] * dt
+                    v, w = adexp_euler_tangent(
+                        v_reset, w_c + b, dv_r, dw_r, (1.0 - frac) * dt, dh, I, dt,
+                        cm, v_rest, tau_m, a, delta_T, tau_w, v_thresh, dv, dw
+                    )
+                else:
+                    v, w = v_next, w_next
+                    for p in range(P):
+                        dv[p] = dvn[p]
+                        dw[p] = dwn[p]
+            if i > 0:
+                j = i - 1
+                vm[m, j] = pending
+                if record:
+                    for p in range(P):
+                        sens[m, j, p] = dpending[p]
+                if has_target:
+                    r = pending - target[tr, j]
+                    loss[m] += r * r
+                    for p in range(P):
+                        grad[m, p] += 2.0 * r * dpending[p]
+            if i < n_steps:
+                pending = v
+                for p in range(P):
+                    dpending[p] = dv[p]
+                if g1 > 0:
+                    # head of the spike on this sample
+                    for p in range(P):
+                        dpending[p] += dfrac[p] * (spike_delta - v) + frac * ((1.0 if p == 9 else 0.0) - dv[p])
+                    pending += frac * (spike_delta - v)
+        if has_target and n_steps > 0:
+            loss[m] /= n_steps
+            for p in range(P):
+                grad[m, p] /= n_steps
+    return vm, loss, grad, sens
+
+
+def simulate_square_gradients(model, params, amplitude, delay, duration, padding=0.0, dt=0.25,
+                              target=None, record=False):
+    """
+    Square current injection into every row of a parameter matrix (or
+    attribute dicts) with parameter gradients, see the module docstring.
+    target: optional trace (n_steps,) or traces (n_models, n_steps) on the
+    simulation grid; loss is the mean squared difference to it.
+    Returns SquareGradients(vm, loss, grad, sensitivities) where grad is
+    (n_models, len(IZHI_GRAD_NAMES / ADEXP_GRAD_NAMES)) and sensitivities
+    is dvm/dparams (n_models, n_steps, n_params) when record is True.
+    Without a target loss and grad are zero.
+    """
+    amplitude, delay = float(amplitude), float(delay)
+    duration, padding = float(duration), float(padding)
+    if model == "IZHI":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, IZHI_PARAM_NAMES)
+        n_steps, start, stop = square_indices(delay, duration, padding, dt)
+        kernel, args = izhi_square_gradients, (start, stop)
+    elif model == "ADEXP":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, ADEXP_PARAM_NAMES)
+        n_steps = len(np.arange(0, delay + duration + padding, dt))
+        kernel, args = adexp_square_gradients, (delay, delay + duration)
+    else:
+        raise ValueError("gradients are only implemented for IZHI and ADEXP, not %s" % model)
+    params = np.ascontiguousarray(params, dtype=np.float64)
+    if target is None:
+        target = np.zeros((1, 0))
+    else:
+        target = np.atleast_2d(np.asarray(target, dtype=np.float64))
+        if target.shape[1] != n_steps or target.shape[0] not in (1, len(params)):
+            raise ValueError("target of shape %s does not match %d models x %d samples"
+                             % (target.shape, len(params), n_steps))
+    vm, loss, grad, sens = kernel(params, amplitude, args[0], args[1], n_steps, dt, target, bool(record))
+    return SquareGradients(vm, loss, grad, sens if record else None)
+
+
+def refine_square(model, params, target, names, bounds=None, amplitude=100.0, delay=10.0,
+                  duration=500.0, padding=0.0, dt=0.25, maxiter=100):
+    """
+    Local refinement of one parameter set (e.g. the best of a short GA
+    run) against a target trace by L-BFGS-B on the mean squared error of
+    the smoothed reset model. names: the parameters to vary, bounds:
+    optional (low, high) per name. The trace error has a local minimum
+    for every whole step a spike moves, so start close to the target.
+    Returns (refined parameter row, scipy OptimizeResult); the row follows
+    IZHI_PARAM_NAMES / ADEXP_PARAM_NAMES.
+    """
+    from scipy.optimize import minimize
+
+    all_names = IZHI_PARAM_NAMES if model == "IZHI" else ADEXP_PARAM_NAMES
+    grad_names = IZHI_GRAD_NAMES if model == "IZHI" else ADEXP_GRAD_NAMES
+    if isinstance(params, np.ndarray):
+        row = np.array(params, dtype=np.float64).ravel()
+    else:
+        row = param_matrix(params, all_names)[0]
+    missing = [name for name in names if name not in grad_names]
+    if missing:
+        raise ValueError("no gradient with respect to %s" % ", ".join(missing))
+    columns = np.array([all_names.index(name) for name in names], dtype=np.intp)
+    grad_columns = np.array([grad_names.index(name) for name in names], dtype=np.intp)
+    stimulus = (amplitude, delay, duration, padding, dt)
+
+    def objective(x):
+        trial = row.copy()
+        trial[columns] = x
+        result = simulate_square_gradients(model, trial[np.newaxis], *stimulus, target=target)
+        return result.loss[0], result.grad[0, grad_columns]
+
+    result = minimize(objective, row[columns], jac=True, method="L-BFGS-B", bounds=bounds,
+                      options={"maxiter": maxiter})
+    refined = row.copy()
+    refined[columns] = result.x
+    return refined, result
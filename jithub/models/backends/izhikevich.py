@@ -3,12 +3,19 @@ import numpy as np
 import quantities as pq
 import numpy
 import copy
-from elephant.spike_train_generation import threshold_detection
+from ...analysis.spikes import spike_count
 from sciunit.models.backends import Backend
 from numba import jit
 import cython
 from sciunit.models import RunnableModel
 from .izhikevich_elaborate_dynamics import *
+from .noise import simulate_noisy_trials
+from ..cache import cached_prefix, cached_result
+from ..profiling import phase, profiled
+from ..scheduler import scheduler_for
+from ..params import IzhiParameters
+from ..precision import precision_dtype
+from .batched import evaluate_izhi_square, izhi_quiet_prefix, izhi_square_segment, square_indices
 
 
 @jit(nopython=True)
@@ -26,10 +33,10 @@ def get_vm_one_two_three(
     dt = 0.25
 ):
     N = len(I)
-    v = vr * np.ones(N)
-    u = np.zeros(N)
+    v = np.full(N, vr, I.dtype)
+    u = np.zeros(N, I.dtype)
     v[0] = vr
-    for i in range(N - 1):
+    for i in range(izhi_quiet_prefix(3, I, dt, C, a, b, c, d, k, vPeak, vr, vt), N - 1):
         # forward Euler method
         v[i + 1] = v[i] + dt * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
         u[i + 1] = u[i] + dt * a * (b * (v[i] - vr) - u[i])
@@ -42,11 +49,18 @@ def get_vm_one_two_three(
     return v
 
 
+def celltype_kernel(celltype):
+    """The single cell kernel integrating an Izhikevich cell type."""
+    if celltype <= 3:
+        return get_vm_one_two_three
+    return (get_vm_four, get_vm_five, get_vm_six, get_vm_seven)[min(celltype, 7) - 4]
 
 
 class JIT_IZHIBackend(Backend, RunnableModel):
 
     name = "IZHI"
+    # "float32" keeps the state and the returned trace in single precision
+    precision = "float64"
 
     def __init__(self, attrs=None):
         self.vM = None
@@ -70,7 +84,9 @@ class JIT_IZHIBackend(Backend, RunnableModel):
         self.sim_param = {}
 
         if self._attrs is None:
-            self._attrs = self.default_attrs
+            self._attrs = IzhiParameters(self.default_attrs)
+        else:
+            self._attrs = IzhiParameters(self.default_attrs).replace(self._attrs)
         #print(type(self._attrs))
         #print(self._attrs)
         #import pdb;
@@ -82,39 +98,21 @@ class JIT_IZHIBackend(Backend, RunnableModel):
         stopTimeMs: duration in milliseconds
         """
         self.tstop = float(stop_time.rescale(pq.ms))
+    @profiled
     def get_membrane_potential(self):
         """Must return a neo.core.AnalogSignal."""
         if type(self.vM) is not type(None):
             return self.vM
 
         if type(self.vM) is type(None):
-
-            everything = copy.copy(self.attrs)
-            if hasattr(self, "Iext"):
-                everything.update({"Iext": self.Iext})
-
-            everything = copy.copy(self.attrs)
-
-            self.attrs["celltype"] = int(round(self.attrs["celltype"]))
-            assert type(self.attrs["celltype"]) is type(int())
-            if self.attrs["celltype"] <= 3:
-                everything.pop("celltype", None)
-                v = get_vm_one_two_three(**everything)
-            else:
-                if self.attrs["celltype"] == 4:
-                    v = get_vm_four(**everything)
-                if self.attrs["celltype"] == 5:
-                    v = get_vm_five(**everything)
-                if self.attrs["celltype"] == 6:
-                    v = get_vm_six(**everything)
-                if self.attrs["celltype"] == 7:
-
-                    v = get_vm_seven(**everything)
-
-            self.vM = AnalogSignal(v, units=pq.mV, sampling_period=self.attrs['dt'] * pq.ms)
+            with phase(self, "kernel"):
+                v = self.integrate(getattr(self, "I", np.zeros(0)))
+            with phase(self, "wrap"):
+                self.vM = AnalogSignal(v, units=pq.mV, sampling_period=self.attrs.get('dt', 0.25) * pq.ms)
 
         return self.vM
 
+    @profiled
     def inject_square_current(
         self,
         amplitude=100 * pq.pA,
@@ -130,59 +128,64 @@ class JIT_IZHIBackend(Backend, RunnableModel):
         Description: A parameterized means of applying current injection into defined
         Currently only single section neuronal models are supported, the neurite section is understood to be simply the soma.
         """
-        self.set_attrs({'dt':dt})
-        #import pdb;
-        #pdb.set_trace()
-
-        attrs = self._attrs
-        if attrs is None:
-            attrs = self.model.default_attrs
-        amplitude = float(amplitude)
-        duration = float(duration)
-        delay = float(delay)
-        padding = float(padding)
-        tMax = delay + duration + padding
-        tMax = self.tstop = float(tMax)
-        N = int(tMax*1/ dt)
-        I = np.zeros(N)
-        delay_ind = int((delay / tMax) * N)
-        duration_ind = int((duration / tMax) * N)
-        I[0 : delay_ind - 1] = 0.0
-        I[delay_ind : delay_ind + duration_ind - 1] = amplitude
-        I[delay_ind + duration_ind : :] = 0.0
-        self.I = I
-        self.attrs["I"] = I
-
-        self.attrs["celltype"] = round(self.attrs["celltype"])
-        celltype = copy.copy(self.attrs["celltype"])
-        if np.bool_(self.attrs["celltype"] <= 3):
-            self.attrs.pop("celltype", None)
-            v = get_vm_one_two_three(**self.attrs)
-            self.attrs["celltype"] = celltype
-
+        with phase(self, "attrs"):
+            if self.attrs.get('dt') != dt:
+                self.set_attrs({'dt':dt})
+
+        with phase(self, "stimulus"):
+            amplitude = float(amplitude)
+            duration = float(duration)
+            delay = float(delay)
+            padding = float(padding)
+            tMax = delay + duration + padding
+            tMax = self.tstop = float(tMax)
+            stimulus = {"kind": "square", "amplitude": amplitude, "delay": delay,
+                        "duration": duration, "padding": padding, "dt": dt}
+            if self.precision != "float64":
+                stimulus["precision"] = self.precision
+            N, start, stop = square_indices(delay, duration, padding, dt)
+        with phase(self, "cache"):
+            cached, store = cached_result(self, stimulus)
+        if cached is not None:
+            with phase(self, "wrap"):
+                self.vM = AnalogSignal(np.array(cached["vm"]), units=pq.mV, sampling_period=dt * pq.ms)
+            return self.vM
+        ##
+        # The pulse is generated inside the kernel, which takes the
+        # parameters as one flat row, no current array or attrs copies.
+        ##
+        params = np.asarray(self.attrs.as_array(), dtype=precision_dtype(self.precision))
+        with phase(self, "cache"):
+            prefix, store_prefix = cached_prefix(
+                self, {"samples": start, "dt": dt, "precision": self.precision})
+        if store_prefix is None or start == 0:
+            with phase(self, "kernel"):
+                vm, _ = evaluate_izhi_square(params[np.newaxis], amplitude, start, stop, N, dt)
+                v = vm[0]
         else:
-
-            if np.bool_(self.attrs["celltype"] == 4):
-                self.attrs.pop("celltype", None)
-                v = get_vm_four(**self.attrs)
-                self.attrs["celltype"] = celltype
-
-            if np.bool_(self.attrs["celltype"] == 5):
-                self.attrs.pop("celltype", None)
-                v = get_vm_five(**self.attrs)
-                self.attrs["celltype"] = celltype
-
-            if np.bool_(self.attrs["celltype"] == 6):
-                self.attrs.pop("celltype", None)
-                v = get_vm_six(**self.attrs)
-                self.attrs["celltype"] = celltype
-
-            if np.bool_(self.attrs["celltype"] == 7):
-                self.attrs.pop("celltype", None)
-                v = get_vm_seven(**self.attrs)
-                self.attrs["celltype"] = celltype
-        self.vM = AnalogSignal(v, units=pq.mV, sampling_period=self.attrs['dt'] * pq.ms)
-        self.attrs.pop("I", None)
+            ##
+            # Resume from the state at the end of the delay, which is
+            # shared by every pulse with the same delay.
+            ##
+            with phase(self, "kernel"):
+                v = np.empty(N, params.dtype)
+                real = params.dtype.type
+                if prefix is None:
+                    state = izhi_square_segment(params, params[7], real(0.0), amplitude,
+                                                start, stop, 0, start, N, dt, v)[:2]
+                else:
+                    v[:start] = prefix["vm"]
+                    state = prefix["state"]
+                # numba hands float32 results back as Python floats
+                izhi_square_segment(params, real(state[0]), real(state[1]), amplitude, start, stop,
+                                    start, N, N, dt, v)
+            if prefix is None:
+                with phase(self, "cache"):
+                    store_prefix({"vm": v[:start], "state": np.array(state, params.dtype)})
+        with phase(self, "cache"):
+            store({"vm": v})
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(v, units=pq.mV, sampling_period=dt * pq.ms)
         #if float(self.vM.times[-1]) != float(delay) + float(duration) + float(padding):
         #    extra_part = float(self.vM.times[-1]) - (
         #        float(delay) + float(duration) + float(padding)
@@ -191,16 +194,26 @@ class JIT_IZHIBackend(Backend, RunnableModel):
 
     @property
     def attrs(self):
+        if not isinstance(self._attrs, IzhiParameters):
+            # set directly to a dict, e.g. by IzhiModel
+            self._attrs = IzhiParameters(self.default_attrs).replace(self._attrs or {})
         return self._attrs
 
     @attrs.setter
     def attrs(self, attrs):
-        if attrs is not None:
-            self.default_attrs.update(attrs)
-            self._attrs = self.default_attrs
-
+        """
+        Merge attrs into the current parameters, building a new
+        IzhiParameters; attrs=None resets to default_attrs.
+        """
+        current = getattr(self, "_attrs", None)
+        if attrs is None:
+            self._attrs = IzhiParameters(self.default_attrs)
+        elif isinstance(attrs, IzhiParameters):
+            self._attrs = attrs
+        elif isinstance(current, IzhiParameters):
+            self._attrs = current.replace(attrs)
         else:
-            self._attrs = self.default_attrs
+            self._attrs = IzhiParameters(self.default_attrs).replace(current or {}).replace(attrs)
 
         if hasattr(self, "model"):
             if not hasattr(self.model, "attrs"):
@@ -213,12 +226,20 @@ class JIT_IZHIBackend(Backend, RunnableModel):
     def get_attrs(self):
         return self._attrs# = attrs
 
+    def integrate(self, I, dt=None):
+        """
+        Membrane potential of the current parameters for a current array I,
+        in the backend's precision.
+        """
+        dtype = precision_dtype(self.precision)
+        kwargs = self.attrs.kernel_kwargs(exclude=("celltype",))
+        kwargs["dt"] = self.attrs.get("dt", 0.25) if dt is None else dt
+        if dtype is not np.float64:
+            kwargs = {name: dtype(value) for name, value in kwargs.items()}
+        return celltype_kernel(self.attrs["celltype"])(I=np.asarray(I, dtype=dtype), **kwargs)
+
     def wrap_known_i(self, i, times):
-        everything = self.attrs
-        if "current_inj" in everything.keys():
-            everything.pop("current_inj", None)
-        if "celltype" in everything.keys():
-            everything.pop("celltype", None)
+        everything = self.attrs.kernel_kwargs(exclude=("celltype",))
         two_thousand_and_three = False
         if two_thousand_and_three:
             v = AnalogSignal(
@@ -232,14 +253,16 @@ class JIT_IZHIBackend(Backend, RunnableModel):
                 units=pq.mV,
                 sampling_period=(times[1] - times[0]) * pq.ms,
             )
-        thresh = threshold_detection(v, 0 * pq.mV)
+        self.spikes = spike_count(v)
         return v
 
+    @profiled
     def get_spike_count(self):
-        thresh = threshold_detection(self.vM, 0 * pq.mV)
-        self.spikes = len(thresh)
-        return len(thresh)
+        with phase(self, "spikes"):
+            self.spikes = spike_count(self.vM)
+        return self.spikes
 
+    @profiled
     @cython.boundscheck(False)
     @cython.wraparound(False)
     def inject_direct_current(self, I):
@@ -252,46 +275,66 @@ class JIT_IZHIBackend(Backend, RunnableModel):
 
         """
 
-        attrs = self.attrs
-        if attrs is None:
-            attrs = self.default_attrs
-
-        self.attrs = attrs
-        self.attrs["I"] = np.array(I)
-
-        self.attrs["celltype"] = int(round(self.attrs["celltype"]))
-        everything = copy.copy(self.attrs)
+        with phase(self, "kernel"):
+            v = self.integrate(I)
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(v, units=pq.mV, sampling_period=0.25 * pq.ms)
 
-        if "current_inj" in everything.keys():
-            everything.pop("current_inj", None)
-
-        if np.bool_(self.attrs["celltype"] <= 3):
-            everything.pop("celltype", None)
-            v = get_vm_one_two_three(**everything)
-        else:
-
-            if np.bool_(self.attrs["celltype"] == 4):
-                everything.pop("celltype", None)
-                v = get_vm_four(**everything)
-            if np.bool_(self.attrs["celltype"] == 5):
-                everything.pop("celltype", None)
-                v = get_vm_five(**everything)
-            if np.bool_(self.attrs["celltype"] == 6):
-                everything.pop("celltype", None)
-                if "I" in self.attrs.keys():
-                    everything.pop("I", None)
-                v = get_vm_six(self.attrs["I"], **everything)
-            if np.bool_(self.attrs["celltype"] == 7):
-                everything.pop("celltype", None)
-                v = get_vm_seven(**everything)
-
-        if "I" in self.attrs.keys():
-            self.attrs.pop("I", None)
-
-        self.vM = AnalogSignal(v, units=pq.mV, sampling_period=0.25 * pq.ms)
+        return self.vM
 
+    @profiled
+    def inject_noisy_current(
+        self,
+        mean=100 * pq.pA,
+        std=10 * pq.pA,
+        tau=5 * pq.ms,
+        delay=10 * pq.ms,
+        duration=500 * pq.ms,
+        padding=0 * pq.ms,
+        dt=0.25,
+        seed=0,
+    ):
+        """
+        Inputs: mean and std of an Ornstein-Uhlenbeck current with time constant tau
+        (tau = 0 gives white noise), switched on between delay and delay + duration.
+        The noise is drawn inside the compiled kernel from seed, so the same seed
+        always reproduces the same trace.
+        """
+        with phase(self, "kernel"):
+            vm, counts = simulate_noisy_trials(
+                "IZHI",
+                self.attrs,
+                [seed],
+                mean=float(mean),
+                sigma=float(std),
+                tau=float(tau),
+                delay=float(delay),
+                duration=float(duration),
+                padding=float(padding),
+                dt=dt,
+            )
+        self.set_stop_time(stop_time=(float(delay) + float(duration) + float(padding)) * pq.ms)
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(vm[0, 0], units=pq.mV, sampling_period=dt * pq.ms)
+        self.spikes = int(counts[0, 0])
         return self.vM
 
+    async def simulate_async(self, params=None, stimulus=None, **kwargs):
+        """
+        Square current injection for asyncio callers: concurrent requests
+        are coalesced into batched kernel calls, see jithub.models.scheduler.
+        params defaults to self.attrs, the stimulus is a dict (or keyword
+        arguments) of amplitude, delay, duration, padding, dt, simulated
+        in self.precision.
+        Returns the membrane potential without touching self.vM.
+        """
+        stimulus = dict(stimulus or {}, **kwargs)
+        vm, _ = await scheduler_for("IZHI").simulate(
+            self.attrs if params is None else params, stimulus, self.precision
+        )
+        dt = float(stimulus.get("dt", 0.25))
+        return AnalogSignal(vm, units=pq.mV, sampling_period=dt * pq.ms)
+
     def inject_ramp_current(
         self, t_stop, gradient=0.000015, onset=30.0, baseline=0.0, t_start=0.0
     ):
@@ -303,7 +346,6 @@ class JIT_IZHIBackend(Backend, RunnableModel):
         if "current_inj" in everything.keys():
             everything.pop("current_inj", None)
 
-        self.attrs["celltype"] = round(self.attrs["celltype"])
         if np.bool_(self.attrs["celltype"] <= 3):
             everything.pop("celltype", None)
             v = get_vm_one_two_three(**everything)
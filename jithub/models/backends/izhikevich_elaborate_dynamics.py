@@ -1,5 +1,9 @@
 from numba import jit
 import numpy as np
+
+from .batched import izhi_quiet_prefix
+
+
 @jit(nopython=True)
 def get_vm_four(
     C=89.7960714285714,
@@ -17,10 +21,10 @@ def get_vm_four(
     tau = dt
     N = len(I)
 
-    v = vr * np.ones(N)
-    u = np.zeros(N)
+    v = np.full(N, vr, I.dtype)
+    u = np.zeros(N, I.dtype)
     v[0] = vr
-    for i in range(N):
+    for i in range(izhi_quiet_prefix(4, I, dt, C, a, b, c, d, k, vPeak, vr, vt), N - 1):
         # forward Euler method
         v[i + 1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
         u[i + 1] = u[i] + tau * a * (b * (v[i] - vr) - u[i])
@@ -56,10 +60,10 @@ def get_vm_five(
 
     tau = dt
     # dt
-    v = vr * np.ones(N)
-    u = np.zeros(N)
+    v = np.full(N, vr, I.dtype)
+    u = np.zeros(N, I.dtype)
     v[0] = vr
-    for i in range(N):
+    for i in range(izhi_quiet_prefix(5, I, dt, C, a, b, c, d, k, vPeak, vr, vt), N - 1):
         # forward Euler method
         v[i + 1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
 
@@ -93,10 +97,10 @@ def get_vm_six(
     # dt
     N = len(I)
 
-    v = vr * np.ones(N)
-    u = np.zeros(N)
+    v = np.full(N, vr, I.dtype)
+    u = np.zeros(N, I.dtype)
     v[0] = vr
-    for i in range(N):
+    for i in range(izhi_quiet_prefix(6, I, dt, C, a, b, c, d, k, vPeak, vr, vt), N - 1):
         # forward Euler method
         v[i + 1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
 
@@ -132,10 +136,10 @@ def get_vm_seven(
     tau = dt
     # dt
     N = len(I)
-    v = vr * np.ones(N)
-    u = np.zeros(N)
+    v = np.full(N, vr, I.dtype)
+    u = np.zeros(N, I.dtype)
     v[0] = vr
-    for i in range(N):
+    for i in range(izhi_quiet_prefix(7, I, dt, C, a, b, c, d, k, vPeak, vr, vt), N - 1):
 
         # forward Euler method
         v[i + 1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
@@ -153,6 +157,19 @@ def get_vm_seven(
             # reset u, except for FS cells
 
     return v
+@jit(nopython=True)
+def izhi2003_step(V, u, I, dt, a, b, c, d):
+    """
+    One step of the Izhikevich (2003) simple model.
+    Returns (V, u, spiked), V is already reset when spiked is True.
+    """
+    V = V + dt * (0.04 * V ** 2 + 5 * V + 140 - u + I)
+    u = u + dt * a * (b * V - u)
+    if V > 30:
+        return c, u + d, True
+    return V, u, False
+
+
 @jit(nopython=True)
 def get_2003_vm(I, times, a=0.01, b=15, c=-60, d=10, vr=-70):
     u = b * vr
@@ -163,13 +180,38 @@ def get_2003_vm(I, times, a=0.01, b=15, c=-60, d=10, vr=-70):
     UU = np.zeros(N)
 
     for i in range(N):
-        V = V + tau * (0.04 * V ** 2 + 5 * V + 140 - u + I[i])
-        u = u + tau * a * (b * V - u)
+        V, u, spiked = izhi2003_step(V, u, I[i], tau, a, b, c, d)
+        if spiked:
+            vv[i] = 30
+        else:
+            vv[i] = V
+        UU[i] = u
+    return vv
+
+
+@jit(nopython=True)
+def get_2004_vm(I, dt, a, b, c, d, v_init, u_init, k2=0.04, k1=5.0, k0=140.0, accommodation=False):
+    """
+    Izhikevich (2004) form of the simple model, as used in the figure 1
+    "20 behaviours" script:
+        v' = k2*v**2 + k1*v + k0 - u + I
+        u' = a*(b*v - u)   (or a*b*(v + 65) when accommodation is True)
+    Spikes are clipped to 30 mV, as in get_2003_vm.
+    """
+    N = len(I)
+    vv = np.zeros(N)
+    V = v_init
+    u = u_init
+    for i in range(N):
+        V = V + dt * (k2 * V * V + k1 * V + k0 - u + I[i])
+        if accommodation:
+            u = u + dt * a * (b * (V + 65))
+        else:
+            u = u + dt * a * (b * V - u)
         if V > 30:
             vv[i] = 30
             V = c
             u = u + d
         else:
             vv[i] = V
-        UU[i] = u
     return vv
@@ -18,8 +18,9 @@ import numpy
 
 voltage_units = mV
 import copy
-from elephant.spike_train_generation import threshold_detection
-import matplotlib.pyplot as plt
+from ..cache import cached_result
+from ..profiling import phase, profiled
+from ..precision import precision_dtype
 
 import numba
 from numba import jit
@@ -44,9 +45,111 @@ def timer(func):
 dt = 1  # 0.125
 
 
+@jit(nopython=True)
+def mat_impulse_matrix(b, tm, t1, t2, tv, dt):
+    """
+    Closed form of the matrix exponential that advances the MAT state
+    (V, phi, theta1, theta2, thetaV, d thetaV) by dt ms.
+    """
+    Aexp = np.zeros((6, 6))
+    Aexp[0, 0] = exp(-dt / tm)
+    Aexp[0, 1] = tm - tm * exp(-dt / tm)
+    Aexp[1, 1] = 1.0
+    Aexp[2, 2] = exp(-dt / t1)
+    Aexp[3, 3] = exp(-dt / t2)
+    Aexp[4, 0] = (
+        b
+        * tv
+        * (
+            dt * tm * exp(dt / tm)
+            - dt * tv * exp(dt / tm)
+            + tm * tv * exp(dt / tm)
+            - tm * tv * exp(dt / tv)
+        )
+        * exp(-dt / tv - dt / tm)
+        / (pow(tm, 2) - 2 * tm * tv + pow(tv, 2))
+    )
+    Aexp[4, 1] = (
+        b
+        * tm
+        * tv
+        * (
+            -dt * (tm - tv) * exp(dt * (tm + tv) / (tm * tv))
+            + tm * tv * exp(2 * dt / tv)
+            - tm * tv * exp(dt * (tm + tv) / (tm * tv))
+        )
+        * exp(-dt * (2 * tm + tv) / (tm * tv))
+        / pow(tm - tv, 2)
+    )
+    Aexp[4, 4] = exp(-dt / tv)
+    Aexp[4, 5] = dt * exp(-dt / tv)
+    Aexp[5, 0] = b * tv * exp(-dt / tv) / (tm - tv) - b * tv * exp(-dt / tm) / (
+        tm - tv
+    )
+    Aexp[5, 1] = -b * tm * tv * exp(-dt / tv) / (tm - tv) + b * tm * tv * exp(
+        -dt / tm
+    ) / (tm - tv)
+    Aexp[5, 5] = exp(-dt / tv)
+    return Aexp
+
+
+@jit(nopython=True)
+def integrate_mat(Aexp, current, R, tm, a1, a2, w, tref, dt):
+    """
+    Exact integration of the MAT model (Rotter and Diesmann 1999) driven
+    by current, one sample per dt ms. The state is kept in the dtype of
+    current. Returns vm (the summed, rescaled state) and the spike times.
+    """
+    N = current.size
+    vm = np.zeros(N, current.dtype)
+    spikes = np.zeros(N)
+    n_spikes = 0
+    y = np.zeros(6, current.dtype)
+    y_next = np.zeros(6, current.dtype)
+    iref = 0
+    last_I = current.dtype.type(0.0)
+    ##
+    # The state starts at zero and stays there until the current first
+    # changes, which makes every sample before that the resting value.
+    ##
+    quiet = 0
+    while quiet < N and current[quiet] == 0:
+        quiet += 1
+    if quiet > 0 and not 0.0 > w:
+        rest = 0.0
+        for r in range(6):
+            rest += (y[r] - 1.8) / 0.28
+        vm[:quiet] = rest
+    else:
+        quiet = 0
+    for i in range(quiet, N):
+        for r in range(6):
+            acc = Aexp[r, 0] * y[0]
+            for col in range(1, 6):
+                acc += Aexp[r, col] * y[col]
+            y_next[r] = acc
+        y_next[1] += R / tm * (current[i] - last_I)
+        last_I = current[i]
+        total = 0.0
+        for r in range(6):
+            y[r] = y_next[r]
+            total += (y[r] - 1.8) / 0.28
+        vm[i] = total
+        h = y[2] + y[3] + y[4] + w
+        if i > iref and y[0] > h:
+            y[2] += a1
+            y[3] += a2
+            iref = i + int(tref * dt)
+            spikes[n_spikes] = i * dt
+            n_spikes += 1
+    return vm, spikes[:n_spikes]
+
+
 class JIT_MATBackend(Backend):
 
     name = "MAT"
+    # "float32" keeps the state and the returned trace in single precision
+    precision = "float64"
 
     def __init__(self, attrs=None):
 
@@ -83,57 +186,16 @@ class JIT_MATBackend(Backend):
     def set_attrs(self, attrs):
         self.attrs = attrs
 
+    @profiled
     def get_spike_count(self):
-
-        thresh = threshold_detection(self.vM, 0 * pq.mV)
+        # spikes are detected inside the integration loop against
+        # the adaptive threshold, so no second pass over vM is needed.
         return len(self.spikes)
 
-    @jit
     def impulse_matrix_direct(
         self, a1=10.0, a2=2.0, b=0, w=5, tm=10, t1=10, t2=200, tv=5, tref=2, R=10
     ):
-
-        Aexp = np.zeros((6, 6), dtype="d")
-        # a1, a2, b, w, _, tm, t1, t2, tv, tref = self.attrs['a1'],self.attrs['a2'],self.attrs['b'],self.attrs['w'], self.attrs['R'], self.attrs['tm'], self.attrs['t1'], self.attrs['t2'], self.attrs['tv'], self.attrs['tref']
-        Aexp[0, 0] = exp(-dt / tm)
-        Aexp[0, 1] = tm - tm * exp(-dt / tm)
-        Aexp[1, 1] = 1.0
-        Aexp[2, 2] = exp(-dt / t1)
-        Aexp[3, 3] = exp(-dt / t2)
-        Aexp[4, 0] = (
-            b
-            * tv
-            * (
-                dt * tm * exp(dt / tm)
-                - dt * tv * exp(dt / tm)
-                + tm * tv * exp(dt / tm)
-                - tm * tv * exp(dt / tv)
-            )
-            * exp(-dt / tv - dt / tm)
-            / (pow(tm, 2) - 2 * tm * tv + pow(tv, 2))
-        )
-        Aexp[4, 1] = (
-            b
-            * tm
-            * tv
-            * (
-                -dt * (tm - tv) * exp(dt * (tm + tv) / (tm * tv))
-                + tm * tv * exp(2 * dt / tv)
-                - tm * tv * exp(dt * (tm + tv) / (tm * tv))
-            )
-            * exp(-dt * (2 * tm + tv) / (tm * tv))
-            / pow(tm - tv, 2)
-        )
-        Aexp[4, 4] = exp(-dt / tv)
-        Aexp[4, 5] = dt * exp(-dt / tv)
-        Aexp[5, 0] = b * tv * exp(-dt / tv) / (tm - tv) - b * tv * exp(-dt / tm) / (
-            tm - tv
-        )
-        Aexp[5, 1] = -b * tm * tv * exp(-dt / tv) / (tm - tv) + b * tm * tv * exp(
-            -dt / tm
-        ) / (tm - tv)
-        Aexp[5, 5] = exp(-dt / tv)
-        return Aexp
+        return mat_impulse_matrix(float(b), float(tm), float(t1), float(t2), float(tv), float(dt))
 
     @jit
     def impulse_matrix(
@@ -221,6 +283,7 @@ class JIT_MATBackend(Backend):
 
     # @jit
     # @timer
+    @profiled
     def inject_square_current(
         self, amplitude=100 * pq.pA, delay=10 * pq.ms, duration=500 * pq.ms
     ):
@@ -241,75 +304,56 @@ class JIT_MATBackend(Backend):
         amplitude = float(amplitude)
         tMax = float(delay) + float(duration)  # + (1.8 * delay)
         tMax = self.tstop = float(tMax)
-        N = int(tMax)
-        current = np.zeros(N)
-        delay_ind = int((delay / tMax) * N)
-        duration_ind = int((duration / tMax) * N)
-        current[0 : delay_ind - 1] = 0.0
-        current[delay_ind : delay_ind + duration_ind - 1] = amplitude
-        current[delay_ind + duration_ind : :] = 0.0
-        D = 6
-        a1, a2, b, w, R, tm, t1, t2, tv, tref = (
-            self.attrs["a1"],
-            self.attrs["a2"],
-            self.attrs["b"],
-            self.attrs["w"],
-            self.attrs["R"],
-            self.attrs["tm"],
-            self.attrs["t1"],
-            self.attrs["t2"],
-            self.attrs["tv"],
-            self.attrs["tref"],
-        )
-        dt = 1.0
-        Aexp = self.impulse_matrix_direct(
-            a1=self.attrs["a1"],
-            a2=self.attrs["a2"],
-            b=self.attrs["b"],
-            w=self.attrs["w"],
-            tm=self.attrs["tm"],
-            t1=self.attrs["t1"],
-            t2=self.attrs["t2"],
-            tv=self.attrs["tv"],
-            tref=self.attrs["tref"],
-            R=self.attrs["R"],
-        )
-
-        # state: 5-element sequence (V, θ1, θ2, θV, ddθV)
-        # state: 5-element sequence (V, θ1, θ2, θV, ddθV)
-
-        v, phi, h1, h2, x, d = [0, 0, 0, 0, 0, 0]
-        y = np.asarray([v, phi, h1, h2, x, d], dtype="d")
-
-        N = current.size
-        Y = np.zeros((N, D))
-        spikes = []
-        iref = 0
-        last_I = 0
-        vm = np.zeros(N, dtype="d")
-        N = current.size
-        Y = np.zeros((N, D), dtype="d")
-        x = np.zeros(D, dtype="d")
-        last_I = 0
-        for i in range(N):
-            x[1] = R / tm * (current[i] - last_I)
-            last_I = current[i]
-            y = np.dot(Aexp, y) + x
-            # Y[i] = y
-            Y[i] = (y - 1.8) / 0.28
-            h = y[2] + y[3] + y[4] + w
-            if i > iref and y[0] > h:
-                y[2] += a1
-                y[3] += a2
+        with phase(self, "cache"):
+            cached, store = cached_result(
+                self,
+                dict(
+                    {"kind": "square", "amplitude": amplitude, "delay": float(delay), "duration": float(duration)},
+                    **({} if self.precision == "float64" else {"precision": self.precision})
+                ),
+            )
+        if cached is not None:
+            self.spikes = list(cached["spikes"])
+            with phase(self, "wrap"):
+                self.vM = AnalogSignal(np.array(cached["vm"]), units=pq.mV, sampling_period=1 * pq.ms)
+            return self.vM
+        with phase(self, "stimulus"):
+            dtype = precision_dtype(self.precision)
+            N = int(tMax)
+            current = np.zeros(N, dtype)
+            delay_ind = int((delay / tMax) * N)
+            duration_ind = int((duration / tMax) * N)
+            current[0 : delay_ind - 1] = 0.0
+            current[delay_ind : delay_ind + duration_ind - 1] = amplitude
+            current[delay_ind + duration_ind : :] = 0.0
+        with phase(self, "kernel"):
+            a1, a2, b, w, R, tm, t1, t2, tv, tref = (
+                self.attrs["a1"],
+                self.attrs["a2"],
+                self.attrs["b"],
+                self.attrs["w"],
+                self.attrs["R"],
+                self.attrs["tm"],
+                self.attrs["t1"],
+                self.attrs["t2"],
+                self.attrs["tv"],
+                self.attrs["tref"],
+            )
+            dt = 1.0
+            Aexp = mat_impulse_matrix(float(b), float(tm), float(t1), float(t2), float(tv), dt)
 
-                iref = i + int(tref * dt)
-                spikes.append(i * dt)
+            # state: 6-element sequence (V, phi, θ1, θ2, θV, ddθV), all zeros
+            vm, spikes = integrate_mat(
+                Aexp.astype(dtype), current, dtype(R), dtype(tm), dtype(a1), dtype(a2),
+                dtype(w), float(tref), dt,
+            )
 
-        self.spikes = spikes
+        self.spikes = list(spikes)
+        with phase(self, "cache"):
+            store({"vm": vm, "spikes": spikes})
 
-        self.vM = AnalogSignal(
-            [np.sum(y) for y in Y], units=pq.mV, sampling_period=1 * pq.ms
-        )
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(vm, units=pq.mV, sampling_period=1 * pq.ms)
         return self.vM
 
     def get_membrane_potential(self):
@@ -0,0 +1,177 @@
+"""
+Sparse recurrent networks of Izhikevich (2003) neurons.
+
+Each cell follows the same update as get_2003_vm (izhi2003_step).
+Synapses are stored in CSR form (indptr, indices, weights, delays) indexed
+by the presynaptic cell, delays are whole time steps. Spikes are propagated
+event by event into a ring buffer of future input, so the cost of a step is
+proportional to the number of cells plus the number of synapses of the
+cells that fired, not to the number of synapses.
+
+Only the spike raster is recorded, as two flat arrays (times, cell ids).
+"""
+import numpy as np
+from numba import jit, prange
+
+from .izhikevich_elaborate_dynamics import izhi2003_step
+from .noise import splitmix64, normal
+
+
+@jit(nopython=True, parallel=True)
+def step_cells(v, u, a, b, c, d, ring_row, rng, noise_std, I_ext, fired, dt):
+    """Parallel update of every cell for one time step."""
+    for i in prange(v.shape[0]):
+        I = ring_row[i] + I_ext[i]
+        ring_row[i] = 0.0
+        if noise_std[i] != 0.0:
+            rng[i], xi = normal(rng[i])
+            I += noise_std[i] * xi
+        v[i], u[i], fired[i] = izhi2003_step(v[i], u[i], I, dt, a[i], b[i], c[i], d[i])
+
+
+@jit(nopython=True)
+def evaluate_network(
+    v, u, a, b, c, d, indptr, indices, weights, delays, ring, ring_pos,
+    rng, noise_std, I_ext, n_steps, dt
+):
+    """
+    Advance the network n_steps, mutating v, u, ring and rng in place.
+    Returns (spike_steps, spike_ids, ring_pos), spike_steps count from
+    the start of this call.
+    """
+    n = v.shape[0]
+    depth = ring.shape[0]
+    fired = np.zeros(n, dtype=np.bool_)
+    capacity = max(16, n)
+    spike_steps = np.empty(capacity, dtype=np.int64)
+    spike_ids = np.empty(capacity, dtype=np.int32)
+    n_spikes = 0
+    for step in range(n_steps):
+        slot = ring_pos % depth
+        step_cells(v, u, a, b, c, d, ring[slot], rng, noise_std, I_ext, fired, dt)
+        for j in range(n):
+            if not fired[j]:
+                continue
+            if n_spikes == capacity:
+                capacity *= 2
+                grown_steps = np.empty(capacity, dtype=np.int64)
+                grown_ids = np.empty(capacity, dtype=np.int32)
+                grown_steps[:n_spikes] = spike_steps[:n_spikes]
+                grown_ids[:n_spikes] = spike_ids[:n_spikes]
+                spike_steps = grown_steps
+                spike_ids = grown_ids
+            spike_steps[n_spikes] = step
+            spike_ids[n_spikes] = j
+            n_spikes += 1
+            for syn in range(indptr[j], indptr[j + 1]):
+                ring[(slot + delays[syn]) % depth, indices[syn]] += weights[syn]
+        ring_pos += 1
+    return spike_steps[:n_spikes], spike_ids[:n_spikes], ring_pos
+
+
+class IzhikevichNetwork(object):
+    """
+    A population of Izhikevich (2003) cells with CSR stored synapses.
+    a, b, c, d: per cell parameters (length n).
+    indptr, indices, weights, delays: outgoing synapses of cell j are
+    indices[indptr[j]:indptr[j+1]], delays are in time steps (>= 1).
+    """
+
+    def __init__(self, a, b, c, d, indptr, indices, weights, delays, dt=0.5, v_init=-65.0):
+        self.a = np.ascontiguousarray(a, dtype=np.float64)
+        self.b = np.ascontiguousarray(b, dtype=np.float64)
+        self.c = np.ascontiguousarray(c, dtype=np.float64)
+        self.d = np.ascontiguousarray(d, dtype=np.float64)
+        self.n = len(self.a)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.delays = np.ascontiguousarray(delays, dtype=np.int32)
+        if len(self.indptr) != self.n + 1:
+            raise ValueError("indptr must have n + 1 entries")
+        if len(self.delays) and self.delays.min() < 1:
+            raise ValueError("synaptic delays must be at least one time step")
+        self.dt = float(dt)
+        self.v_init = float(v_init)
+        self.reset()
+
+    @classmethod
+    def random(cls, n_exc=800, n_inh=200, p_connect=0.1, max_delay=20.0, dt=0.5, seed=0):
+        """
+        The heterogeneous cortical network of Izhikevich (2003), with
+        sparse random connectivity instead of all-to-all coupling.
+        Excitatory delays are uniform on [dt, max_delay] ms, inhibitory
+        synapses use the shortest delay.
+        """
+        rs = np.random.RandomState(seed)
+        n = n_exc + n_inh
+        re = rs.rand(n_exc)
+        ri = rs.rand(n_inh)
+        a = np.concatenate([0.02 * np.ones(n_exc), 0.02 + 0.08 * ri])
+        b = np.concatenate([0.2 * np.ones(n_exc), 0.25 - 0.05 * ri])
+        c = np.concatenate([-65 + 15 * re ** 2, -65 * np.ones(n_inh)])
+        d = np.concatenate([8 - 6 * re ** 2, 2 * np.ones(n_inh)])
+
+        fan_out = rs.binomial(n, p_connect, size=n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(fan_out)
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        for j in range(n):
+            indices[indptr[j]:indptr[j + 1]] = np.sort(rs.choice(n, fan_out[j], replace=False))
+        weights = rs.rand(indptr[-1])
+        delays = np.ones(indptr[-1], dtype=np.int32)
+        max_steps = max(1, int(round(max_delay / dt)))
+        for j in range(n_exc):
+            lo, hi = indptr[j], indptr[j + 1]
+            weights[lo:hi] *= 0.5
+            delays[lo:hi] = rs.randint(1, max_steps + 1, size=hi - lo)
+        weights[indptr[n_exc]:] *= -1.0
+
+        network = cls(a, b, c, d, indptr, indices, weights, delays, dt=dt)
+        network.noise_std = np.concatenate([5.0 * np.ones(n_exc), 2.0 * np.ones(n_inh)])
+        # the per cell noise streams follow the same seed as the wiring
+        network.reset(seed)
+        return network
+
+    def reset(self, seed=0):
+        """Return every cell to rest and clear pending synaptic input."""
+        self.v = self.v_init * np.ones(self.n)
+        self.u = self.b * self.v
+        depth = int(self.delays.max()) + 1 if len(self.delays) else 1
+        self.ring = np.zeros((depth, self.n))
+        self.ring_pos = 0
+        self.t = 0.0
+        self.rng = np.empty(self.n, dtype=np.uint64)
+        for i in range(self.n):
+            self.rng[i] = splitmix64(np.uint64(seed) ^ np.uint64(i * 0x9E3779B9))[1]
+        if not hasattr(self, "noise_std"):
+            self.noise_std = np.zeros(self.n)
+        if not hasattr(self, "I_ext"):
+            self.I_ext = np.zeros(self.n)
+
+    def run(self, t_stop, I_ext=None, noise_std=None):
+        """
+        Simulate for t_stop ms, continuing from the current state.
+        I_ext: constant external current per cell (scalar or length n).
+        noise_std: per cell standard deviation of Gaussian input drawn
+        every step from a per cell random stream.
+        Returns (spike_times, spike_ids), times in ms.
+        """
+        if I_ext is not None:
+            self.I_ext = np.broadcast_to(np.asarray(I_ext, dtype=np.float64), (self.n,)).copy()
+        if noise_std is not None:
+            self.noise_std = np.broadcast_to(np.asarray(noise_std, dtype=np.float64), (self.n,)).copy()
+        n_steps = int(round(float(t_stop) / self.dt))
+        spike_steps, spike_ids, self.ring_pos = evaluate_network(
+            self.v, self.u, self.a, self.b, self.c, self.d,
+            self.indptr, self.indices, self.weights, self.delays,
+            self.ring, self.ring_pos, self.rng, self.noise_std, self.I_ext,
+            n_steps, self.dt,
+        )
+        spike_times = self.t + spike_steps * self.dt
+        self.t += n_steps * self.dt
+        return spike_times, spike_ids
+
+    def firing_rates(self, spike_ids, duration):
+        """Mean firing rate (Hz) of every cell over duration ms."""
+        return np.bincount(spike_ids, minlength=self.n) / (float(duration) / 1000.0)
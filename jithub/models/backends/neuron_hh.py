@@ -10,7 +10,6 @@ import numpy as np
 from .base import *
 import quantities as qt
 from quantities import mV, ms, s, V
-import matplotlib as mpl
 
 # try:
 #    import asciiplotlib as apl
@@ -22,7 +21,9 @@ voltage_units = mV
 
 from sciunit.utils import redirect_stdout
 
-from elephant.spike_train_generation import threshold_detection
+from ...analysis.spikes import spike_count
+from ..cache import cached_result
+from ..profiling import phase, profiled
 from neuronunit.optimisation.model_parameters import path_params
 import time
 
@@ -228,9 +229,10 @@ class NEURONHHBackend(Backend):
         """
         self.h.tstop = float(stop_time.rescale(pq.ms))
 
+    @profiled
     def get_spike_count(self):
-        thresh = threshold_detection(self.vM, threshold=0.0 * pq.mV, sign=above)
-        return len(thresh)
+        with phase(self, "spikes"):
+            return spike_count(self.vM)
 
     '''
     def set_time_step(self, integrationTimeStep=(pq.ms/128.0)):
@@ -434,6 +436,7 @@ class NEURONHHBackend(Backend):
         self.tVector.record(self.h._ref_t)
         return self
 
+    @profiled
     def inject_square_current(self, current, section=None, debug=False):
 
         """Apply current injection into the soma or a specific compartment.
@@ -466,11 +469,27 @@ class NEURONHHBackend(Backend):
         temp_attrs = self.model.attrs
         assert len(temp_attrs)
 
-        self.init_backend()
-        self.h.cvode.active(1)
-        # self.set_integration_method(method="variable")
-        if len(temp_attrs):
-            self.set_attrs(temp_attrs)
+        self.last_current = current
+        c = current.get("injected_square_current", current)
+        with phase(self, "cache"):
+            cached, store = cached_result(
+                self,
+                {"kind": "square", "amplitude": float(c["amplitude"]),
+                 "delay": float(c["delay"]), "duration": float(c["duration"])},
+                attrs=temp_attrs,
+            )
+        if cached is not None:
+            with phase(self, "wrap"):
+                self.vM = AnalogSignal(np.array(cached["vm"]), units=pq.mV,
+                                       sampling_period=float(cached["dt"]) * pq.ms)
+            return self.vM
+
+        with phase(self, "attrs"):
+            self.init_backend()
+            self.h.cvode.active(1)
+            # self.set_integration_method(method="variable")
+            if len(temp_attrs):
+                self.set_attrs(temp_attrs)
 
         current = current
         self.last_current = current
@@ -510,15 +529,16 @@ class NEURONHHBackend(Backend):
         self.h.dt = 1
         self.set_stop_time(stop_time)
 
-        with redirect_stdout(self.stdout):
+        with phase(self, "kernel"), redirect_stdout(self.stdout):
             self.h("run()")  # +str(tMax)+')')
         # af = time.perf_counter()
         # print('time:',af - b4)
-        tvec = [float(x) for x in self.tVector]
-        # print(tvec[1],self.h.dt)
-        # get_int(tvec)
-        vm = [float(x) for x in self.vVector]
-        vm_fast, vm_times = get_fixed_step_analog_signal(tvec[1], vm, tvec)
+        with phase(self, "resample"):
+            tvec = [float(x) for x in self.tVector]
+            # print(tvec[1],self.h.dt)
+            # get_int(tvec)
+            vm = [float(x) for x in self.vVector]
+            vm_fast, vm_times = get_fixed_step_analog_signal(tvec[1], vm, tvec)
         """
         self.vM = AnalogSignal(vm,
                                 units=pq.mV,
@@ -532,7 +552,10 @@ class NEURONHHBackend(Backend):
         fig.plot(t_fast, v_fast, width=100, height=20)
         fig.show()
         """
-        self.vM = AnalogSignal(vm_fast, units=pq.mV, sampling_period=tvec[1] * pq.ms)
+        with phase(self, "cache"):
+            store({"vm": vm_fast, "dt": tvec[1]})
+        with phase(self, "wrap"):
+            self.vM = AnalogSignal(vm_fast, units=pq.mV, sampling_period=tvec[1] * pq.ms)
 
         is_nan_in_vm = False
         for v in self.vM:
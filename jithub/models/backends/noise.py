@@ -0,0 +1,199 @@
+"""
+Noisy current stimuli generated inside the compiled kernels.
+
+Each trial carries its own integer seed. The random stream of a trial is a
+pure function of that seed (splitmix64 + Box-Muller), so results do not
+depend on how (model, trial) pairs are spread over numba threads, and no
+dense noise matrix is ever built in Python.
+
+Every model in a batch sees the same noise realisation for a given trial
+(common random numbers), which keeps comparisons between parameter sets
+fair.
+"""
+import numpy as np
+from numba import jit, prange
+
+from ...analysis.spikes import batch_spike_times
+from .batched import (
+    IZHI_PARAM_NAMES,
+    ADEXP_PARAM_NAMES,
+    param_matrix,
+    square_indices,
+    izhi_step,
+    adexp_step,
+)
+
+
+@jit(nopython=True)
+def splitmix64(state):
+    """Advance a splitmix64 state, returns (state, 64 random bits)."""
+    state = state + np.uint64(0x9E3779B97F4A7C15)
+    z = state
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return state, z
+
+
+@jit(nopython=True)
+def uniform(state):
+    """Uniform deviate on the open interval (0, 1)."""
+    state, z = splitmix64(state)
+    return state, (float(z >> np.uint64(11)) + 0.5) * (1.0 / 9007199254740992.0)
+
+
+@jit(nopython=True)
+def normal(state):
+    """Standard normal deviate (Box-Muller, one draw per call)."""
+    state, u1 = uniform(state)
+    state, u2 = uniform(state)
+    return state, np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+@jit(nopython=True)
+def ou_coefficients(sigma, tau, dt):
+    """
+    Exact discretisation of an Ornstein-Uhlenbeck process with stationary
+    standard deviation sigma and time constant tau. tau <= 0 gives white
+    noise with per-sample standard deviation sigma.
+    """
+    if tau <= 0:
+        return 0.0, sigma
+    decay = np.exp(-dt / tau)
+    return decay, sigma * np.sqrt(1.0 - decay * decay)
+
+
+@jit(nopython=True, parallel=True)
+def evaluate_izhi_trials(params, seeds, mean, sigma, tau, start, stop, n_steps, dt, record):
+    """
+    Integrate every (model, trial) pair of an Izhikevich population.
+    params: (n_models, len(IZHI_PARAM_NAMES)) parameter matrix.
+    seeds: (n_trials,) integer seeds.
+    The noisy current mean + OU(sigma, tau) is applied to samples
+    start <= i < stop and is zero elsewhere.
+    Returns vm (n_models, n_trials, n_steps or 0) and spike counts.
+    """
+    n_models = params.shape[0]
+    n_trials = seeds.shape[0]
+    vm = np.empty((n_models, n_trials, n_steps if record else 0))
+    counts = np.zeros((n_models, n_trials), dtype=np.int64)
+    decay, scale = ou_coefficients(sigma, tau, dt)
+    for job in prange(n_models * n_trials):
+        m = job // n_trials
+        trial = job % n_trials
+        C, a, b, c, d, k, vPeak, vr, vt = params[m, :9]
+        celltype = int(round(params[m, 9]))
+        state = np.uint64(seeds[trial])
+        v = vr
+        u = 0.0
+        x = 0.0
+        for i in range(n_steps - 1):
+            if record:
+                vm[m, trial, i] = v
+            I = 0.0
+            if start <= i < stop:
+                state, xi = normal(state)
+                x = decay * x + scale * xi
+                I = mean + x
+            v, u, spiked, v_spike = izhi_step(celltype, v, u, I, dt, C, a, b, c, d, k, vPeak, vr, vt)
+            if spiked:
+                counts[m, trial] += 1
+                if record:
+                    vm[m, trial, i] = v_spike
+        if record and n_steps > 0:
+            vm[m, trial, n_steps - 1] = v
+    return vm, counts
+
+
+@jit(nopython=True, parallel=True)
+def evaluate_adexp_trials(params, seeds, mean, sigma, tau, start, stop, n_steps, dt, record):
+    """
+    Integrate every (model, trial) pair of an adaptive exponential population.
+    params: (n_models, len(ADEXP_PARAM_NAMES)) parameter matrix.
+    The noisy current is applied while start <= t <= stop (times in ms),
+    following the convention of adexp.evaluate_vm.
+    Returns vm (n_models, n_trials, n_steps or 0) and spike counts.
+    """
+    n_models = params.shape[0]
+    n_trials = seeds.shape[0]
+    vm = np.empty((n_models, n_trials, n_steps if record else 0))
+    counts = np.zeros((n_models, n_trials), dtype=np.int64)
+    decay, scale = ou_coefficients(sigma, tau, dt)
+    for job in prange(n_models * n_trials):
+        m = job // n_trials
+        trial = job % n_trials
+        cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta = params[m, :10]
+        state = np.uint64(seeds[trial])
+        v = v_rest
+        w = 1.0
+        x = 0.0
+        spiked = False
+        for i in range(n_steps):
+            t = i * dt
+            I = 0.0
+            if start <= t <= stop:
+                state, xi = normal(state)
+                x = decay * x + scale * xi
+                I = mean + x
+            v, w, spiked = adexp_step(
+                v, w, spiked, I, dt, cm, v_reset, v_rest, tau_m, a, b, delta_T, tau_w, v_thresh, spike_delta
+            )
+            if spiked:
+                counts[m, trial] += 1
+            if record:
+                vm[m, trial, i] = v
+    return vm, counts
+
+
+def simulate_noisy_trials(
+    model,
+    params,
+    seeds,
+    mean=0.0,
+    sigma=0.0,
+    tau=0.0,
+    delay=0.0,
+    duration=500.0,
+    padding=0.0,
+    dt=0.25,
+    record=True,
+    sink=None,
+    threshold=0.0,
+):
+    """
+    Run n_models x n_trials noisy current injections in one parallel kernel.
+    model: "IZHI" or "ADEXP".
+    params: attribute dict, list of attribute dicts or parameter matrix.
+    seeds: one integer seed per trial.
+    mean, sigma and tau describe the current (pA, pA, ms) applied between
+    delay and delay + duration; sigma = 0 reduces to a square pulse.
+    Returns (vm, spike_counts) with shapes (n_models, n_trials, n_steps)
+    and (n_models, n_trials).
+    sink: optional TraceStore writer; every (model, trial) trace is
+    appended to it, model major, with its parameter row and the spike
+    times found by upward crossings of threshold.
+    """
+    seeds = np.atleast_1d(np.asarray(seeds, dtype=np.uint64))
+    mean, sigma, tau = float(mean), float(sigma), float(tau)
+    delay, duration, padding = float(delay), float(duration), float(padding)
+    if model == "IZHI":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, IZHI_PARAM_NAMES)
+        n_steps, start, stop = square_indices(delay, duration, padding, dt)
+        vm, counts = evaluate_izhi_trials(
+            params, seeds, mean, sigma, tau, start, stop, n_steps, dt, record or sink is not None
+        )
+    elif model == "ADEXP":
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, ADEXP_PARAM_NAMES)
+        n_steps = len(np.arange(0, delay + duration + padding, dt))
+        vm, counts = evaluate_adexp_trials(
+            params, seeds, mean, sigma, tau, delay, delay + duration, n_steps, dt, record or sink is not None
+        )
+    else:
+        raise ValueError("noisy trials are only implemented for IZHI and ADEXP, not %s" % model)
+    if sink is not None:
+        traces = vm.reshape(-1, n_steps)
+        times, offsets = batch_spike_times(traces, float(threshold), dt, 0.0, 0.0)
+        sink.append(traces, np.repeat(params, len(seeds), axis=0), times, offsets)
+    return vm, counts
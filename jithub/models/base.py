@@ -8,7 +8,7 @@ import numpy as np
 import quantities as pq
 import numpy
 import copy
-from elephant.spike_train_generation import threshold_detection
+from ..analysis.spikes import spike_count
 #from capabilities import ProducesMembranePotential, ReceivesCurrent
 
 from bluepyopt.parameters import Parameter
@@ -32,19 +32,11 @@ class BaseModel(RunnableModel, ProducesMembranePotential, ReceivesCurrent):
 
     def get_spike_count(self):
         self.vM = self._backend.get_membrane_potential()
-        thresh = threshold_detection(self.vM,0*qt.mV)
         ##
-        # Reasoning for condition:
-        # humans think spikes have down strokes in addition
-        # to the upstroke, but only upstrokes are
-        # detected by threshold_detection
+        # Only upstrokes are counted, a trace that ends
+        # mid-spike still counts that spike once.
         ##
-        if self.vM[-1]>0:
-            spikes = len(thresh) -1
-        else:
-            spikes = len(thresh)
-
-        return len(thresh)
+        return spike_count(self.vM)
 
 
     def set_stop_time(self, stop_time = 650*pq.ms):
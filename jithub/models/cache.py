@@ -0,0 +1,268 @@
+"""
+Content addressed cache of simulation results.
+
+A result is keyed on the backend name, the model parameters and a
+description of the stimulus. Parameters are canonicalised before hashing
+(sorted by name, BluePyOpt Parameters unwrapped, floats rounded to a fixed
+number of significant digits) so that values differing only by float noise
+share an entry.
+
+Two tiers:
+  * a bounded in-memory LRU, private to the process;
+  * an optional directory of .npz files, shared by every process that
+    points at it. Files are written to a temporary name and renamed into
+    place, so concurrent writers never expose partial entries.
+
+Caching is opt in. Either assign a ResultCache to a backend instance's
+result_cache attribute or install a process wide default with
+use_result_cache().
+
+A second, independent cache holds the model state at the end of the
+quiet part of a stimulus (e.g. the delay before a square pulse), keyed on
+the parameters and that prefix. Protocols sharing the prefix but not the
+rest (different amplitudes or durations) start from the stored state and
+only integrate what follows. It is enabled the same way, with a backend's
+prefix_cache attribute or use_prefix_cache().
+"""
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+SIGNIFICANT_DIGITS = 10
+
+default_cache = None
+default_prefix_cache = None
+
+
+def canonical(value, digits=SIGNIFICANT_DIGITS):
+    """Turn a parameter or stimulus value into a stable JSON-able form."""
+    if hasattr(value, "value") and not isinstance(value, np.ndarray):
+        value = value.value
+    if hasattr(value, "magnitude"):
+        value = value.magnitude
+    if isinstance(value, dict):
+        return [[str(k), canonical(v, digits)] for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))]
+    if isinstance(value, (list, tuple)):
+        return [canonical(v, digits) for v in value]
+    if isinstance(value, np.ndarray):
+        if value.ndim == 0:
+            return canonical(value.item(), digits)
+        rounded = np.asarray([float("%.*g" % (digits, v)) for v in value.ravel()])
+        return hashlib.sha1(rounded.tobytes()).hexdigest()
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        value = float("%.*g" % (digits, value))
+        # -0.0 and 0.0 describe the same model
+        return value + 0.0
+    if value is None:
+        return None
+    return str(value)
+
+
+def result_key(backend_name, attrs, stimulus, digits=SIGNIFICANT_DIGITS):
+    """Hex digest identifying one (backend, parameters, stimulus) triple."""
+    payload = json.dumps(
+        [str(backend_name), canonical(dict(attrs or {}), digits), canonical(stimulus, digits)],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(payload.encode("utf8")).hexdigest()
+
+
+class ResultCache(object):
+    """
+    LRU cache of simulation results (dicts of NumPy arrays and scalars).
+    max_bytes bounds the memory tier, directory enables the disk tier.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, directory=None):
+        self.max_bytes = int(max_bytes)
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._memory = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._memory)
+
+    def __contains__(self, key):
+        return key in self._memory or (
+            self.directory is not None and os.path.exists(self._path(key))
+        )
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    @staticmethod
+    def _size(result):
+        return sum(np.asarray(v).nbytes for v in result.values())
+
+    def _remember(self, key, result):
+        if key in self._memory:
+            self._nbytes -= self._size(self._memory.pop(key))
+        size = self._size(result)
+        if size > self.max_bytes:
+            return
+        self._memory[key] = result
+        self._nbytes += size
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._nbytes -= self._size(evicted)
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return result
+        if self.directory is not None:
+            try:
+                with np.load(self._path(key)) as stored:
+                    result = {name: stored[name] for name in stored.files}
+            except (IOError, OSError, ValueError):
+                result = None
+            if result is not None:
+                for value in result.values():
+                    value.flags.writeable = False
+                self._remember(key, result)
+                self.disk_hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Store a dict of arrays / scalars under key."""
+        result = {name: np.array(value) for name, value in result.items()}
+        for value in result.values():
+            value.flags.writeable = False
+        self._remember(key, result)
+        if self.directory is not None and not os.path.exists(self._path(key)):
+            fd, tmp = tempfile.mkstemp(suffix=".npz", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, **result)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+    def peek(self, key):
+        """The entry for key in the memory tier, without counting a hit."""
+        return self._memory.get(key)
+
+    def clear(self, disk=False):
+        """Empty the memory tier, and the disk tier too when disk is True."""
+        self._memory.clear()
+        self._nbytes = 0
+        if disk and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "entries": len(self._memory), "nbytes": self._nbytes}
+
+
+def use_result_cache(cache=True, max_bytes=256 * 2 ** 20, directory=None):
+    """
+    Install a process wide default cache for every backend that has no
+    result_cache of its own. Pass cache=False (or None) to switch it off.
+    Returns the installed cache.
+    """
+    global default_cache
+    if cache is True:
+        cache = ResultCache(max_bytes=max_bytes, directory=directory)
+    elif cache is False:
+        cache = None
+    default_cache = cache
+    return default_cache
+
+
+def result_cache_for(backend):
+    """The result cache a backend uses, or None."""
+    cache = getattr(backend, "result_cache", None)
+    return default_cache if cache is None else cache
+
+
+def cached_result(backend, stimulus, attrs=None):
+    """
+    Look a simulation up for a backend.
+    Returns (result or None, store) where store(result) saves a freshly
+    computed result; both are no-ops when caching is disabled.
+    The key is remembered as the backend's last result, see result_handle.
+    """
+    cache = result_cache_for(backend)
+    if cache is None:
+        return None, lambda result: None
+    if attrs is None:
+        attrs = backend.attrs
+    key = result_key(backend.name, attrs, stimulus)
+    backend._result_key = key
+    return cache.get(key), lambda result: cache.put(key, result)
+
+
+def result_handle(backend):
+    """
+    The cache key of the backend's current trace (vM), or None unless
+    that trace is the result last looked up with cached_result and it is
+    still in the memory tier of the backend's result cache. Another
+    process sharing the cache directory can load the trace by this key.
+    """
+    key = getattr(backend, "_result_key", None)
+    vm = getattr(backend, "vM", None)
+    cache = result_cache_for(backend)
+    if key is None or vm is None or cache is None:
+        return None
+    entry = cache.peek(key)
+    if entry is None or not np.array_equal(entry["vm"], np.asarray(vm.magnitude).ravel()):
+        return None
+    return key
+
+
+def use_prefix_cache(cache=True, max_bytes=64 * 2 ** 20, directory=None):
+    """
+    Install a process wide default stimulus prefix cache, see
+    use_result_cache. Returns the installed cache.
+    """
+    global default_prefix_cache
+    if cache is True:
+        cache = ResultCache(max_bytes=max_bytes, directory=directory)
+    elif cache is False:
+        cache = None
+    default_prefix_cache = cache
+    return default_prefix_cache
+
+
+def cached_prefix(backend, prefix, attrs=None):
+    """
+    Look up the stored state at the end of a stimulus prefix (a dict
+    describing it) for a backend.
+    Returns (entry or None, store), or (None, None) when the backend has
+    no prefix cache, in which case the whole stimulus should be simulated.
+    """
+    cache = getattr(backend, "prefix_cache", None)
+    if cache is None:
+        cache = default_prefix_cache
+    if cache is None:
+        return None, None
+    if attrs is None:
+        attrs = backend.attrs
+    key = result_key(backend.name, attrs, dict(prefix, kind="prefix"))
+    return cache.get(key), lambda entry: cache.put(key, entry)
@@ -0,0 +1,350 @@
+"""
+Multi-process population evaluation over shared memory.
+
+A PopulationEvaluator keeps a pool of worker processes alive between
+generations. Every worker compiles the kernels once when it starts, then
+waits for work. The parameter matrix of a population and the feature
+matrix that comes back both live in multiprocessing shared memory, so a
+generation costs one copy of the parameters in, one copy of the features
+out and a handful of (start, stop) messages, no pickling of traces or
+models.
+
+Each worker simulates a contiguous slice of the population with the
+batched square pulse kernels (batched.simulate_square) and reduces the
+traces to features (analysis.features.batch_features) before anything
+leaves the process.
+
+With n_workers=0 the same work is done in-process by the numba parallel
+(prange) kernels. That is the default when numba has more than one
+thread (NUMBA_NUM_THREADS), and the fallback when shared memory is not
+available on the platform.
+
+BluePyOptEvaluator plugs a PopulationEvaluator into BluePyOpt: it is a
+bluepyopt Evaluator, and its map_function, given to the optimiser,
+evaluates a whole generation in one call instead of one individual at a
+time.
+"""
+import multiprocessing
+import os
+import queue
+import weakref
+
+import numba
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from bluepyopt.evaluators import Evaluator
+from bluepyopt.objectives import Objective
+from bluepyopt.parameters import Parameter
+
+from .backends.batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES, param_matrix, simulate_square
+from ..analysis.features import FEATURE_NAMES, N_FEATURES, batch_features, feature_dtype
+from ..analysis.distance import trace_distance
+
+PARAM_NAMES = {"IZHI": IZHI_PARAM_NAMES, "ADEXP": ADEXP_PARAM_NAMES}
+
+
+def population_features(model, params, stimulus, threshold=0.0, dvdt_threshold=20.0, sink=None):
+    """
+    Simulate every row of params and return its (rows, N_FEATURES) features.
+    sink: optional TraceStore writer for the traces, see simulate_square.
+    """
+    vm, _ = simulate_square(model, params, stimulus["amplitude"], stimulus["delay"],
+                            stimulus["duration"], stimulus.get("padding", 0.0),
+                            stimulus.get("dt", 0.25), sink=sink, threshold=threshold)
+    return batch_features(vm, stimulus.get("dt", 0.25), 0.0, float(threshold),
+                          float(dvdt_threshold), float(stimulus["delay"]), True)
+
+
+def population_distance(model, params, stimulus, target, target_dt=None, metric="rmse",
+                        band=5.0, spike_window=None, threshold=0.0, sink=None):
+    """
+    Simulate every row of params and return the distance of each trace to
+    the target trace(s), see analysis.distance.trace_distance.
+    sink: optional TraceStore writer for the traces, see simulate_square.
+    """
+    dt = stimulus.get("dt", 0.25)
+    vm, _ = simulate_square(model, params, stimulus["amplitude"], stimulus["delay"],
+                            stimulus["duration"], stimulus.get("padding", 0.0), dt,
+                            sink=sink, threshold=threshold)
+    return trace_distance(vm, target, dt, target_dt, metric, band, spike_window, threshold)
+
+
+def feature_errors(values, target, weights=None):
+    """
+    Weighted absolute deviation of (rows, N_FEATURES) feature values from
+    target (a dict of feature name to value), one column per target
+    feature. NaN features score inf.
+    """
+    columns = [FEATURE_NAMES.index(name) for name in target]
+    wanted = np.array([target[name] for name in target], dtype=np.float64)
+    if weights is None:
+        weights = np.ones(len(columns))
+    error = np.abs(values[:, columns] - wanted) * np.asarray(weights, dtype=np.float64)
+    return np.where(np.isnan(error), np.inf, error)
+
+
+def feature_fitness(values, target, weights=None):
+    """The feature_errors of every row summed into one fitness."""
+    return feature_errors(values, target, weights).sum(axis=1)
+
+
+def _attach(names, shape):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    params = np.ndarray(shape[0], dtype=np.float64, buffer=blocks[0].buf)
+    features = np.ndarray(shape[1], dtype=np.float64, buffer=blocks[1].buf)
+    return blocks, params, features
+
+
+def _free(blocks):
+    """Close and unlink shared memory blocks, emptying the list."""
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # arrays still view it (e.g. at interpreter exit), unlink anyway
+            pass
+        block.unlink()
+    del blocks[:]
+
+
+def _shutdown(tasks, workers, blocks):
+    """Stop the workers and free the shared memory of an evaluator."""
+    for queue_ in tasks:
+        queue_.put(None)
+    for process in workers:
+        process.join(timeout=5.0)
+        if process.is_alive():
+            process.terminate()
+    del tasks[:]
+    del workers[:]
+    _free(blocks)
+
+
+def _worker(index, model, stimulus, threshold, dvdt_threshold, n_threads, tasks, done):
+    """Worker process main loop."""
+    import numba
+
+    numba.set_num_threads(n_threads)
+    # compile before reporting ready, on a throw away two sample stimulus
+    population_features(model, np.ones((1, len(PARAM_NAMES[model]))),
+                        dict(stimulus, duration=1.0, delay=0.0, padding=1.0),
+                        threshold, dvdt_threshold)
+    done.put((index, None))
+    blocks, params, features = [], None, None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        try:
+            if task[0] == "attach":
+                for block in blocks:
+                    block.close()
+                blocks, params, features = _attach(task[1], task[2])
+            else:
+                _, start, stop = task
+                if stop > start:
+                    features[start:stop] = population_features(
+                        model, params[start:stop], stimulus, threshold, dvdt_threshold)
+            done.put((index, None))
+        except Exception as error:
+            done.put((index, repr(error)))
+    for block in blocks:
+        block.close()
+
+
+class PopulationEvaluator(object):
+    """
+    Evaluates populations of one model type ("IZHI" or "ADEXP") under a
+    fixed square pulse stimulus (dict of amplitude, delay, duration and
+    optionally padding, dt; pA and ms).
+
+    n_workers: worker processes; 0 evaluates in-process. The default is
+    in-process when numba runs more than one thread, else one worker
+    per CPU. threads_per_worker: numba threads of each worker.
+    Use as a context manager, or call close(), to stop the workers; an
+    evaluator that is dropped or still open at exit is closed then.
+    """
+
+    def __init__(self, model, stimulus, n_workers=None, threads_per_worker=1,
+                 threshold=0.0, dvdt_threshold=20.0, start_method="spawn"):
+        if model not in PARAM_NAMES:
+            raise ValueError("no batched kernel for %s" % model)
+        self.model = model
+        self.param_names = PARAM_NAMES[model]
+        self.stimulus = {k: float(v) for k, v in stimulus.items()}
+        self.threshold = float(threshold)
+        self.dvdt_threshold = float(dvdt_threshold)
+        if n_workers is None:
+            cpus = os.cpu_count() or 1
+            # numba threads already spread the prange kernels over the CPUs
+            n_workers = 0 if numba.config.NUMBA_NUM_THREADS > 1 or cpus == 1 else cpus
+        if shared_memory is None:
+            n_workers = 0
+        self.n_workers = int(n_workers)
+        self._blocks = []
+        self._capacity = 0
+        self._workers = []
+        self._tasks = []
+        # the lists are emptied in place, so the finalizer sees the live ones
+        self._finalizer = weakref.finalize(self, _shutdown, self._tasks, self._workers, self._blocks)
+        if self.n_workers:
+            context = multiprocessing.get_context(start_method)
+            self._done = context.Queue()
+            for index in range(self.n_workers):
+                tasks = context.Queue()
+                process = context.Process(
+                    target=_worker,
+                    args=(index, model, self.stimulus, self.threshold, self.dvdt_threshold,
+                          int(threads_per_worker), tasks, self._done),
+                    daemon=True,
+                )
+                process.start()
+                self._tasks.append(tasks)
+                self._workers.append(process)
+            self._wait()
+
+    def _wait(self):
+        errors = []
+        for _ in range(self.n_workers):
+            while True:
+                try:
+                    index, error = self._done.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    dead = [p.exitcode for p in self._workers if not p.is_alive()]
+                    if dead:
+                        self.close()
+                        raise RuntimeError("evaluator worker exited with code %s" % dead[0])
+            if error is not None:
+                errors.append("worker %d: %s" % (index, error))
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+    def _reserve(self, rows):
+        if rows <= self._capacity:
+            return
+        self._release()
+        capacity = max(rows, 2 * self._capacity)
+        shape = ((capacity, len(self.param_names)), (capacity, N_FEATURES))
+        self._blocks[:] = [shared_memory.SharedMemory(create=True, size=8 * int(np.prod(s)))
+                           for s in shape]
+        self._params = np.ndarray(shape[0], dtype=np.float64, buffer=self._blocks[0].buf)
+        self._features = np.ndarray(shape[1], dtype=np.float64, buffer=self._blocks[1].buf)
+        self._capacity = capacity
+        names = [block.name for block in self._blocks]
+        for tasks in self._tasks:
+            tasks.put(("attach", names, shape))
+        self._wait()
+
+    def _release(self):
+        self._params = self._features = None
+        _free(self._blocks)
+        self._capacity = 0
+
+    def evaluate_features(self, params):
+        """
+        Features of every model of a population.
+        params: parameter matrix (columns as self.param_names) or a list
+        of attribute dicts. Returns (rows, N_FEATURES) floats.
+        """
+        if not isinstance(params, np.ndarray):
+            params = param_matrix(params, self.param_names)
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        rows = params.shape[0]
+        if not self.n_workers:
+            return population_features(self.model, params, self.stimulus,
+                                       self.threshold, self.dvdt_threshold)
+        self._reserve(rows)
+        self._params[:rows] = params
+        bounds = np.linspace(0, rows, self.n_workers + 1).astype(int)
+        for tasks, start, stop in zip(self._tasks, bounds[:-1], bounds[1:]):
+            tasks.put(("run", int(start), int(stop)))
+        self._wait()
+        return self._features[:rows].copy()
+
+    def evaluate(self, params):
+        """Features of a population as a structured array, see FEATURE_NAMES."""
+        return self.evaluate_features(params).view(feature_dtype())[:, 0]
+
+    def fitness(self, params, target, weights=None):
+        """
+        Weighted absolute deviation from target feature values (a dict of
+        feature name to value), one fitness per model. Features a model
+        does not have (NaN, e.g. the ISI of a silent cell) score inf.
+        """
+        return feature_fitness(self.evaluate_features(params), target, weights)
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        self._params = self._features = None
+        self._capacity = 0
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BluePyOptEvaluator(Evaluator):
+    """
+    BluePyOpt evaluator fitting the parameters in names (within bounds,
+    one (low, high) pair each) to target feature values (a dict of
+    feature name to value), one objective per target feature, see
+    feature_errors. The other parameters keep their value in base (an
+    attribute dict). Errors are capped at max_score.
+
+    Pass map_function to the optimiser, e.g.
+    DEAPOptimisation(evaluator=e, map_function=e.map_function), so that
+    each generation is one call of evaluator.evaluate_features.
+    """
+
+    def __init__(self, evaluator, base, names, bounds, target, weights=None, max_score=250.0):
+        self.evaluator = evaluator
+        self.names = list(names)
+        self.target = dict(target)
+        self.weights = weights
+        self.max_score = float(max_score)
+        all_names = evaluator.param_names
+        self.row = np.array([float(getattr(base[n], "value", base[n])) for n in all_names])
+        self.columns = [all_names.index(n) for n in self.names]
+        super(BluePyOptEvaluator, self).__init__(
+            objectives=[Objective(name) for name in self.target],
+            params=[Parameter(name, bounds=[float(lo), float(hi)])
+                    for name, (lo, hi) in zip(self.names, bounds)],
+        )
+
+    def evaluate_population(self, individuals):
+        """(n_individuals, n_objectives) errors of rows of values of names."""
+        params = np.repeat(self.row[np.newaxis], len(individuals), axis=0)
+        params[:, self.columns] = np.asarray(individuals, dtype=np.float64).reshape(len(individuals), -1)
+        errors = feature_errors(self.evaluator.evaluate_features(params), self.target, self.weights)
+        return np.minimum(errors, self.max_score)
+
+    def evaluate_with_lists(self, param_list):
+        return self.evaluate_population([param_list])[0].tolist()
+
+    # newer BluePyOpt optimisers register this one as their evaluate
+    init_simulator_and_evaluate_with_lists = evaluate_with_lists
+
+    def evaluate_with_dicts(self, param_dict):
+        errors = self.evaluate_with_lists([param_dict[name] for name in self.names])
+        return dict(zip(self.target, errors))
+
+    def map_function(self, evaluate, individuals):
+        """
+        map(evaluate, individuals) as the optimiser calls it: the whole
+        population goes through one evaluate_features call, evaluate
+        (this evaluator's evaluate_with_lists) is not called.
+        """
+        individuals = list(individuals)
+        if not individuals:
+            return []
+        return [tuple(errors) for errors in self.evaluate_population(individuals)]
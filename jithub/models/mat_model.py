@@ -0,0 +1,19 @@
+"""
+The multi-timescale adaptive threshold (MAT) model as a BluePyOpt cell
+model, see jithub.models.model_classes.
+"""
+from copy import copy
+
+from .backends.mat_nu import JIT_MATBackend
+from .model_classes import BPOModel
+
+
+class MATModel(BPOModel):
+    def __init__(self, name=None, attrs=None, backend=JIT_MATBackend):
+        self.default_attrs = {'vr':-65.0,'vt':-55.0,'a1':10, 'a2':2, 'b':0, 'w':5, 'R':10, 'tm':10, 't1':10, 't2':200, 'tv':5, 'tref':2}
+        if attrs is None:
+            attrs = {}
+        attrs_ = copy(self.default_attrs)
+        for key, value in attrs:
+            attrs_[key] = value
+        super().__init__(name=name, attrs=attrs_, backend=backend)
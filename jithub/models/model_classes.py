@@ -1,18 +1,26 @@
 #from .base import BaseModel
 from .backends.izhikevich import JIT_IZHIBackend
-from .backends.mat_nu import JIT_MATBackend
-from .backends.adexp import JIT_ADEXPBackend
 
-from copy import copy
+import importlib
+from copy import copy, deepcopy
 import collections
+import numpy as np
 import quantities as pq
 from sciunit import capabilities as scap
 from neuronunit import capabilities as ncap
 
 from bluepyopt.ephys.models import CellModel
 from neuronunit.models.optimization_model_layer import OptimizationModel
+from .backends.batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES, simulate_square
 
 class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotential,scap.Runnable):
+    ##
+    # Models with a batched kernel name it here (see batched.simulate_square),
+    # kernel_params is the column order of its parameter matrix.
+    ##
+    kernel = None
+    kernel_params = ()
+
     def __init__(self,name,attrs={}):
         self.mechanisms = None
         self.morphology = None
@@ -28,6 +36,15 @@ class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotenti
         widths = sf.spikes2widths(vm)
         return widths
 
+    def get_features(self, features=None, **kwargs):
+        """
+        Electrophysiology features of the last simulation, computed in
+        one compiled pass, see jithub.analysis.features.extract_features.
+        """
+        from ..analysis.features import extract_features
+        vm = self.get_membrane_potential()
+        return extract_features(vm, features=features, **kwargs)
+
     def freeze(self, param_dict):
         """
         Over ride parent class method
@@ -43,6 +60,9 @@ class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotenti
 
                 self.params[param_name] = Parameter(name=param_name,value=param_value,frozen=True)
 
+    def param_values(self):
+        """Current parameters as plain floats."""
+        return {k:float(v.value) if hasattr(v,'value') else v for k,v in self.params.items()}
 
     def instantiate(self, sim=None):
         """
@@ -51,17 +71,8 @@ class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotenti
         As if called from a genetic algorithm.
         """
         if self.params is not None:
-            self.attrs = self.params
-
-        dtc = self.model_to_dtc()
-        for k,v in self.params.items():
-            if hasattr(v,'value'):
-                v = float(v.value)
-
-            dtc.attrs[k] = v
-            self.attrs[k] = v
-        return dtc
-
+            self.attrs = self.param_values()
+        return self.transport()
 
     def model_to_dtc(self,attrs=None):
         """
@@ -71,44 +82,116 @@ class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotenti
             dtc
             DTC is a simulator indipendent data transport container object.
         """
+        return self.transport(attrs)
 
-
+    def transport(self, attrs=None):
+        """
+        A new data transport container (DTC) holding a copy of attrs
+        (default: the current attrs), one per call so that DTCs collected
+        per individual keep their own parameters.
+        """
         dtc = OptimizationModel(backend=self.backend)
-        dtc.attrs = self.attrs
+        dtc.attrs = dict(self.attrs if attrs is None else attrs)
         return dtc
 
-        if type(attrs) is not type(None):
-            if len(attrs):
-                dtc.attrs = attrs
-                self.attrs = attrs
-            assert self._backend is not None
-            return dtc
-        else:
-            if type(self.attrs) is not type(None):
-                if len(self.attrs):
-                    try:
-                        dynamic_attrs = {str(k):float(v) for k,v in self.attrs.items()}
-                    except:
-                        dynamic_attrs = {str(k):float(v.value) for k,v in self.attrs.items()}
-
-        if self._backend is None:
-            super(VeryReducedModel, self).__init__(name=self.name,backend=self.backend)#,attrs=dtc.attrs)
-            assert self._backend is not None
-        frozen_attrs = self._backend.default_attrs
-        if 'dynamic_attrs' in locals():
-            frozen_attrs.update(dynamic_attrs)
-        all_attrs = frozen_attrs
-        dtc.attrs = all_attrs
-        assert dtc.attrs is not None
-        return dtc
+    def kernel_row(self):
+        """Parameter row of the current attrs, in kernel_params order."""
+        attrs = self.attrs
+        return np.array([float(getattr(attrs[name],'value',attrs[name])) for name in self.kernel_params])
+
+    def _kernel_columns(self, names):
+        columns = self.__dict__.setdefault('_columns', {})
+        if names not in columns:
+            columns[names] = np.array([self.kernel_params.index(name) for name in names], dtype=np.intp)
+        return columns[names]
+
+    def evaluate_population(self, vectors, names=None, amplitude=100.0, delay=10.0,
+                            duration=500.0, padding=0.0, dt=0.25, layout="aos", sink=None):
+        """
+        Fast path for optimisers: square current injection into one model
+        per row of vectors, without building Parameters, DTCs or
+        AnalogSignals. names gives the order of the columns of vectors
+        (default kernel_params); parameters not named keep their current
+        value. layout="soa" suits large populations, and sink (a
+        TraceStore writer) receives every trace, see simulate_square.
+        Returns (vm, spike_counts) as plain arrays.
+        """
+        if self.kernel is None:
+            raise NotImplementedError("%s has no batched kernel" % type(self).__name__)
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+        if names is None:
+            names = self.kernel_params
+        params = np.repeat(self.kernel_row()[np.newaxis], len(vectors), axis=0)
+        params[:, self._kernel_columns(tuple(names))] = vectors
+        return simulate_square(self.kernel, params, float(amplitude), float(delay),
+                               float(duration), float(padding), dt, layout=layout, sink=sink)
+
+    def score_population(self, vectors, target, names=None, target_dt=None, metric="rmse",
+                         band=5.0, spike_window=None, threshold=0.0, **stimulus):
+        """
+        Distance of the trace of each row of vectors (see
+        evaluate_population) to a recorded target trace, computed on the
+        raw arrays, see jithub.analysis.distance.trace_distance.
+        Returns an (n_models,) array.
+        """
+        from ..analysis.distance import trace_distance
+
+        vm, _ = self.evaluate_population(vectors, names, **stimulus)
+        return trace_distance(vm, target, stimulus.get("dt", 0.25), target_dt, metric, band,
+                              spike_window, threshold)
+
+    def evaluate_vector(self, vector, names=None, **stimulus):
+        """Fast path for a single parameter vector, returns (vm, spike_count)."""
+        vm, counts = self.evaluate_population(vector, names, **stimulus)
+        return vm[0], int(counts[0])
+
+
+    def __reduce_ex__(self, protocol):
+        """
+        Compact pickling of models with a batched kernel: only the kernel
+        name, the kernel parameter vector, attrs outside it, a non default
+        precision and a handle to the last result (when it sits in a
+        result cache, see cache.result_handle) are sent, and the model is
+        rebuilt with rebuild_model. BluePyOpt Parameter objects, the DTC
+        and traces not in a cache are not carried over.
+        Other models pickle their whole state.
+        """
+        if self.kernel is None:
+            return super().__reduce_ex__(protocol)
+        from .cache import result_handle
+
+        attrs = self.attrs
+        model = self.kernel if type(self) is _model_class(self.kernel) else type(self)
+        values = tuple(float(getattr(attrs[name], 'value', attrs[name])) for name in self.kernel_params)
+        extra = {k: v for k, v in attrs.items() if k not in self.kernel_params}
+        if self.precision != "float64":
+            extra["precision"] = self.precision
+        handle = result_handle(self)
+        if handle is not None:
+            handle = (handle, float(self.vM.sampling_period.rescale(pq.ms).magnitude))
+        args = (model, values, handle, extra) if extra else (model, values, handle)
+        return rebuild_model, args
+
+    ##
+    # Copies keep the whole state, only pickles are compact.
+    ##
+    def __copy__(self):
+        new = type(self).__new__(type(self))
+        new.__dict__.update(self.__getstate__())
+        return new
 
+    def __deepcopy__(self, memo):
+        new = type(self).__new__(type(self))
+        memo[id(self)] = new
+        new.__dict__.update(deepcopy(self.__getstate__(), memo))
+        return new
 
     def check_nonfrozen_params(self, param_names):
         """
         Over ride parent class method
         Check if all nonfrozen params are set"""
         for param_name, param in self.params.items():
-            if not param.frozen:
+            if not getattr(param,'frozen',True):
                 raise Exception(
                     'CellModel: Nonfrozen param %s needs to be '
                     'set before simulation' %
@@ -116,36 +199,10 @@ class BPOModel(CellModel,ncap.ReceivesSquareCurrent,ncap.ProducesMembranePotenti
 
 
 from sciunit.models import RunnableModel
-class ADEXPModel(JIT_ADEXPBackend,BPOModel,OptimizationModel,RunnableModel):
-    def __init__(self, name="not_None", params=None):
-        self.default_attrs = {}
-        self.default_attrs['cm']=0.281
-        self.default_attrs['v_spike']=-40.0
-        self.default_attrs['v_reset']=-70.6
-        self.default_attrs['v_rest']=-70.6
-        self.default_attrs['tau_m']=9.3667
-        self.default_attrs['a']=4.0
-        self.default_attrs['b']=0.0805
-        self.default_attrs['delta_T']=2.0
-        self.default_attrs['tau_w']=144.0
-        self.default_attrs['v_thresh']=-50.4
-        self.default_attrs['spike_delta']=30
-
-        if params is not None:
-            self.params = collections.OrderedDict(**params)
-        else:
-            self.params = self.default_attrs
-        self._attrs = self.params
-        BPOModel.__init__(self,name)
-        OptimizationModel.__init__(self,attrs=self.params,backend=self)
-        RunnableModel._backend = JIT_ADEXPBackend
-        self.morphology = None
-        RunnableModel.morphology = None
-        RunnableModel.mechanisms = None
-        self.ampl = 0
-        self._attrs = self.params
-
 class IzhiModel(JIT_IZHIBackend,BPOModel,OptimizationModel,RunnableModel):
+    kernel = "IZHI"
+    kernel_params = IZHI_PARAM_NAMES
+
     def __init__(self, name=None, params=None, backend=JIT_IZHIBackend):
         self.default_attrs = {'C':89.7960714285714,
                               'a':0.01, 'b':15, 'c':-60, 'd':10, 'k':1.6,
@@ -163,13 +220,56 @@ class IzhiModel(JIT_IZHIBackend,BPOModel,OptimizationModel,RunnableModel):
         RunnableModel.mechanisms = None
 
 
+_KERNEL_MODELS = {"IZHI": "IzhiModel", "ADEXP": "ADEXPModel"}
+
+
+def _model_class(kernel):
+    name = _KERNEL_MODELS.get(kernel)
+    return globals()[name] if name in globals() else __getattr__(name)
+
+
+def rebuild_model(model, values, result=None, extra=None):
+    """
+    Unpickle a model reduced by BPOModel.__reduce_ex__. model is a kernel
+    name ("IZHI", "ADEXP") or a model class, values its kernel parameter
+    vector, result an optional (result cache key, dt) of its trace, which
+    is loaded from this process's result cache when present there.
+    """
+    from .cache import result_cache_for
+
+    cls = _model_class(model) if isinstance(model, str) else model
+    extra = dict(extra or {})
+    precision = extra.pop("precision", None)
+    attrs = dict(zip(cls.kernel_params, values))
+    attrs.update(extra)
+    instance = cls(params=attrs)
+    instance.attrs = attrs
+    if precision is not None:
+        instance.precision = precision
+    if result is not None:
+        cache = result_cache_for(instance)
+        entry = cache.get(result[0]) if cache is not None else None
+        if entry is not None:
+            from neo import AnalogSignal
+
+            instance._result_key = result[0]
+            instance.vM = AnalogSignal(np.array(entry["vm"]), units=pq.mV, sampling_period=result[1] * pq.ms)
+            if "n_spikes" in entry:
+                instance.n_spikes = int(entry["n_spikes"])
+    return instance
+
+
+##
+# ADEXPModel and MATModel live in their own modules, imported on first
+# use, so that IzhiModel users do not pay for the ADEXP and MAT imports
+# (matplotlib, scipy, the CUDA probe).
+##
+_LAZY = {"ADEXPModel": ".adexp_model", "MATModel": ".mat_model"}
+
 
-class MATModel(BPOModel):
-    def __init__(self, name=None, attrs=None, backend=JIT_MATBackend):
-        self.default_attrs = {'vr':-65.0,'vt':-55.0,'a1':10, 'a2':2, 'b':0, 'w':5, 'R':10, 'tm':10, 't1':10, 't2':200, 'tv':5, 'tref':2}
-        if attrs is None:
-            attrs = {}
-        attrs_ = copy(self.default_attrs)
-        for key, value in attrs:
-            attrs_[key] = value
-        super().__init__(name=name, attrs=attrs_, backend=backend)
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __package__), name)
+    globals()[name] = value
+    return value
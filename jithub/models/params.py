@@ -0,0 +1,187 @@
+"""
+Immutable parameter sets.
+
+A ParameterSet holds the kernel parameters of one model as a read-only
+float64 vector, in the column order the batched kernels use, plus any
+other settings (e.g. dt) as a small tuple. It is validated once when it
+is built, hashable (so it can key caches and dicts), and reads like the
+attrs dicts it replaces: p["a"], p.get("dt"), dict(p), "a" in p.
+
+Changing a value means building a new set with replace(); nothing that
+was handed a ParameterSet can see it change afterwards, so models no
+longer share mutable defaults.
+
+Values that are not set yet (None, e.g. an unfrozen BluePyOpt Parameter)
+are stored as NaN.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+from .backends.batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES
+
+
+def plain(value):
+    """Unwrap BluePyOpt Parameters and quantities to plain Python values."""
+    if hasattr(value, "value") and not isinstance(value, np.ndarray):
+        value = value.value
+    if hasattr(value, "magnitude"):
+        value = value.magnitude
+    if isinstance(value, np.ndarray) and value.ndim == 0:
+        value = value.item()
+    if isinstance(value, np.generic):
+        value = value.item()
+    return value
+
+
+class ParameterSet(Mapping):
+    """
+    Base class, subclasses set names (kernel columns), defaults and
+    integer (names whose values are rounded to int).
+    """
+
+    __slots__ = ("_values", "_extra", "_hash")
+    names = ()
+    defaults = {}
+    integer = ()
+
+    def __init__(self, attrs=None, **kwargs):
+        merged = dict(self.defaults)
+        if attrs is not None:
+            merged.update(attrs)
+        merged.update(kwargs)
+        values = np.empty(len(self.names))
+        for col, name in enumerate(self.names):
+            try:
+                value = plain(merged.pop(name))
+            except KeyError:
+                raise KeyError("%s needs a value for %s" % (type(self).__name__, name))
+            value = np.nan if value is None else float(value)
+            if name in self.integer and value == value:
+                value = float(int(round(value)))
+            values[col] = value
+        values.flags.writeable = False
+        extra = tuple(sorted((str(k), plain(v)) for k, v in merged.items()))
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "_extra", extra)
+        object.__setattr__(self, "_hash", None)
+        self.validate()
+
+    def validate(self):
+        """Raise ValueError for values the kernels cannot integrate."""
+        if np.any(np.isinf(self._values)):
+            raise ValueError("infinite parameter in %r" % (self,))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable, use replace()" % type(self).__name__)
+
+    def __getitem__(self, name):
+        try:
+            col = self.names.index(name)
+        except ValueError:
+            for key, value in self._extra:
+                if key == name:
+                    return value
+            raise KeyError(name)
+        if name in self.integer and self._values[col] == self._values[col]:
+            return int(self._values[col])
+        return float(self._values[col])
+
+    def __iter__(self):
+        for name in self.names:
+            yield name
+        for key, _ in self._extra:
+            yield key
+
+    def __len__(self):
+        return len(self.names) + len(self._extra)
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(
+                (type(self).__name__, self._values.tobytes(),
+                 tuple((k, repr(v)) for k, v in self._extra))))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, ParameterSet):
+            return (type(self) is type(other) and np.array_equal(self._values, other._values)
+                    and repr(self._extra) == repr(other._extra))
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, dict(self))
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def as_array(self):
+        """The kernel parameters as a read-only flat array, in names order."""
+        return self._values
+
+    def replace(self, attrs=None, **kwargs):
+        """A new set with some values changed."""
+        merged = dict(self)
+        if attrs is not None:
+            merged.update(attrs)
+        merged.update(kwargs)
+        return type(self)(merged)
+
+    def kernel_kwargs(self, exclude=()):
+        """Kernel parameters as keyword arguments (a new dict)."""
+        return {name: self[name] for name in self.names if name not in exclude}
+
+
+class IzhiParameters(ParameterSet):
+    """Parameters of the Izhikevich (2007) cell types, see JIT_IZHIBackend."""
+
+    __slots__ = ()
+    names = IZHI_PARAM_NAMES
+    integer = ("celltype",)
+    defaults = {
+        "C": 89.8,
+        "a": 0.01,
+        "b": 15,
+        "c": -60,
+        "d": 10,
+        "k": 1.6,
+        "vPeak": (86.3 - 65.2),
+        "vr": -65.2,
+        "vt": -50,
+        "celltype": 3,
+    }
+
+    def validate(self):
+        ParameterSet.validate(self)
+        if self["C"] <= 0:
+            raise ValueError("C must be positive, got %g" % self["C"])
+        if self["celltype"] == self["celltype"] and not 1 <= self["celltype"] <= 7:
+            raise ValueError("celltype must be between 1 and 7, got %d" % self["celltype"])
+
+
+class AdexpParameters(ParameterSet):
+    """Parameters of the adaptive exponential model, see JIT_ADEXPBackend."""
+
+    __slots__ = ()
+    names = ADEXP_PARAM_NAMES
+    defaults = {
+        "cm": 2.81,
+        "v_reset": -70.6,
+        "v_rest": -70.6,
+        "tau_m": 9.3667,
+        "a": 4.0,
+        "b": 0.0805,
+        "delta_T": 2.0,
+        "tau_w": 144.0,
+        "v_thresh": -50.4,
+        "spike_delta": 30,
+    }
+
+    def validate(self):
+        ParameterSet.validate(self)
+        for name in ("cm", "tau_m", "tau_w", "delta_T"):
+            if self[name] <= 0:
+                raise ValueError("%s must be positive, got %g" % (name, self[name]))
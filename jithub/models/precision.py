@@ -0,0 +1,92 @@
+"""
+Single precision simulation.
+
+The reduced model kernels take their floating point type from their
+inputs: given float32 parameters and currents they keep the model state
+in float32 and return float32 traces, which halves the memory traffic of
+large populations. A few constants in the Izhikevich and ADEXP update
+rules are float64 literals, the result of those steps is rounded back to
+float32.
+
+Backends (IZHI, ADEXP, MAT) and batched.simulate_square take
+precision="float32" (or "float64", the default). The validation helpers
+here run the same simulation in both precisions and report how far the
+spike times of the float32 run moved.
+"""
+import numpy as np
+
+from ..analysis.spikes import batch_spike_times
+
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+
+def precision_dtype(precision):
+    """The NumPy dtype of a precision name ("float32" or "float64")."""
+    try:
+        return PRECISIONS[str(precision)]
+    except KeyError:
+        raise ValueError("precision must be one of %s, got %r" % (sorted(PRECISIONS), precision))
+
+
+def spike_time_deviation(reference, trial, dt, threshold=0.0, t_start=0.0):
+    """
+    Spike time deviation of trial against reference, both (n_models,
+    n_steps) (or 1D) arrays sampled every dt ms. The k-th spike of a
+    trial trace is paired with the k-th spike of its reference trace.
+    Returns a dict of the number of traces, those whose spike counts
+    differ, the paired spike count and the max / mean / rms absolute
+    deviation (ms) of the paired spikes.
+    """
+    reference = np.atleast_2d(np.asarray(reference, dtype=np.float64))
+    trial = np.atleast_2d(np.asarray(trial, dtype=np.float64))
+    ref_times, ref_offsets = batch_spike_times(reference, threshold, dt, 0.0, t_start)
+    trial_times, trial_offsets = batch_spike_times(trial, threshold, dt, 0.0, t_start)
+    ref_counts = np.diff(ref_offsets)
+    trial_counts = np.diff(trial_offsets)
+    deviations = [
+        np.abs(trial_times[trial_offsets[r]:trial_offsets[r] + n] - ref_times[ref_offsets[r]:ref_offsets[r] + n])
+        for r, n in enumerate(np.minimum(ref_counts, trial_counts))
+    ]
+    deviations = np.concatenate(deviations) if deviations else np.zeros(0)
+    return {
+        "n_traces": len(reference),
+        "count_mismatches": int(np.sum(ref_counts != trial_counts)),
+        "max_count_difference": int(np.max(np.abs(ref_counts - trial_counts))) if len(reference) else 0,
+        "paired_spikes": len(deviations),
+        "max_abs_ms": float(deviations.max()) if len(deviations) else 0.0,
+        "mean_abs_ms": float(deviations.mean()) if len(deviations) else 0.0,
+        "rms_ms": float(np.sqrt(np.mean(deviations ** 2))) if len(deviations) else 0.0,
+    }
+
+
+def validate_square(model, params, amplitude, delay, duration, padding=0.0, dt=0.25,
+                    precision="float32", threshold=0.0):
+    """
+    Simulate a population (see batched.simulate_square) in float64 and in
+    precision and report the spike time deviation.
+    """
+    from .backends.batched import simulate_square
+
+    reference, _ = simulate_square(model, params, amplitude, delay, duration, padding, dt)
+    trial, _ = simulate_square(model, params, amplitude, delay, duration, padding, dt,
+                               precision=precision)
+    return spike_time_deviation(reference, trial, dt, threshold)
+
+
+def validate_backend(backend, precision="float32", threshold=0.0, **stimulus):
+    """
+    Run backend.inject_square_current(**stimulus) in float64 and in
+    precision (the backend's precision is restored afterwards) and report
+    the spike time deviation.
+    """
+    saved = backend.precision
+    traces = []
+    try:
+        for p in ("float64", precision):
+            backend.precision = p
+            vm = backend.inject_square_current(**stimulus)
+            traces.append(np.asarray(vm.magnitude).ravel())
+    finally:
+        backend.precision = saved
+    dt = float(vm.sampling_period.rescale("ms").magnitude)
+    return spike_time_deviation(traces[0], traces[1], dt, threshold)
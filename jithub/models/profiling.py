@@ -0,0 +1,209 @@
+"""
+Per-phase profiling of backend calls.
+
+Backend entry points (inject_square_current, get_spike_count, ...) are
+wrapped with @profiled and split into phases:
+
+    attrs     merging / copying model parameters
+    stimulus  building the stimulus (current arrays, pulse indices)
+    cache     result cache lookups and stores
+    kernel    the simulation itself (numba kernel or NEURON run)
+    resample  NEURON's variable step trace onto a fixed grid
+    wrap      wrapping the trace in a neo AnalogSignal
+    spikes    spike detection
+
+Profiling is opt in, like result caching. Either assign a PhaseProfiler
+to a backend instance's profiler attribute or install a process wide
+default with use_profiler(). Without one, @profiled calls straight
+through and phase() returns a shared no-op context manager, so the cost
+is an attribute lookup per phase.
+
+A PhaseProfiler aggregates count, total, self, min and max time per call
+path (e.g. "IZHI.inject_square_current;kernel") and keeps the most
+recent spans, which can be written as a Chrome trace (chrome://tracing,
+Perfetto) or as folded stacks for flamegraph.pl / speedscope.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+default_profiler = None
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ("profiler", "name", "start", "child_time")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.child_time = 0.0
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        path = ";".join(span.name for span in stack)
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        self.profiler._record(path, self.start, duration, duration - self.child_time)
+        return False
+
+
+class PhaseProfiler(object):
+    """
+    Collector of phase timings. max_events bounds the number of spans
+    kept for trace output (the oldest are dropped); the per path totals
+    always cover every span.
+    """
+
+    def __init__(self, max_events=100000):
+        self.max_events = int(max_events)
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, path, start, duration, self_time):
+        with self._lock:
+            entry = self._totals.get(path)
+            if entry is None:
+                entry = self._totals[path] = [0, 0.0, 0.0, float("inf"), 0.0]
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += self_time
+            entry[3] = min(entry[3], duration)
+            entry[4] = max(entry[4], duration)
+            self._events.append((path, start, duration, threading.get_ident()))
+
+    def span(self, name):
+        """Context manager timing one phase, nested in the enclosing span."""
+        return _Span(self, name)
+
+    def clear(self):
+        with self._lock:
+            self._totals = OrderedDict()
+            self._events = deque(maxlen=self.max_events)
+
+    def stats(self, phase=None):
+        """
+        {path: {count, total_s, self_s, mean_s, min_s, max_s}}, for the
+        paths ending in phase when it is given.
+        """
+        with self._lock:
+            totals = list(self._totals.items())
+        out = OrderedDict()
+        for path, (count, total, self_time, low, high) in totals:
+            if phase is not None and path.rsplit(";", 1)[-1] != phase:
+                continue
+            out[path] = {"count": count, "total_s": total, "self_s": self_time,
+                         "mean_s": total / count, "min_s": low, "max_s": high}
+        return out
+
+    def total(self, phase):
+        """Seconds spent in phase, summed over every call path."""
+        return sum(s["total_s"] for s in self.stats(phase).values())
+
+    def count(self, phase):
+        return sum(s["count"] for s in self.stats(phase).values())
+
+    def report(self):
+        """The per path totals as a text table, slowest first."""
+        rows = sorted(self.stats().items(), key=lambda kv: -kv[1]["total_s"])
+        lines = ["%-56s %8s %12s %12s %12s" % ("path", "count", "total ms", "self ms", "mean us")]
+        for path, s in rows:
+            lines.append("%-56s %8d %12.3f %12.3f %12.2f" % (
+                path, s["count"], 1e3 * s["total_s"], 1e3 * s["self_s"], 1e6 * s["mean_s"]))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """The kept spans as a Chrome trace event dict (times in us)."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        return {
+            "traceEvents": [
+                {"name": path.rsplit(";", 1)[-1], "cat": path.split(";", 1)[0], "ph": "X",
+                 "ts": 1e6 * (start - self.origin), "dur": 1e6 * duration,
+                 "pid": pid, "tid": tid, "args": {"path": path}}
+                for path, start, duration, tid in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def folded(self):
+        """Folded stacks ("a;b;c <self time in us>" per line) of every path."""
+        return "\n".join("%s %d" % (path, int(round(1e6 * s["self_s"])))
+                         for path, s in self.stats().items()) + "\n"
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            f.write(self.folded())
+
+
+def use_profiler(profiler=True, max_events=100000):
+    """
+    Install a process wide default profiler for every backend that has no
+    profiler of its own. Pass profiler=False (or None) to switch it off.
+    Returns the installed profiler.
+    """
+    global default_profiler
+    if profiler is True:
+        profiler = PhaseProfiler(max_events=max_events)
+    elif profiler is False:
+        profiler = None
+    default_profiler = profiler
+    return default_profiler
+
+
+def phase(backend, name):
+    """Context manager timing phase name of a backend call (no-op when disabled)."""
+    profiler = getattr(backend, "profiler", None) or default_profiler
+    if profiler is None:
+        return NULL_SPAN
+    return profiler.span(name)
+
+
+def profiled(method):
+    """Time a backend method as a top level span named <backend name>.<method>."""
+    label = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(self, "profiler", None) or default_profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.span("%s.%s" % (getattr(type(self), "name", type(self).__name__), label)):
+            return method(self, *args, **kwargs)
+
+    return wrapper
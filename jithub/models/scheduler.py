@@ -0,0 +1,170 @@
+"""
+Request coalescing for asyncio services.
+
+Concurrent single-model requests are cheap to batch: BatchScheduler
+collects every request that arrives within a short window, stacks the
+ones sharing a stimulus into one parameter matrix, runs the batched
+square pulse kernel (batched.simulate_square) for each group on a thread
+pool and resolves every request's future with its own row. The kernels
+are compiled with nogil=True, so groups run concurrently with each other
+and with the event loop. Only the tbb and omp threading layers of numba
+allow parallel kernels to be entered from several threads at once; under
+any other layer (workqueue) the kernel calls take turns.
+
+Requests are grouped by stimulus and precision, so float32 backends get
+float32 traces.
+
+One scheduler per (event loop, model type) is created on demand by
+scheduler_for(); backends reach it through simulate_async().
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numba
+import numpy as np
+
+from .backends.batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES, param_matrix, simulate_square
+
+PARAM_NAMES = {"IZHI": IZHI_PARAM_NAMES, "ADEXP": ADEXP_PARAM_NAMES}
+STIMULUS_KEYS = ("amplitude", "delay", "duration", "padding", "dt")
+# the defaults of inject_square_current
+STIMULUS_DEFAULTS = {"amplitude": 100.0, "delay": 10.0, "duration": 500.0, "padding": 0.0, "dt": 0.25}
+
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def stimulus_key(stimulus):
+    """(amplitude, delay, duration, padding, dt) floats, quantities stripped."""
+    return tuple(float(stimulus.get(k, STIMULUS_DEFAULTS[k])) for k in STIMULUS_KEYS)
+
+
+class BatchScheduler(object):
+    """
+    Coalesces simulate() calls of one model type ("IZHI" or "ADEXP").
+    window: seconds to wait for more requests after the first one of a
+    batch arrives. max_batch: a batch is dispatched at once when this many
+    requests are pending. executor: thread pool for the kernel calls; one
+    is created when not given, and shut down by close() / aclose() or
+    when the scheduler is dropped.
+    """
+
+    def __init__(self, model, window=0.002, max_batch=4096, executor=None):
+        if model not in PARAM_NAMES:
+            raise ValueError("no batched kernel for %s" % model)
+        self.model = model
+        self.param_names = PARAM_NAMES[model]
+        self.window = float(window)
+        self.max_batch = int(max_batch)
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=2)
+        self._finalizer = weakref.finalize(self, self.executor.shutdown, False) if self._own_executor else None
+        self._pending = []
+        self._running = set()
+        self._timer = None
+        self.n_requests = 0
+        self.n_batches = 0
+        # Compile, and start numba's parallel runtime, on this thread rather
+        # than inside the pool: TBB does not shut down cleanly when it was
+        # first launched from a pool thread.
+        simulate_square(model, np.ones((1, len(self.param_names))), 1.0, 0.0, 1.0, 1.0)
+        # workqueue aborts the process when two threads enter a parallel kernel
+        self._lock = None if numba.threading_layer() in ("tbb", "omp") else threading.Lock()
+
+    def simulate(self, params, stimulus, precision="float64"):
+        """
+        Queue one model (attribute dict or parameter row) for a square
+        pulse stimulus (dict with any of amplitude, delay, duration,
+        padding, dt; missing keys take the inject_square_current defaults),
+        simulated in precision ("float64" or "float32").
+        Returns an awaitable resolving to (vm, spike_count).
+        """
+        loop = asyncio.get_running_loop()
+        if isinstance(params, Mapping):
+            row = param_matrix(params, self.param_names)[0]
+        else:
+            row = np.asarray(params, dtype=np.float64)
+        future = loop.create_future()
+        self._pending.append(((stimulus_key(stimulus), str(precision)), row, future))
+        self.n_requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        groups = {}
+        for key, row, future in pending:
+            groups.setdefault(key, []).append((row, future))
+        loop = asyncio.get_running_loop()
+        for key, requests in groups.items():
+            params = np.array([row for row, _ in requests])
+            run = loop.run_in_executor(self.executor, self._run, params, key)
+            self._running.add(run)
+            run.add_done_callback(self._running.discard)
+            run.add_done_callback(functools.partial(self._resolve, [f for _, f in requests]))
+            self.n_batches += 1
+
+    def _run(self, params, key):
+        stimulus, precision = key
+        if self._lock is None:
+            return simulate_square(self.model, params, *stimulus, precision=precision)
+        with self._lock:
+            return simulate_square(self.model, params, *stimulus, precision=precision)
+
+    @staticmethod
+    def _resolve(futures, run):
+        error = run.exception()
+        if error is None:
+            vm, counts = run.result()
+        for row, future in enumerate(futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result((vm[row], int(counts[row])))
+
+    def close(self):
+        """
+        Fail the requests not dispatched yet and shut down the executor
+        if the scheduler created it, waiting for running batches.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        for _, _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("scheduler closed"))
+        if self._finalizer is not None and self._finalizer.detach() is not None:
+            self.executor.shutdown(wait=True)
+
+    async def aclose(self):
+        """Dispatch and wait for the pending requests, then close()."""
+        if self._pending:
+            self._flush()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        self.close()
+
+    @property
+    def mean_batch_size(self):
+        return self.n_requests / self.n_batches if self.n_batches else 0.0
+
+
+def scheduler_for(model, loop=None, **kwargs):
+    """The BatchScheduler of model on loop (default: the running loop)."""
+    loop = loop or asyncio.get_running_loop()
+    per_loop = _schedulers.setdefault(loop, {})
+    if model not in per_loop:
+        per_loop[model] = BatchScheduler(model, **kwargs)
+    return per_loop[model]
@@ -0,0 +1,176 @@
+"""
+Surrogate pre-screening of optimisation candidates.
+
+Most candidates of a genetic algorithm are far from the target, and for
+the more expensive backends (ADEXP populations, NEURON) simulating them is
+most of the cost of a run. A NearestNeighbourSurrogate learns from the
+(parameters -> features) pairs simulated so far and predicts the
+features of new candidates as the mean over their k nearest simulated
+neighbours, in parameter space scaled to unit range per column.
+
+SurrogateScreen puts it in front of any simulator: a generation is
+scored on predicted features, only the best fraction (plus a small random
+fraction, which keeps the surrogate honest) is simulated, and the rest
+keep their predicted features. Every simulated candidate is added to the
+surrogate, so it improves as the run goes on.
+"""
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True, parallel=True)
+def knn_predict(train_x, train_y, query, k):
+    """
+    Mean of train_y over the k nearest rows of train_x of every query row
+    (NaN entries are skipped). Returns (predictions, mean neighbour distance).
+    """
+    n = train_x.shape[0]
+    k = min(k, n)
+    predicted = np.empty((query.shape[0], train_y.shape[1]))
+    distance = np.empty(query.shape[0])
+    for q in prange(query.shape[0]):
+        d = np.empty(n)
+        for i in range(n):
+            s = 0.0
+            for j in range(train_x.shape[1]):
+                diff = train_x[i, j] - query[q, j]
+                s += diff * diff
+            d[i] = s
+        nearest = np.argsort(d)[:k]
+        mean_d = 0.0
+        for i in nearest:
+            mean_d += np.sqrt(d[i])
+        distance[q] = mean_d / k
+        for f in range(train_y.shape[1]):
+            total = 0.0
+            count = 0
+            for i in nearest:
+                value = train_y[i, f]
+                if value == value:
+                    total += value
+                    count += 1
+            predicted[q, f] = total / count if count else np.nan
+    return predicted, distance
+
+
+class NearestNeighbourSurrogate(object):
+    """
+    k nearest neighbour regressor from parameter rows to feature rows.
+    max_samples bounds the memory (and prediction cost): once exceeded
+    the oldest samples are forgotten.
+    """
+
+    def __init__(self, k=5, max_samples=20000):
+        self.k = int(k)
+        self.max_samples = int(max_samples)
+        self.params = None
+        self.features = None
+
+    def __len__(self):
+        return 0 if self.params is None else len(self.params)
+
+    def add(self, params, features):
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        if self.params is None:
+            self.params, self.features = params.copy(), features.copy()
+        else:
+            self.params = np.vstack([self.params, params])[-self.max_samples:]
+            self.features = np.vstack([self.features, features])[-self.max_samples:]
+
+    def predict(self, params):
+        """Predicted features and mean neighbour distance of every row."""
+        if not len(self):
+            raise ValueError("the surrogate has not seen any samples yet")
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        low = self.params.min(axis=0)
+        span = self.params.max(axis=0) - low
+        span[span == 0] = 1.0
+        return knn_predict((self.params - low) / span, self.features, (params - low) / span, self.k)
+
+
+class SurrogateScreen(object):
+    """
+    Pre-screening stage in front of a simulator.
+    simulate: params (rows, n_params) -> features (rows, n_features),
+    e.g. PopulationEvaluator.evaluate_features.
+    score: features -> one score per row, lower is better, e.g.
+    functools.partial(evaluator.feature_fitness, target=...).
+    keep: fraction of each generation sent to the simulator once the
+    surrogate has min_samples; explore: extra fraction picked at random
+    from the rejected candidates.
+    """
+
+    def __init__(self, simulate, score, keep=0.25, explore=0.05, min_samples=200,
+                 surrogate=None, seed=0):
+        self.simulate = simulate
+        self.score = score
+        self.keep = float(keep)
+        self.explore = float(explore)
+        self.min_samples = int(min_samples)
+        self.surrogate = surrogate if surrogate is not None else NearestNeighbourSurrogate()
+        self.random = np.random.RandomState(seed)
+        self.n_candidates = 0
+        self.n_simulated = 0
+        self.hits = 0
+        self.false_alarms = 0
+        self.misses = 0
+        self.explored = 0
+
+    def evaluate(self, params):
+        """
+        Features of every row of params, simulated or predicted.
+        Returns (features, simulated) where simulated is a boolean mask.
+        """
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        n = len(params)
+        self.n_candidates += n
+        if len(self.surrogate) < self.min_samples:
+            features = np.asarray(self.simulate(params), dtype=np.float64)
+            self.surrogate.add(params, features)
+            self.n_simulated += n
+            return features, np.ones(n, dtype=bool)
+
+        predicted, _ = self.surrogate.predict(params)
+        predicted_score = self.score(predicted)
+        order = np.argsort(predicted_score, kind="stable")
+        n_keep = max(1, int(np.ceil(self.keep * n)))
+        promising = np.zeros(n, dtype=bool)
+        promising[order[:n_keep]] = True
+        simulated = promising.copy()
+        rejected = np.flatnonzero(~promising)
+        n_explore = min(len(rejected), int(np.ceil(self.explore * n)))
+        if n_explore:
+            simulated[self.random.choice(rejected, n_explore, replace=False)] = True
+
+        features = predicted
+        rows = np.flatnonzero(simulated)
+        actual = np.asarray(self.simulate(params[rows]), dtype=np.float64)
+        features[rows] = actual
+        self.surrogate.add(params[rows], actual)
+        self.n_simulated += len(rows)
+
+        # a simulated candidate is good if it beats the worst one kept
+        cutoff = predicted_score[order[n_keep - 1]]
+        good = self.score(actual) <= cutoff
+        kept = promising[rows]
+        self.hits += int(np.sum(good & kept))
+        self.false_alarms += int(np.sum(~good & kept))
+        self.misses += int(np.sum(good & ~kept))
+        self.explored += int(np.sum(~kept))
+        return features, simulated
+
+    def stats(self):
+        """Counts of candidates and simulations, and the screen's hit/miss record."""
+        screened = self.n_candidates - self.n_simulated
+        return {
+            "candidates": self.n_candidates,
+            "simulated": self.n_simulated,
+            "screened_out": screened,
+            "hits": self.hits,
+            "false_alarms": self.false_alarms,
+            "misses": self.misses,
+            "explored": self.explored,
+            # share of the explored rejects that were in fact good
+            "miss_rate": self.misses / self.explored if self.explored else 0.0,
+        }
@@ -0,0 +1,221 @@
+"""
+Resumable parameter sweeps.
+
+A sweep walks a design (a regular grid or a Latin hypercube) in blocks of
+block_size rows. Each block is evaluated in one call, e.g. through
+sensitivity.kernel_evaluator on the batched kernels, and its results are
+written to block-<n>.npy under a temporary name and renamed into place;
+only then is the block recorded in manifest.json (also replaced
+atomically). An interrupted sweep started again on the same directory
+checks that the design is the same and carries on after the last
+completed block.
+
+Designs are generated block by block from their description (bounds,
+points or seed), so a sweep never holds more than one block of
+parameters, and the design of a resumed sweep is identical by
+construction. The strata of a Latin hypercube come from a keyed
+permutation of the row indices (a Feistel network), evaluated row by
+row, instead of a stored permutation of every row.
+
+Block files left half written by an interrupted sweep are removed when
+the sweep is opened again.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from numba import jit
+
+from .backends.noise import splitmix64, uniform
+from .tracestore import write_json
+
+FEISTEL_ROUNDS = 4
+
+
+class GridDesign(object):
+    """Full factorial grid, points[i] values per parameter, last parameter fastest."""
+
+    def __init__(self, bounds, points):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.points = np.broadcast_to(np.asarray(points, dtype=np.int64), (len(self.bounds),)).copy()
+        self.axes = [np.linspace(lo, hi, p) for (lo, hi), p in zip(self.bounds, self.points)]
+        self.n_rows = int(np.prod(self.points))
+
+    def spec(self):
+        return {"kind": "grid", "bounds": self.bounds.tolist(), "points": self.points.tolist()}
+
+    def block(self, start, stop):
+        index = np.unravel_index(np.arange(start, stop), tuple(self.points))
+        return np.column_stack([axis[i] for axis, i in zip(self.axes, index)])
+
+
+@jit(nopython=True)
+def feistel_permute(index, n, half, keys):
+    """
+    Image of index under a keyed permutation of range(n): a Feistel
+    network on 2 * half bits (4 ** half >= n), one round per key, applied
+    again while the result falls outside range(n) (cycle walking).
+    """
+    shift = np.uint64(half)
+    mask = (np.uint64(1) << shift) - np.uint64(1)
+    x = np.uint64(index)
+    while True:
+        left = x >> shift
+        right = x & mask
+        for r in range(keys.shape[0]):
+            _, f = splitmix64(keys[r] ^ right)
+            left, right = right, left ^ (f & mask)
+        x = (left << shift) | right
+        if x < np.uint64(n):
+            return np.int64(x)
+
+
+@jit(nopython=True)
+def lhs_block(start, stop, n_rows, half, keys, offset_keys):
+    """Unit cube rows start..stop of a Latin hypercube, see LatinHypercube."""
+    out = np.empty((stop - start, keys.shape[0]))
+    for j in range(keys.shape[0]):
+        for i in range(start, stop):
+            stratum = feistel_permute(i, n_rows, half, keys[j])
+            _, offset = uniform(offset_keys[j] ^ np.uint64(i))
+            out[i - start, j] = (stratum + offset) / n_rows
+    return out
+
+
+class LatinHypercube(object):
+    """
+    n_rows point Latin hypercube, one random stratum per row and parameter.
+    Row i of parameter j lies in stratum perm_j(i), a permutation keyed by
+    seed and j, at a random offset drawn from (seed, j, i) alone.
+    """
+
+    def __init__(self, bounds, n_rows, seed=0):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.n_rows = int(n_rows)
+        self.seed = int(seed)
+        rs = np.random.RandomState(self.seed)
+        keys = rs.randint(0, 2 ** 64, size=(len(self.bounds), FEISTEL_ROUNDS + 1), dtype=np.uint64)
+        self.keys = np.ascontiguousarray(keys[:, :FEISTEL_ROUNDS])
+        self.offset_keys = np.ascontiguousarray(keys[:, FEISTEL_ROUNDS])
+        self.half = 1
+        while 4 ** self.half < self.n_rows:
+            self.half += 1
+
+    def spec(self):
+        return {"kind": "lhs", "bounds": self.bounds.tolist(), "n_rows": self.n_rows, "seed": self.seed,
+                "strata": "feistel"}
+
+    def block(self, start, stop):
+        unit = lhs_block(int(start), int(stop), self.n_rows, self.half, self.keys, self.offset_keys)
+        return self.bounds[:, 0] + unit * (self.bounds[:, 1] - self.bounds[:, 0])
+
+
+class Sweep(object):
+    """
+    Evaluate every row of design with evaluate (params block -> results
+    block, one row each) into directory.
+    """
+
+    def __init__(self, directory, design, evaluate, block_size=4096, names=None):
+        self.directory = directory
+        self.design = design
+        self.evaluate = evaluate
+        self.block_size = int(block_size)
+        self.names = list(names) if names is not None else None
+        self.n_blocks = -(-design.n_rows // self.block_size)
+        os.makedirs(directory, exist_ok=True)
+        spec = dict(design.spec(), block_size=self.block_size, names=self.names)
+        self.design_id = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf8")).hexdigest()
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        for stale in glob.glob(os.path.join(directory, ".block-*.npy")):
+            os.remove(stale)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+            if self.manifest["design_id"] != self.design_id:
+                raise ValueError("%s holds a different sweep" % directory)
+        else:
+            self.manifest = {"design_id": self.design_id, "design": spec,
+                             "n_rows": design.n_rows, "n_blocks": self.n_blocks,
+                             "completed": [], "seconds": 0.0}
+            write_json(self.manifest_path, self.manifest)
+
+    def _block_path(self, block):
+        return os.path.join(self.directory, "block-%06d.npy" % block)
+
+    @property
+    def completed(self):
+        return set(self.manifest["completed"])
+
+    @property
+    def done(self):
+        return len(self.manifest["completed"]) == self.n_blocks
+
+    def run(self, max_blocks=None, verbose=False):
+        """
+        Evaluate the blocks not completed yet (at most max_blocks of them).
+        Returns the progress report.
+        """
+        completed = self.completed
+        ran = 0
+        for block in range(self.n_blocks):
+            if block in completed:
+                continue
+            if max_blocks is not None and ran >= max_blocks:
+                break
+            start = block * self.block_size
+            stop = min(start + self.block_size, self.design.n_rows)
+            began = time.perf_counter()
+            results = np.asarray(self.evaluate(self.design.block(start, stop)))
+            fd, tmp = tempfile.mkstemp(prefix=".block-", suffix=".npy", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, results)
+                os.replace(tmp, self._block_path(block))
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            self.manifest["completed"].append(block)
+            self.manifest["seconds"] += time.perf_counter() - began
+            write_json(self.manifest_path, self.manifest)
+            ran += 1
+            if verbose:
+                report = self.progress()
+                print("block %d/%d, %.0f rows/s, eta %.0f s" % (
+                    report["completed_blocks"], self.n_blocks,
+                    report["rows_per_second"], report["eta_seconds"]))
+        return self.progress()
+
+    def progress(self):
+        """Blocks and rows done, throughput over all runs, and time left."""
+        rows = sum(min(self.block_size, self.design.n_rows - b * self.block_size)
+                   for b in self.manifest["completed"])
+        seconds = self.manifest["seconds"]
+        rate = rows / seconds if seconds > 0 else 0.0
+        return {
+            "completed_blocks": len(self.manifest["completed"]),
+            "n_blocks": self.n_blocks,
+            "rows_done": rows,
+            "n_rows": self.design.n_rows,
+            "seconds": seconds,
+            "rows_per_second": rate,
+            "eta_seconds": (self.design.n_rows - rows) / rate if rate > 0 else float("nan"),
+        }
+
+    def block(self, block):
+        """(params, results) of a completed block, results memory mapped."""
+        start = block * self.block_size
+        stop = min(start + self.block_size, self.design.n_rows)
+        return self.design.block(start, stop), np.load(self._block_path(block), mmap_mode="r")
+
+    def results(self):
+        """Results of the whole sweep in design order (it must be done)."""
+        if not self.done:
+            raise RuntimeError("sweep incomplete: %d of %d blocks" % (
+                len(self.manifest["completed"]), self.n_blocks))
+        return np.concatenate([np.load(self._block_path(b)) for b in range(self.n_blocks)])
@@ -0,0 +1,221 @@
+"""
+Chunked, memory mapped columnar storage for large parameter sweeps.
+
+Layout of a store directory:
+
+    store.json                 n_samples, dt, dtype, param_names
+    chunk-<writer>-<n>/
+        vm.npy                 (rows, n_samples) voltage traces
+        params.npy             (rows, n_params) parameter rows
+        spikes.npy             all spike times (ms) of the chunk, flat
+        spike_offsets.npy      (rows + 1,) spikes of row r are
+                               spikes[offsets[r]:offsets[r + 1]]
+        chunk.json             row count, written last
+
+Every writer (one per worker process or thread) fills its own chunks, so
+parallel workers append without any locking. A chunk only becomes visible
+to readers once its chunk.json exists, and that file is created with an
+atomic rename. Readers memory map the columns and hand out NumPy views,
+nothing is loaded until it is indexed.
+"""
+import json
+import os
+import socket
+import tempfile
+import uuid
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+def write_json(path, payload):
+    """Write a JSON file atomically (temporary file + rename)."""
+    fd, tmp = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+class ChunkWriter(object):
+    """Appends rows to a TraceStore, one chunk of chunk_size rows at a time."""
+
+    def __init__(self, store, chunk_size):
+        self.store = store
+        self.chunk_size = int(chunk_size)
+        self.name = "%s-%d-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.n_chunks = 0
+        self._open = None
+
+    def _new_chunk(self):
+        meta = self.store.meta
+        path = os.path.join(self.store.directory, "chunk-%s-%06d" % (self.name, self.n_chunks))
+        os.makedirs(path)
+        self.n_chunks += 1
+        self._open = {
+            "path": path,
+            "rows": 0,
+            "vm": open_memmap(os.path.join(path, "vm.npy"), mode="w+",
+                              dtype=meta["dtype"], shape=(self.chunk_size, meta["n_samples"])),
+            "params": open_memmap(os.path.join(path, "params.npy"), mode="w+",
+                                  dtype=np.float64,
+                                  shape=(self.chunk_size, len(meta["param_names"]))),
+            "spikes": [],
+            "offsets": [np.zeros(1, dtype=np.int64)],
+            "n_spikes": 0,
+        }
+
+    def append(self, vm, params, spike_times=None, spike_offsets=None):
+        """
+        Append traces (rows, n_samples) and their parameter rows.
+        Spike times are optional, either a sequence with one array per row
+        or, with spike_offsets, in the flat form of batch_spike_times.
+        """
+        vm = np.atleast_2d(vm)
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        if vm.shape[1] != self.store.meta["n_samples"]:
+            raise ValueError("traces have %d samples, the store expects %d"
+                             % (vm.shape[1], self.store.meta["n_samples"]))
+        if params.shape != (vm.shape[0], len(self.store.meta["param_names"])):
+            raise ValueError("expected one parameter row of %d values per trace"
+                             % len(self.store.meta["param_names"]))
+        if spike_times is None:
+            spike_times = np.empty(0)
+            spike_offsets = np.zeros(vm.shape[0] + 1, dtype=np.int64)
+        elif spike_offsets is None:
+            spike_offsets = np.concatenate([[0], np.cumsum([len(t) for t in spike_times])])
+            spike_times = np.concatenate([np.asarray(t, dtype=np.float64).ravel() for t in spike_times] or [np.empty(0)])
+        spike_offsets = np.asarray(spike_offsets, dtype=np.int64)
+        done = 0
+        while done < vm.shape[0]:
+            if self._open is None:
+                self._new_chunk()
+            chunk = self._open
+            take = min(self.chunk_size - chunk["rows"], vm.shape[0] - done)
+            rows = slice(chunk["rows"], chunk["rows"] + take)
+            chunk["vm"][rows] = vm[done:done + take]
+            chunk["params"][rows] = params[done:done + take]
+            lo, hi = spike_offsets[done], spike_offsets[done + take]
+            chunk["spikes"].append(np.asarray(spike_times[lo:hi], dtype=np.float64))
+            chunk["offsets"].append(spike_offsets[done + 1:done + take + 1] - lo + chunk["n_spikes"])
+            chunk["n_spikes"] += hi - lo
+            chunk["rows"] += take
+            done += take
+            if chunk["rows"] == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Seal the current chunk, making it visible to readers."""
+        chunk = self._open
+        if chunk is None:
+            return
+        self._open = None
+        chunk["vm"].flush()
+        chunk["params"].flush()
+        del chunk["vm"], chunk["params"]
+        spikes = np.concatenate(chunk["spikes"]) if chunk["spikes"] else np.empty(0)
+        np.save(os.path.join(chunk["path"], "spikes.npy"), spikes)
+        np.save(os.path.join(chunk["path"], "spike_offsets.npy"), np.concatenate(chunk["offsets"]))
+        write_json(os.path.join(chunk["path"], "chunk.json"), {"rows": chunk["rows"]})
+
+    close = flush
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+class TraceStore(object):
+    """
+    A directory of sealed trace chunks.
+    Create a store by passing n_samples (and optionally dt, param_names,
+    dtype); open an existing one with just the directory.
+    """
+
+    def __init__(self, directory, n_samples=None, dt=None, param_names=(), dtype="float64"):
+        self.directory = directory
+        meta_path = os.path.join(directory, "store.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        elif n_samples is None:
+            raise IOError("no trace store in %s" % directory)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.meta = {"n_samples": int(n_samples), "dt": dt,
+                         "param_names": list(param_names), "dtype": np.dtype(dtype).str}
+            write_json(meta_path, self.meta)
+        self._chunks = []
+        self._starts = np.zeros(1, dtype=np.int64)
+        self.refresh()
+
+    def writer(self, chunk_size=1024):
+        """A new writer with its own chunk files, one per worker."""
+        return ChunkWriter(self, chunk_size)
+
+    def refresh(self):
+        """Pick up chunks sealed since the store was opened."""
+        known = {c["path"] for c in self._chunks}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            manifest = os.path.join(path, "chunk.json")
+            if path in known or not name.startswith("chunk-") or not os.path.exists(manifest):
+                continue
+            with open(manifest) as f:
+                rows = json.load(f)["rows"]
+            self._chunks.append({"path": path, "rows": rows})
+        self._starts = np.concatenate([[0], np.cumsum([c["rows"] for c in self._chunks])]).astype(np.int64)
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    @property
+    def n_chunks(self):
+        return len(self._chunks)
+
+    def _column(self, chunk, name):
+        if name not in chunk:
+            chunk[name] = np.load(os.path.join(chunk["path"], name + ".npy"), mmap_mode="r")
+        return chunk[name]
+
+    def chunk(self, index):
+        """Memory mapped views of one chunk: dict of vm, params, spikes, spike_offsets."""
+        chunk = self._chunks[index]
+        rows = chunk["rows"]
+        return {
+            "vm": self._column(chunk, "vm")[:rows],
+            "params": self._column(chunk, "params")[:rows],
+            "spikes": self._column(chunk, "spikes"),
+            "spike_offsets": self._column(chunk, "spike_offsets"),
+        }
+
+    def iter_chunks(self):
+        for index in range(len(self._chunks)):
+            yield self.chunk(index)
+
+    def _locate(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        index = int(np.searchsorted(self._starts, row, side="right") - 1)
+        return index, row - int(self._starts[index])
+
+    def vm(self, row):
+        index, local = self._locate(row)
+        return self.chunk(index)["vm"][local]
+
+    def params(self, row):
+        index, local = self._locate(row)
+        return self.chunk(index)["params"][local]
+
+    def spike_times(self, row):
+        index, local = self._locate(row)
+        chunk = self.chunk(index)
+        offsets = chunk["spike_offsets"]
+        return chunk["spikes"][offsets[local]:offsets[local + 1]]
+
+    def __getitem__(self, row):
+        """(vm, params, spike_times) of one row, all views into the store."""
+        return self.vm(row), self.params(row), self.spike_times(row)
@@ -21,4 +21,5 @@ setup(
     author='Russell Jarvis',
     author_email='russelljarvis@protonmail.com',
     packages = setuptools.find_packages(),
+    package_data = {'jithub': ['benchmarks/*.json']},
 )
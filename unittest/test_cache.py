@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.models import model_classes
+from jithub.models import cache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stimulus = dict(amplitude=300*pq.pA, delay=100*pq.ms, duration=400*pq.ms)
+
+    def tearDown(self):
+        cache.use_result_cache(False)
+        cache.use_prefix_cache(False)
+        shutil.rmtree(self.directory)
+
+    def test_key_tolerates_float_noise(self):
+        attrs = {'a': 0.01, 'b': 15, 'vr': -65.2}
+        noisy = {'vr': -65.2 + 1e-13, 'b': 15, 'a': 0.01}
+        stim = {'amplitude': 300.0, 'dt': 0.25}
+        self.assertEqual(cache.result_key('IZHI', attrs, stim), cache.result_key('IZHI', noisy, stim))
+        self.assertNotEqual(cache.result_key('IZHI', attrs, stim), cache.result_key('ADEXP', attrs, stim))
+        self.assertNotEqual(cache.result_key('IZHI', attrs, stim),
+                            cache.result_key('IZHI', attrs, dict(stim, amplitude=301.0)))
+
+    def test_backends_reuse_results(self):
+        results = cache.use_result_cache(directory=self.directory)
+        for cls in (model_classes.IzhiModel, model_classes.ADEXPModel):
+            first = cls().inject_square_current(**self.stimulus)
+            second = cls().inject_square_current(**self.stimulus)
+            np.testing.assert_array_equal(first.magnitude, second.magnitude)
+        self.assertEqual(results.hits, 2)
+        self.assertEqual(results.misses, 2)
+        # a fresh process-local tier is refilled from disk
+        other = cache.use_result_cache(cache.ResultCache(directory=self.directory))
+        model = model_classes.ADEXPModel()
+        model.inject_square_current(**self.stimulus)
+        self.assertEqual(other.disk_hits, 1)
+        self.assertGreater(model.get_spike_count(), 0)
+
+    def test_hit_trace_is_writable(self):
+        results = cache.use_result_cache()
+        for cls in (model_classes.IzhiModel, model_classes.ADEXPModel):
+            miss = cls().inject_square_current(**self.stimulus)
+            hit = cls().inject_square_current(**self.stimulus)
+            np.testing.assert_array_equal(hit.magnitude, miss.magnitude)
+            hit[0] = 1 * pq.mV
+            hit += 1 * pq.mV
+            # the cache entry is untouched
+            again = cls().inject_square_current(**self.stimulus)
+            np.testing.assert_array_equal(again.magnitude, miss.magnitude)
+        self.assertEqual(results.hits, 4)
+
+    def test_lru_bound(self):
+        results = cache.ResultCache(max_bytes=3 * 800)
+        for i in range(5):
+            results.put(str(i), {'vm': np.zeros(100)})
+        self.assertEqual(len(results), 3)
+        self.assertIsNone(results.get('0'))
+        self.assertIsNotNone(results.get('4'))
+
+    def test_shared_prefix(self):
+        prefixes = cache.use_prefix_cache()
+        for cls, amplitudes in ((model_classes.IzhiModel, (100, 300)), (model_classes.ADEXPModel, (10, 50))):
+            for amplitude in amplitudes:
+                for duration in (400, 200):
+                    stimulus = dict(self.stimulus, amplitude=amplitude * pq.pA, duration=duration * pq.ms)
+                    resumed = cls().inject_square_current(**stimulus)
+                    cache.use_prefix_cache(False)
+                    full = cls().inject_square_current(**stimulus)
+                    cache.use_prefix_cache(prefixes)
+                    np.testing.assert_array_equal(resumed.magnitude, full.magnitude)
+        # one delay per model type
+        self.assertEqual(prefixes.misses, 2)
+        self.assertEqual(prefixes.hits, 6)
+        cache.use_prefix_cache(False)
+        self.assertEqual(cache.cached_prefix(cls(), {'samples': 1}), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
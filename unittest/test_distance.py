@@ -0,0 +1,88 @@
+import unittest
+import numpy as np
+import quantities as pq
+from neo import AnalogSignal
+
+from jithub.analysis.distance import trace_distance, resample, dtw_cost
+from jithub.models import model_classes
+from jithub.models.evaluator import population_distance
+
+
+def dtw_reference(x, y, band):
+    n = len(x)
+    cost = np.full((n + 1, n + 1), np.inf)
+    cost[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - band), min(n, i + band) + 1):
+            cost[i, j] = (x[i - 1] - y[j - 1]) ** 2 + min(cost[i - 1, j], cost[i, j - 1], cost[i - 1, j - 1])
+    return cost[n, n]
+
+
+def spike_train(n, spikes, shift=0):
+    vm = np.full(n, -65.0)
+    for i in spikes:
+        vm[i + shift - 1:i + shift + 2] = (-20.0, 30.0, -40.0)
+    return vm
+
+
+class TestTraceDistance(unittest.TestCase):
+    def test_dtw_cost(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.normal(size=(2, 30))
+        scratch = np.empty((2, 30))
+        for band in (0, 2, 30):
+            self.assertAlmostEqual(dtw_cost(x, y, band, scratch[0], scratch[1]), dtw_reference(x, y, band))
+
+    def test_rmse_and_dtw(self):
+        target = spike_train(400, (100, 250))
+        vm = np.array([target, spike_train(400, (100, 250), shift=4), np.full(400, -65.0)])
+        rmse = trace_distance(vm, target, dt=0.25)
+        self.assertEqual(rmse[0], 0.0)
+        np.testing.assert_allclose(rmse[1], np.sqrt(np.mean((vm[1] - target) ** 2)))
+        dtw = trace_distance(vm, target, dt=0.25, metric="dtw", band=2.0)
+        self.assertTrue(np.all(dtw <= rmse))
+        # a 1 ms shift is inside the band
+        self.assertLess(dtw[1], 1e-12)
+        self.assertGreater(dtw[2], 0.0)
+        self.assertIsInstance(trace_distance(vm[1], target, dt=0.25), float)
+        with self.assertRaises(ValueError):
+            trace_distance(vm, target, dt=0.25, metric="l1")
+        with self.assertRaises(ValueError):
+            trace_distance(vm, vm[:2], dt=0.25)
+
+    def test_spike_window(self):
+        target = spike_train(400, (100, 250))
+        vm = np.array([spike_train(400, (100, 250), shift=20), spike_train(400, (100,))])
+        distance = trace_distance(vm, target, dt=0.25, spike_window=(1.0, 1.0))
+        # the shape matches wherever the spike is
+        self.assertEqual(distance[0], 0.0)
+        # the missing spike is compared at the target time
+        self.assertGreater(distance[1], 0.0)
+        with self.assertRaises(ValueError):
+            trace_distance(vm, target, dt=0.25, spike_window=(0.0, 0.0))
+
+    def test_resampling(self):
+        t = np.arange(400) * 0.25
+        vm = np.sin(t / 10.0)
+        np.testing.assert_allclose(resample(vm[::4], 1.0, 0.25), vm[:397], atol=2e-3)
+        self.assertLess(trace_distance(vm, vm[::4], dt=0.25, target_dt=1.0), 2e-3)
+        signal = AnalogSignal(vm[::2], units=pq.mV, sampling_period=0.5 * pq.ms)
+        self.assertLess(trace_distance(vm, signal, dt=0.25), 2e-3)
+
+    def test_batched_paths(self):
+        stimulus = dict(amplitude=300, delay=20, duration=100, padding=10, dt=0.25)
+        model = model_classes.IzhiModel()
+        vectors = np.array([[1.5], [1.6], [1.7]])
+        vm, _ = model.evaluate_population(vectors, names=("k",), **stimulus)
+        distance = model.score_population(vectors, vm[1], names=("k",), **stimulus)
+        self.assertEqual(distance[1], 0.0)
+        self.assertTrue(np.all(distance[[0, 2]] > 0))
+        params = np.repeat(model.kernel_row()[np.newaxis], 3, axis=0)
+        params[:, model.kernel_params.index("k")] = vectors[:, 0]
+        np.testing.assert_array_equal(
+            population_distance("IZHI", params, stimulus, vm[1], metric="dtw"),
+            trace_distance(vm, vm[1], dt=0.25, metric="dtw"))
+
+
+if __name__ == "__main__":
+    unittest.main()
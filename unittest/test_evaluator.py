@@ -0,0 +1,90 @@
+import gc
+import unittest
+import numba
+import numpy as np
+from multiprocessing import shared_memory
+
+from jithub.models.evaluator import PopulationEvaluator, BluePyOptEvaluator, population_features
+from jithub.models.backends.batched import param_matrix, IZHI_PARAM_NAMES
+
+
+class TestPopulationEvaluator(unittest.TestCase):
+    stimulus = {'amplitude': 300, 'delay': 100, 'duration': 500}
+
+    def setUp(self):
+        attrs = {'C':89.8, 'a':0.01, 'b':15, 'c':-60, 'd':10, 'k':1.6,
+                 'vPeak':(86.3-65.2), 'vr':-65.2, 'vt':-50, 'celltype':3}
+        rs = np.random.RandomState(0)
+        self.params = param_matrix([dict(attrs, a=a, d=d) for a, d in
+                                    zip(rs.uniform(0.005, 0.05, 9), rs.uniform(5, 100, 9))],
+                                   IZHI_PARAM_NAMES)
+
+    def test_workers_match_in_process(self):
+        expected = population_features("IZHI", self.params, self.stimulus)
+        with PopulationEvaluator("IZHI", self.stimulus, n_workers=2) as evaluator:
+            np.testing.assert_array_equal(evaluator.evaluate_features(self.params), expected)
+            # a larger population regrows the shared blocks
+            bigger = np.vstack([self.params, self.params])
+            np.testing.assert_array_equal(evaluator.evaluate_features(bigger)[9:], expected)
+            np.testing.assert_array_equal(evaluator.evaluate_features(self.params[:1]), expected[:1])
+
+    def test_in_process_fitness(self):
+        evaluator = PopulationEvaluator("IZHI", self.stimulus, n_workers=0)
+        features = evaluator.evaluate(self.params)
+        fitness = evaluator.fitness(self.params, {'spike_count': 10})
+        np.testing.assert_array_equal(fitness, np.abs(features['spike_count'] - 10))
+        evaluator.close()
+
+    def test_default_in_process_with_numba_threads(self):
+        threads = numba.config.NUMBA_NUM_THREADS
+        numba.config.NUMBA_NUM_THREADS = 4
+        try:
+            self.assertEqual(PopulationEvaluator("IZHI", self.stimulus).n_workers, 0)
+        finally:
+            numba.config.NUMBA_NUM_THREADS = threads
+
+    def test_dropped_evaluator_is_closed(self):
+        evaluator = PopulationEvaluator("IZHI", self.stimulus, n_workers=1)
+        evaluator.evaluate_features(self.params)
+        names = [block.name for block in evaluator._blocks]
+        process = evaluator._workers[0]
+        del evaluator
+        gc.collect()
+        self.assertFalse(process.is_alive())
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+
+    def test_bluepyopt_map(self):
+        from bluepyopt.deapext.optimisations import DEAPOptimisation
+
+        evaluator = PopulationEvaluator("IZHI", self.stimulus, n_workers=0)
+        target = {'spike_count': 10, 'mean_isi': 40.0}
+        adapter = BluePyOptEvaluator(evaluator, dict(zip(IZHI_PARAM_NAMES, self.params[0])),
+                                     ['a', 'd'], [(0.005, 0.05), (5, 100)], target)
+        self.assertEqual([o.name for o in adapter.objectives], list(target))
+        individuals = self.params[:4, [1, 4]].tolist()
+        errors = adapter.map_function(adapter.evaluate_with_lists, individuals)
+        self.assertEqual(len(errors), 4)
+        for individual, error in zip(individuals, errors):
+            self.assertEqual(list(error), adapter.evaluate_with_lists(individual))
+        self.assertEqual(adapter.evaluate_with_dicts({'a': individuals[0][0], 'd': individuals[0][1]}),
+                         dict(zip(target, errors[0])))
+        # one map call evaluates a whole generation
+        generations = []
+
+        def counted(evaluate, individuals):
+            individuals = list(individuals)
+            generations.append(len(individuals))
+            return adapter.map_function(evaluate, individuals)
+
+        optimisation = DEAPOptimisation(evaluator=adapter, offspring_size=4,
+                                        map_function=counted, seed=1)
+        population, _, _, _ = optimisation.run(max_ngen=2)
+        self.assertGreaterEqual(len(generations), 2)
+        self.assertEqual(generations[0], 4)
+        self.assertTrue(all(np.all(np.array(ind.fitness.values) <= 250.0) for ind in population))
+
+
+if __name__ == '__main__':
+    unittest.main()
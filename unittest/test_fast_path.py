@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.models import model_classes
+
+
+class TestVectorFastPath(unittest.TestCase):
+    stimulus = dict(amplitude=300, delay=100, duration=500, padding=50)
+
+    def square(self, model):
+        return model.inject_square_current(**{k: v * (pq.pA if k == 'amplitude' else pq.ms)
+                                              for k, v in self.stimulus.items()})
+
+    def test_izhi_matches_square_current(self):
+        model = model_classes.IzhiModel()
+        vector = [0.02, 7]
+        model.attrs = {'a': 0.02, 'celltype': 7}
+        expected = self.square(model).magnitude.ravel()
+        model.attrs = {'a': 0.01, 'celltype': 3}
+        vm, n_spikes = model.evaluate_vector(vector, names=('a', 'celltype'), **self.stimulus)
+        np.testing.assert_array_equal(vm, expected)
+        self.assertGreater(n_spikes, 0)
+        self.assertEqual(model.attrs['a'], 0.01)
+
+    def test_adexp_population(self):
+        model = model_classes.ADEXPModel()
+        expected = self.square(model).magnitude.ravel()
+        # without a dt attribute the ADEXP backend integrates at 0.1 ms
+        vm, counts = model.evaluate_population([[model.attrs['b']], [0.5]], names=('b',),
+                                               dt=0.1, **self.stimulus)
+        np.testing.assert_array_equal(vm[0], expected)
+        self.assertEqual(counts[0], model.get_spike_count())
+
+    def test_freeze_round_trip(self):
+        model = model_classes.IzhiModel()
+        model.freeze({'a': 0.03})
+        self.assertTrue(model.params['a'].frozen)
+        self.assertEqual(model.param_values()['a'], 0.03)
+        model.check_nonfrozen_params(['a'])
+        model.unfreeze(['a'])
+        self.assertFalse(model.params['a'].frozen)
+        with self.assertRaises(Exception):
+            model.check_nonfrozen_params(['a'])
+        model.freeze({'a': 0.04})
+        self.assertEqual(model.params['a'].value, 0.04)
+        with self.assertRaises(KeyError):
+            model.freeze({'bogus': 1.0})
+
+    def test_dtc_per_call(self):
+        model = model_classes.IzhiModel()
+        first = model.model_to_dtc({'a': 1})
+        second = model.model_to_dtc({'a': 2})
+        self.assertIsNot(first, second)
+        self.assertEqual(first.attrs, {'a': 1})
+        self.assertIsNot(model.instantiate(), model.instantiate())
+
+if __name__ == '__main__':
+    unittest.main()
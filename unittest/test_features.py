@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.analysis import features, spikes
+from jithub.models import model_classes
+
+
+class TestFeatureExtraction(unittest.TestCase):
+    def setUp(self):
+        self.model = model_classes.IzhiModel()
+        self.model.inject_square_current(amplitude=400*pq.pA, delay=100*pq.ms,
+                                         duration=500*pq.ms)
+        self.vm = self.model.get_membrane_potential()
+
+    def test_isi_features_match_spike_times(self):
+        result = self.model.get_features(stim_start=100.0)
+        times = spikes.spike_times(self.vm)
+        isi = np.diff(times)
+        self.assertEqual(result["spike_count"], len(times))
+        self.assertAlmostEqual(result["first_spike_latency"], times[0] - 100.0)
+        self.assertAlmostEqual(result["mean_isi"], isi.mean())
+        self.assertAlmostEqual(result["isi_cv"], isi.std() / isi.mean())
+        self.assertGreater(result["ap_amplitude"], 0)
+        self.assertGreater(result["ap_width"], 0)
+
+    def test_batch_subset(self):
+        vm = self.vm.magnitude[:, 0]
+        batch = np.vstack([vm, np.full_like(vm, -70.0)])
+        result = features.extract_features(batch, features=("spike_count", "mean_isi"), dt=0.25)
+        self.assertEqual(result.dtype.names, ("spike_count", "mean_isi"))
+        self.assertEqual(result["spike_count"][0], spikes.spike_count(vm, dt=0.25))
+        self.assertEqual(result["spike_count"][1], 0)
+        self.assertTrue(np.isnan(result["mean_isi"][1]))
+
+    def test_unknown_feature(self):
+        with self.assertRaises(ValueError):
+            features.extract_features(np.zeros(10), features=("bogus",))
+
+
+if __name__ == '__main__':
+    unittest.main()
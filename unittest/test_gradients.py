@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+
+from jithub.models.params import IzhiParameters, AdexpParameters
+from jithub.models.backends.batched import (
+    param_matrix,
+    simulate_square,
+    IZHI_PARAM_NAMES,
+    ADEXP_PARAM_NAMES,
+)
+from jithub.models.backends.gradients import simulate_square_gradients, refine_square
+
+
+def finite_difference(model, row, column, stimulus, rel=1e-7):
+    h = rel * max(1.0, abs(row[column]))
+    up, down = row.copy(), row.copy()
+    up[column] += h
+    down[column] -= h
+    return (simulate_square_gradients(model, up[np.newaxis], **stimulus).vm[0]
+            - simulate_square_gradients(model, down[np.newaxis], **stimulus).vm[0]) / (2 * h)
+
+
+class TestGradients(unittest.TestCase):
+    izhi = dict(amplitude=300, delay=20, duration=200, padding=10, dt=0.25)
+    adexp = dict(amplitude=50, delay=20, duration=200, padding=10, dt=0.1)
+
+    def check_sensitivities(self, model, row, stimulus, n_params):
+        result = simulate_square_gradients(model, row[np.newaxis], record=True, **stimulus)
+        self.assertEqual(result.sensitivities.shape, (1, result.vm.shape[1], n_params))
+        for column in range(n_params):
+            fd = finite_difference(model, row, column, stimulus)
+            np.testing.assert_allclose(result.sensitivities[0, :, column], fd,
+                                       atol=1e-3 * max(1.0, np.abs(fd).max()), err_msg=str(column))
+
+    def test_izhi_sensitivities(self):
+        for celltype in (3, 5, 6):
+            row = param_matrix([IzhiParameters(celltype=celltype)], IZHI_PARAM_NAMES)[0]
+            self.check_sensitivities("IZHI", row, self.izhi, 9)
+
+    def test_adexp_sensitivities(self):
+        row = param_matrix([AdexpParameters()], ADEXP_PARAM_NAMES)[0]
+        self.check_sensitivities("ADEXP", row, self.adexp, 10)
+
+    def test_matches_hard_reset_without_spikes(self):
+        params = [IzhiParameters(celltype=3)]
+        stimulus = dict(self.izhi, amplitude=20)
+        vm, counts = simulate_square("IZHI", params, *stimulus.values())
+        self.assertEqual(counts[0], 0)
+        np.testing.assert_allclose(simulate_square_gradients("IZHI", params, **stimulus).vm, vm, atol=1e-9)
+
+    def test_loss_and_gradient(self):
+        rows = param_matrix([IzhiParameters(celltype=3, k=k) for k in (1.5, 1.6, 1.7)], IZHI_PARAM_NAMES)
+        target = simulate_square_gradients("IZHI", rows[1:2], **self.izhi).vm[0]
+        result = simulate_square_gradients("IZHI", rows, target=target, **self.izhi)
+        self.assertIsNone(result.sensitivities)
+        self.assertEqual(result.grad.shape, (3, 9))
+        self.assertEqual(result.loss[1], 0.0)
+        self.assertGreater(result.loss[0], 0.0)
+        # one target row per model
+        result = simulate_square_gradients("IZHI", rows, target=result.vm, **self.izhi)
+        np.testing.assert_array_equal(result.loss, 0.0)
+        with self.assertRaises(ValueError):
+            simulate_square_gradients("IZHI", rows, target=target[:-1], **self.izhi)
+        with self.assertRaises(ValueError):
+            simulate_square_gradients("MAT", rows, **self.izhi)
+
+    def test_refine(self):
+        # a few spikes: far from other local minima of the trace error
+        stimulus = dict(amplitude=300, delay=10, duration=30, padding=10, dt=0.25)
+        row = param_matrix([IzhiParameters(celltype=3)], IZHI_PARAM_NAMES)[0]
+        target = simulate_square_gradients("IZHI", row[np.newaxis], **stimulus).vm[0]
+        columns = [IZHI_PARAM_NAMES.index(name) for name in ("k", "vr")]
+        start = row.copy()
+        start[columns] *= [1.05, 1.01]
+        refined, result = refine_square("IZHI", start, target, ["k", "vr"], **stimulus)
+        np.testing.assert_allclose(refined, row, rtol=1e-5)
+        self.assertLess(result.fun, 1e-6)
+        with self.assertRaises(ValueError):
+            refine_square("IZHI", row, target, ["celltype"], **stimulus)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# seconds jithub itself may add to `from jithub import IzhiModel`, on top
+# of the third party packages the Izhikevich path needs anyway
+OWN_IMPORT_BUDGET = 0.3
+
+DEPENDENCIES = ("numpy", "numba", "quantities", "neo", "sciunit.models", "neuronunit.capabilities",
+                "bluepyopt.ephys.models", "neuronunit.models.optimization_model_layer")
+
+NOT_NEEDED = ("matplotlib", "cupy", "numba.cuda", "jithub.models.backends.adexp",
+              "jithub.models.backends.mat_nu", "jithub.models.backends.neuron_hh")
+
+SCRIPT = """
+import importlib, json, sys, time
+for name in %r:
+    importlib.import_module(name)
+t = time.perf_counter()
+%s
+seconds = time.perf_counter() - t
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+
+def fresh_import(statement, preload=()):
+    """Time statement in a new interpreter, returns (seconds, loaded modules)."""
+    out = subprocess.check_output([sys.executable, "-c", SCRIPT % (tuple(preload), statement)],
+                                  universal_newlines=True)
+    result = json.loads(out.strip().splitlines()[-1])
+    return result["seconds"], set(result["modules"])
+
+
+class TestImportTime(unittest.TestCase):
+    def test_package_import_is_empty(self):
+        _, modules = fresh_import("import jithub")
+        for name in ("numba", "sciunit", "jithub.models"):
+            self.assertNotIn(name, modules)
+
+    def test_izhi_model_import(self):
+        seconds, modules = fresh_import("from jithub import IzhiModel", DEPENDENCIES)
+        self.assertEqual(sorted(modules.intersection(NOT_NEEDED)), [])
+        self.assertLess(seconds, OWN_IMPORT_BUDGET)
+
+    def test_other_models_still_importable(self):
+        _, modules = fresh_import("from jithub.models.model_classes import ADEXPModel")
+        self.assertIn("jithub.models.backends.adexp", modules)
+        self.assertNotIn("jithub.models.backends.mat_nu", modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+from jithub.benchmarks import izhikevich2004
+
+
+class TestIzhikevich2004(unittest.TestCase):
+    def test_behaviours_match_reference(self):
+        results = izhikevich2004.run_gallery(backends=("numba",), repeat=1)
+        self.assertEqual(len(results), len(izhikevich2004.BEHAVIOURS))
+        failed = [r["title"] for r in results if not r["ok"]]
+        self.assertEqual(failed, [])
+
+    def test_compiled_matches_interpreted(self):
+        for name in ("C", "R", "T"):
+            t, vm = izhikevich2004.simulate(name, "numba")
+            _, vm_py = izhikevich2004.simulate(name, "python")
+            self.assertEqual(list(vm), list(vm_py))
+
+
+if __name__ == '__main__':
+    unittest.main()
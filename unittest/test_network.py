@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+
+from jithub.models.backends.network import IzhikevichNetwork
+
+
+class TestIzhikevichNetwork(unittest.TestCase):
+    def test_raster_reproducible(self):
+        first = IzhikevichNetwork.random(n_exc=160, n_inh=40, seed=3)
+        times, ids = first.run(500.0)
+        self.assertGreater(len(times), 0)
+        self.assertEqual(len(times), len(ids))
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        second = IzhikevichNetwork.random(n_exc=160, n_inh=40, seed=3)
+        times_b, ids_b = second.run(250.0)
+        times_c, ids_c = second.run(250.0)
+        np.testing.assert_array_equal(times, np.concatenate([times_b, times_c]))
+        np.testing.assert_array_equal(ids, np.concatenate([ids_b, ids_c]))
+
+    def test_seed_sets_noise(self):
+        network = IzhikevichNetwork.random(n_exc=160, n_inh=40, seed=3)
+        times, ids = network.run(500.0)
+        # the noise streams follow the seed, not the reset default
+        network.reset(0)
+        times_b, ids_b = network.run(500.0)
+        self.assertFalse(len(times) == len(times_b) and np.array_equal(ids, ids_b))
+        network.reset(3)
+        times_c, ids_c = network.run(500.0)
+        np.testing.assert_array_equal(times, times_c)
+        np.testing.assert_array_equal(ids, ids_c)
+
+    def test_delayed_propagation(self):
+        # cell 0 is driven, cell 1 only receives a strong synapse from it
+        network = IzhikevichNetwork([0.02, 0.02], [0.2, 0.2], [-65, -65], [8, 8],
+                                    indptr=[0, 1, 1], indices=[1], weights=[400.0],
+                                    delays=[10], dt=0.5)
+        times, ids = network.run(200.0, I_ext=[10.0, 0.0])
+        first_pre = times[ids == 0][0]
+        first_post = times[ids == 1][0]
+        self.assertGreaterEqual(first_post - first_pre, 10 * 0.5)
+
+    def test_invalid_delay(self):
+        with self.assertRaises(ValueError):
+            IzhikevichNetwork([0.02], [0.2], [-65], [8], [0, 1], [0], [1.0], [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
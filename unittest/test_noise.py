@@ -0,0 +1,72 @@
+import unittest
+import numba
+import numpy as np
+import quantities as pq
+
+from jithub.models import model_classes
+from jithub.models.backends import noise
+from jithub.models.backends.batched import square_indices
+from jithub.models.backends.izhikevich import get_vm_one_two_three
+
+
+class TestNoisyCurrent(unittest.TestCase):
+    def setUp(self):
+        self.attrs = {'C':89.8, 'a':0.01, 'b':15, 'c':-60, 'd':10, 'k':1.6,
+                      'vPeak':(86.3-65.2), 'vr':-65.2, 'vt':-50, 'celltype':3}
+
+    def test_zero_noise_is_square_pulse(self):
+        vm, counts = noise.simulate_noisy_trials("IZHI", self.attrs, [0], mean=300,
+                                                 sigma=0, delay=100, duration=500)
+        N, start, stop = square_indices(100, 500, 0, 0.25)
+        I = np.zeros(N)
+        I[start:stop] = 300
+        reduced = {k:v for k,v in self.attrs.items() if k != 'celltype'}
+        np.testing.assert_array_equal(vm[0, 0], get_vm_one_two_three(I=I, **reduced))
+
+    def test_seeded_trials_reproducible(self):
+        population = [self.attrs, dict(self.attrs, celltype=7)]
+        kwargs = dict(mean=300, sigma=50, tau=5, delay=100, duration=500)
+        vm, counts = noise.simulate_noisy_trials("IZHI", population, [1, 2, 3], **kwargs)
+        self.assertEqual(vm.shape[:2], (2, 3))
+        again, _ = noise.simulate_noisy_trials("IZHI", population, [3, 2, 1], **kwargs)
+        np.testing.assert_array_equal(vm[:, 0], again[:, 2])
+        self.assertTrue(np.any(vm[0, 0] != vm[0, 1]))
+
+    def test_reproducible_across_thread_counts(self):
+        izhi = [self.attrs, dict(self.attrs, celltype=7), dict(self.attrs, a=0.02)]
+        adexp = np.repeat(model_classes.ADEXPModel().kernel_row()[np.newaxis], 3, axis=0)
+        adexp[:, 5] *= [1.0, 2.0, 4.0]
+        kwargs = dict(mean=300, sigma=50, tau=5, delay=100, duration=500)
+        threads = numba.get_num_threads()
+        runs = {}
+        try:
+            for n_threads in (1, numba.config.NUMBA_NUM_THREADS):
+                numba.set_num_threads(n_threads)
+                runs[n_threads] = [
+                    noise.simulate_noisy_trials("IZHI", izhi, [1, 2, 3, 4], **kwargs),
+                    noise.simulate_noisy_trials("ADEXP", adexp, [1, 2, 3, 4],
+                                                **dict(kwargs, mean=50, sigma=10, dt=0.1)),
+                ]
+        finally:
+            numba.set_num_threads(threads)
+        for single, parallel in zip(runs[1], runs[numba.config.NUMBA_NUM_THREADS]):
+            np.testing.assert_array_equal(single[0], parallel[0])
+            np.testing.assert_array_equal(single[1], parallel[1])
+
+    def test_backend_noisy_current(self):
+        model = model_classes.ADEXPModel()
+        vm = model.inject_noisy_current(mean=100*pq.pA, std=20*pq.pA, tau=2*pq.ms,
+                                        delay=100*pq.ms, duration=500*pq.ms, seed=7)
+        again = model.inject_noisy_current(mean=100*pq.pA, std=20*pq.pA, tau=2*pq.ms,
+                                           delay=100*pq.ms, duration=500*pq.ms, seed=7)
+        np.testing.assert_array_equal(vm.magnitude, again.magnitude)
+
+    def test_noisy_current_sets_stop_time(self):
+        for cls in (model_classes.IzhiModel, model_classes.ADEXPModel):
+            model = cls()
+            model.inject_noisy_current(delay=100*pq.ms, duration=500*pq.ms, padding=50*pq.ms)
+            self.assertEqual(model.tstop, 650.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
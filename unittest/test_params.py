@@ -0,0 +1,88 @@
+import pickle
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.models.params import IzhiParameters, AdexpParameters
+from jithub.models.backends.izhikevich import JIT_IZHIBackend, get_vm_one_two_three
+from jithub.models.backends.adexp import JIT_ADEXPBackend
+from jithub.models.backends.batched import param_matrix, square_indices, IZHI_PARAM_NAMES
+
+
+class TestParameterSet(unittest.TestCase):
+    def test_mapping_access(self):
+        p = IzhiParameters(a=0.02, dt=0.1)
+        self.assertEqual(p["a"], 0.02)
+        self.assertEqual(p["celltype"], 3)
+        self.assertIsInstance(p["celltype"], int)
+        self.assertEqual(p.get("dt"), 0.1)
+        self.assertIsNone(p.get("missing"))
+        self.assertIn("vPeak", p)
+        self.assertEqual(dict(p)["C"], 89.8)
+        self.assertEqual(len(p), len(IZHI_PARAM_NAMES) + 1)
+
+    def test_immutable(self):
+        p = IzhiParameters()
+        with self.assertRaises(TypeError):
+            p["a"] = 1.0
+        with self.assertRaises(AttributeError):
+            p.foo = 1
+        with self.assertRaises(ValueError):
+            p.as_array()[0] = 1.0
+
+    def test_replace_and_hash(self):
+        p = IzhiParameters()
+        q = p.replace(a=0.03)
+        self.assertEqual(p["a"], 0.01)
+        self.assertEqual(q["a"], 0.03)
+        self.assertNotEqual(p, q)
+        self.assertEqual(q, IzhiParameters(a=0.03))
+        self.assertEqual(hash(q), hash(IzhiParameters(a=0.03)))
+        self.assertEqual(p, dict(p))
+        self.assertEqual(pickle.loads(pickle.dumps(q)), q)
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            IzhiParameters(C=0.0)
+        with self.assertRaises(ValueError):
+            IzhiParameters(celltype=9)
+        with self.assertRaises(ValueError):
+            AdexpParameters(tau_w=-1.0)
+        with self.assertRaises(ValueError):
+            AdexpParameters(a=np.inf)
+        self.assertTrue(np.isnan(IzhiParameters(a=None)["a"]))
+
+    def test_param_matrix(self):
+        p = IzhiParameters(a=0.02, celltype=5)
+        np.testing.assert_array_equal(param_matrix(p, IZHI_PARAM_NAMES)[0], p.as_array())
+        np.testing.assert_array_equal(param_matrix([p, dict(p)], IZHI_PARAM_NAMES)[1], p.as_array())
+
+
+class TestBackendAttrs(unittest.TestCase):
+    def test_no_cross_talk(self):
+        first = JIT_IZHIBackend()
+        second = JIT_IZHIBackend()
+        first.set_attrs({"a": 0.05})
+        self.assertEqual(first.attrs["a"], 0.05)
+        self.assertEqual(second.attrs["a"], 0.01)
+        self.assertEqual(first.default_attrs["a"], 0.01)
+        adexp = JIT_ADEXPBackend()
+        adexp.set_attrs({"b": 1.0})
+        self.assertEqual(JIT_ADEXPBackend().attrs["b"], 0.0805)
+        self.assertEqual(adexp.default_attrs["b"], 0.0805)
+
+    def test_square_current_leaves_attrs(self):
+        model = JIT_IZHIBackend()
+        before = model.attrs
+        vm = model.inject_square_current(amplitude=300 * pq.pA, delay=100 * pq.ms,
+                                         duration=500 * pq.ms, padding=50 * pq.ms, dt=0.25)
+        self.assertIs(model.attrs, before)
+        N, start, stop = square_indices(100, 500, 50, 0.25)
+        I = np.zeros(N)
+        I[start:stop] = 300
+        expected = get_vm_one_two_three(I=I, **before.kernel_kwargs(exclude=("celltype",)))
+        np.testing.assert_array_equal(vm.magnitude.ravel(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
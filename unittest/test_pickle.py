@@ -0,0 +1,64 @@
+import copy
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.models import model_classes
+from jithub.models import cache
+
+
+class TestCompactPickle(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stimulus = dict(amplitude=300*pq.pA, delay=100*pq.ms, duration=400*pq.ms)
+
+    def tearDown(self):
+        cache.use_result_cache(False)
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        for cls in (model_classes.IzhiModel, model_classes.ADEXPModel):
+            model = cls()
+            model.attrs = {'a': model.attrs['a'] * 1.1}
+            model.inject_square_current(**self.stimulus)
+            model.precision = "float32"
+            data = pickle.dumps(model)
+            self.assertLess(len(data), 500)
+            other = pickle.loads(data)
+            self.assertIs(type(other), cls)
+            self.assertEqual(dict(other.attrs), dict(model.attrs))
+            self.assertEqual(other.precision, "float32")
+            # no cache: the trace is not carried
+            self.assertIsNone(getattr(other, 'vM', None))
+            np.testing.assert_array_equal(other.inject_square_current(**self.stimulus).magnitude,
+                                          model.inject_square_current(**self.stimulus).magnitude)
+
+    def test_result_handle(self):
+        cache.use_result_cache(directory=self.directory)
+        model = model_classes.IzhiModel()
+        vm = model.inject_square_current(**self.stimulus)
+        data = pickle.dumps(model)
+        self.assertLess(len(data), 500)
+        # another process sharing the directory
+        cache.use_result_cache(cache.ResultCache(directory=self.directory))
+        other = pickle.loads(data)
+        np.testing.assert_array_equal(other.vM.magnitude, vm.magnitude)
+        self.assertEqual(other.vM.sampling_period, vm.sampling_period)
+        other.vM += 1 * pq.mV
+        # a trace that no longer matches the cache entry is not referenced
+        model.vM = model.vM * 2
+        self.assertIsNone(cache.result_handle(model))
+
+    def test_copies_keep_state(self):
+        model = model_classes.ADEXPModel()
+        model.inject_square_current(**self.stimulus)
+        self.assertIs(copy.copy(model).vM, model.vM)
+        duplicate = copy.deepcopy(model)
+        np.testing.assert_array_equal(duplicate.vM.magnitude, model.vM.magnitude)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import numpy as np
+import quantities as pq
+
+from jithub.models.params import IzhiParameters, AdexpParameters
+from jithub.models.precision import (
+    precision_dtype,
+    spike_time_deviation,
+    validate_square,
+    validate_backend,
+)
+from jithub.models.backends.batched import simulate_square
+from jithub.models.backends.izhikevich import JIT_IZHIBackend
+from jithub.models.backends.adexp import JIT_ADEXPBackend
+from jithub.models.backends.mat_nu import JIT_MATBackend
+
+SQUARE = dict(amplitude=300 * pq.pA, delay=100 * pq.ms, duration=500 * pq.ms,
+              padding=50 * pq.ms, dt=0.25)
+
+
+class TestPrecision(unittest.TestCase):
+    def test_precision_dtype(self):
+        self.assertIs(precision_dtype("float32"), np.float32)
+        with self.assertRaises(ValueError):
+            precision_dtype("float16")
+
+    def test_float32_population(self):
+        params = [IzhiParameters(celltype=ct) for ct in range(1, 8)]
+        vm64, counts64 = simulate_square("IZHI", params, 300, 100, 500, 50, 0.25)
+        vm32, counts32 = simulate_square("IZHI", params, 300, 100, 500, 50, 0.25, precision="float32")
+        self.assertEqual(vm64.dtype, np.float64)
+        self.assertEqual(vm32.dtype, np.float32)
+        self.assertEqual(vm32.shape, vm64.shape)
+        np.testing.assert_allclose(counts32, counts64, atol=1)
+        vm, _ = simulate_square("ADEXP", [AdexpParameters()], 50, 100, 500, 50, 0.1, precision="float32")
+        self.assertEqual(vm.dtype, np.float32)
+
+    def test_spike_time_deviation(self):
+        vm = np.full((2, 100), -65.0)
+        vm[:, [10, 50]] = 20.0
+        shifted = vm.copy()
+        shifted[1, 50], shifted[1, 51] = -65.0, 20.0
+        report = spike_time_deviation(vm, shifted, dt=0.5)
+        self.assertEqual(report["n_traces"], 2)
+        self.assertEqual(report["count_mismatches"], 0)
+        self.assertEqual(report["paired_spikes"], 4)
+        self.assertAlmostEqual(report["max_abs_ms"], 0.5)
+        shifted[0, 10] = -65.0
+        self.assertEqual(spike_time_deviation(vm, shifted, dt=0.5)["count_mismatches"], 1)
+
+    def test_validate_square(self):
+        report = validate_square("IZHI", [IzhiParameters(celltype=5)], 300, 100, 500, 50, 0.25)
+        self.assertEqual(report["count_mismatches"], 0)
+        self.assertGreater(report["paired_spikes"], 0)
+        self.assertLess(report["max_abs_ms"], 0.25)
+
+    def test_backends(self):
+        model = JIT_IZHIBackend()
+        model.precision = "float32"
+        self.assertEqual(model.inject_square_current(**SQUARE).magnitude.dtype, np.float32)
+        self.assertEqual(model.integrate(np.full(400, 300.0)).dtype, np.float32)
+        report = validate_backend(JIT_ADEXPBackend(), amplitude=50 * pq.pA, delay=100 * pq.ms,
+                                  duration=500 * pq.ms, padding=50 * pq.ms, dt=0.1)
+        self.assertEqual(report["count_mismatches"], 0)
+        self.assertLess(report["max_abs_ms"], 0.1)
+
+    def test_mat(self):
+        model = JIT_MATBackend()
+        vm = model.inject_square_current(amplitude=1 * pq.pA, delay=100 * pq.ms, duration=500 * pq.ms)
+        spikes = list(model.spikes)
+        self.assertEqual(len(vm), 600)
+        self.assertGreater(len(spikes), 0)
+        self.assertTrue(all(100 <= t < 600 for t in spikes))
+        model = JIT_MATBackend()
+        model.precision = "float32"
+        vm = model.inject_square_current(amplitude=1 * pq.pA, delay=100 * pq.ms, duration=500 * pq.ms)
+        self.assertEqual(vm.magnitude.dtype, np.float32)
+        self.assertEqual(list(model.spikes), spikes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import unittest
+import quantities as pq
+
+from jithub.models import profiling
+from jithub.models.backends.izhikevich import JIT_IZHIBackend
+from jithub.models.backends.adexp import JIT_ADEXPBackend
+
+
+class TestPhaseProfiler(unittest.TestCase):
+    def test_nested_spans(self):
+        profiler = profiling.PhaseProfiler()
+        for _ in range(3):
+            with profiler.span("call"):
+                with profiler.span("kernel"):
+                    pass
+                with profiler.span("wrap"):
+                    pass
+        stats = profiler.stats()
+        self.assertEqual(list(stats), ["call;kernel", "call;wrap", "call"])
+        self.assertEqual(stats["call"]["count"], 3)
+        self.assertLessEqual(stats["call"]["self_s"], stats["call"]["total_s"])
+        self.assertEqual(profiler.count("kernel"), 3)
+        folded = profiler.folded().splitlines()
+        self.assertEqual([line.split()[0] for line in folded], list(stats))
+        trace = profiler.chrome_trace()["traceEvents"]
+        self.assertEqual(len(trace), 9)
+        self.assertEqual({e["ph"] for e in trace}, {"X"})
+
+    def test_disabled_is_a_no_op(self):
+        backend = JIT_IZHIBackend()
+        self.assertIs(profiling.phase(backend, "kernel"), profiling.NULL_SPAN)
+
+
+class TestBackendPhases(unittest.TestCase):
+    def test_izhi_phases(self):
+        backend = JIT_IZHIBackend()
+        backend.profiler = profiling.PhaseProfiler()
+        backend.inject_square_current(amplitude=300 * pq.pA, delay=10 * pq.ms, duration=100 * pq.ms)
+        backend.get_spike_count()
+        stats = backend.profiler.stats()
+        for path in ("IZHI.inject_square_current;kernel", "IZHI.inject_square_current;wrap",
+                     "IZHI.inject_square_current;stimulus", "IZHI.get_spike_count;spikes"):
+            self.assertEqual(stats[path]["count"], 1, path)
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        backend.profiler.write_chrome_trace(path)
+        with open(path) as f:
+            self.assertTrue(json.load(f)["traceEvents"])
+
+    def test_default_profiler(self):
+        profiler = profiling.use_profiler()
+        try:
+            JIT_ADEXPBackend().inject_square_current(amplitude=300 * pq.pA, duration=100 * pq.ms)
+        finally:
+            profiling.use_profiler(False)
+        self.assertEqual(profiler.count("kernel"), 1)
+        self.assertIn("ADEXP.inject_square_current;stimulus", profiler.stats())
+        JIT_ADEXPBackend().inject_square_current(amplitude=300 * pq.pA, duration=100 * pq.ms)
+        self.assertEqual(profiler.count("kernel"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
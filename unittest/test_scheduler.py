@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+import numba
+import numpy as np
+import quantities as pq
+
+from jithub.models import model_classes
+from jithub.models.scheduler import BatchScheduler, scheduler_for
+
+
+class TestSimulateAsync(unittest.TestCase):
+    def test_concurrent_requests_are_coalesced(self):
+        model = model_classes.IzhiModel()
+        stimulus = {'amplitude': 300, 'delay': 100, 'duration': 500}
+        expected = model.inject_square_current(amplitude=300*pq.pA, delay=100*pq.ms,
+                                               duration=500*pq.ms).magnitude.ravel()
+        attrs = dict(model.attrs)
+
+        async def run():
+            results = await asyncio.gather(*[
+                model.simulate_async(dict(attrs, a=a), stimulus) for a in (0.01, 0.02, 0.03)
+            ] + [model.simulate_async(attrs, stimulus, padding=50)])
+            return results, scheduler_for("IZHI")
+
+        results, scheduler = asyncio.run(run())
+        np.testing.assert_array_equal(results[0].magnitude.ravel(), expected)
+        self.assertFalse(np.array_equal(results[1].magnitude, results[0].magnitude))
+        self.assertEqual(len(results[3]), len(expected) + 200)
+        self.assertEqual((scheduler.n_requests, scheduler.n_batches), (4, 2))
+
+    def test_precision_and_close(self):
+        model = model_classes.ADEXPModel()
+        model.precision = "float32"
+        stimulus = {'amplitude': 300, 'delay': 100, 'duration': 500, 'dt': 0.1}
+        scheduler = BatchScheduler("ADEXP", window=0.01)
+        if numba.threading_layer() not in ("tbb", "omp"):
+            self.assertIsNotNone(scheduler._lock)
+
+        async def run():
+            single = scheduler.simulate(model.attrs, stimulus, "float32")
+            # different stimuli run as concurrent batches
+            batches = [scheduler.simulate(dict(model.attrs, b=b), dict(stimulus, amplitude=amp))
+                       for b in (0.5, 1.0) for amp in (100, 200, 300, 400)]
+            results = await asyncio.gather(single, *batches)
+            await scheduler.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(results[0][0].dtype, np.float32)
+        self.assertEqual(results[1][0].dtype, np.float64)
+        self.assertEqual(scheduler.n_batches, 5)
+        self.assertTrue(scheduler.executor._shutdown)
+        scheduler.close()
+
+        async def through_backend():
+            return await model.simulate_async(None, stimulus)
+
+        self.assertEqual(asyncio.run(through_backend()).magnitude.dtype, np.float32)
+
+
+if __name__ == '__main__':
+    unittest.main()
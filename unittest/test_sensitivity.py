@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+
+from jithub.models import sensitivity
+from jithub.models.backends.batched import IZHI_PARAM_NAMES
+
+
+def linear(x):
+    # one defined and one undefined "feature"
+    return np.column_stack([x[:, 0] + 2 * x[:, 1], np.full(len(x), np.nan)])
+
+
+class TestSensitivity(unittest.TestCase):
+    bounds = [[0, 1], [0, 1], [0, 1]]
+
+    def test_sobol_linear(self):
+        result = sensitivity.sobol_indices(linear, self.bounds, 4096, block_size=512,
+                                           features=('y', 'undefined'))
+        np.testing.assert_allclose(result['S1'][0], [0.2, 0.8, 0.0], atol=0.02)
+        np.testing.assert_allclose(result['ST'][0], [0.2, 0.8, 0.0], atol=0.02)
+        self.assertTrue(np.all(np.isnan(result['S1'][1])))
+        self.assertEqual(result['n_evaluations'], 4096 * 5)
+
+    def test_morris_linear(self):
+        result = sensitivity.morris_indices(linear, self.bounds, r=20, block_size=7,
+                                            features=('y', 'undefined'))
+        np.testing.assert_allclose(result['mu_star'][0], [1, 2, 0])
+        np.testing.assert_allclose(result['sigma'][0], 0, atol=1e-12)
+
+    def test_kernel_evaluator(self):
+        base = dict(zip(IZHI_PARAM_NAMES, [89.8, 0.01, 15, -60, 10, 1.6, 21.1, -65.2, -50, 3]))
+        evaluate = sensitivity.kernel_evaluator(
+            "IZHI", base, ('a', 'd'), {'amplitude': 300, 'delay': 100, 'duration': 500})
+        result = sensitivity.morris_indices(evaluate, [[0.005, 0.05], [5, 100]], r=8)
+        spike_count = result['features'].index('spike_count')
+        self.assertTrue(np.all(result['mu_star'][spike_count] > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+
+from jithub.models import model_classes
+from jithub.models.params import IzhiParameters, AdexpParameters
+from jithub.models.backends.batched import simulate_square, SOA_BLOCK
+
+
+class TestStructureOfArrays(unittest.TestCase):
+    stimulus = dict(amplitude=300, delay=100, duration=500, padding=50, dt=0.25)
+
+    def square(self, model, params, **kwargs):
+        s = dict(self.stimulus, **kwargs)
+        return simulate_square(model, params, s["amplitude"], s["delay"], s["duration"],
+                               s["padding"], s["dt"], **{k: v for k, v in kwargs.items() if k not in self.stimulus})
+
+    def test_izhi_matches_aos(self):
+        rng = np.random.default_rng(0)
+        # more rows than a block, every celltype mixed together
+        params = [IzhiParameters(celltype=int(ct), a=0.01 * (1 + 0.2 * rng.random()))
+                  for ct in rng.integers(1, 8, size=SOA_BLOCK + 40)]
+        vm, counts = self.square("IZHI", params)
+        vm_soa, counts_soa = self.square("IZHI", params, layout="soa")
+        np.testing.assert_array_equal(vm_soa, vm)
+        np.testing.assert_array_equal(counts_soa, counts)
+        self.assertGreater(counts.min(), 0)
+
+    def test_adexp_matches_aos(self):
+        params = [AdexpParameters(a=a) for a in np.linspace(2.0, 8.0, SOA_BLOCK + 3)]
+        vm, counts = self.square("ADEXP", params, amplitude=50, dt=0.1)
+        vm_soa, counts_soa = self.square("ADEXP", params, amplitude=50, dt=0.1, layout="soa")
+        np.testing.assert_array_equal(vm_soa, vm)
+        np.testing.assert_array_equal(counts_soa, counts)
+
+    def test_float32(self):
+        params = [IzhiParameters(celltype=5)] * 4
+        vm, _ = self.square("IZHI", params, precision="float32")
+        vm_soa, _ = self.square("IZHI", params, precision="float32", layout="soa")
+        self.assertEqual(vm_soa.dtype, np.float32)
+        np.testing.assert_array_equal(vm_soa, vm)
+
+    def test_population_fast_path(self):
+        model = model_classes.IzhiModel()
+        vectors = [[0.01], [0.02], [0.03]]
+        vm, counts = model.evaluate_population(vectors, names=("a",), **self.stimulus)
+        vm_soa, counts_soa = model.evaluate_population(vectors, names=("a",), layout="soa",
+                                                       **self.stimulus)
+        np.testing.assert_array_equal(vm_soa, vm)
+        np.testing.assert_array_equal(counts_soa, counts)
+        with self.assertRaises(ValueError):
+            model.evaluate_population(vectors, names=("a",), layout="columns")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+import quantities as pq
+from neo import AnalogSignal
+from elephant.spike_train_generation import threshold_detection
+
+from jithub.analysis import spikes
+from jithub.models import model_classes
+
+
+class TestSpikeDetection(unittest.TestCase):
+    def setUp(self):
+        model = model_classes.IzhiModel()
+        model.inject_square_current(amplitude=400*pq.pA, delay=100*pq.ms,
+                                    duration=500*pq.ms)
+        self.vm = model.get_membrane_potential()
+
+    def test_matches_elephant(self):
+        reference = threshold_detection(self.vm, 0*pq.mV)
+        times = spikes.spike_times(self.vm)
+        self.assertGreater(len(reference), 0)
+        self.assertEqual(len(times), len(reference))
+        # interpolated crossings lie within one sample before elephant's times
+        dt = float(self.vm.sampling_period)
+        lag = reference.rescale(pq.ms).magnitude - times
+        self.assertTrue(np.all((lag >= 0) & (lag <= dt)))
+
+    def test_batched_rows(self):
+        vm = self.vm.magnitude[:, 0]
+        batch = np.vstack([vm, np.full_like(vm, -70.0), vm])
+        counts = spikes.spike_count(batch, dt=0.25)
+        single = spikes.spike_count(vm, dt=0.25)
+        np.testing.assert_array_equal(counts, [single, 0, single])
+        times = spikes.spike_times(batch, dt=0.25)
+        np.testing.assert_array_equal(times[0], times[2])
+        self.assertEqual(len(times[1]), 0)
+
+    def test_interpolation_and_refractory(self):
+        vm = np.array([-10.0, 10.0, -10.0, 30.0, -10.0])
+        np.testing.assert_allclose(spikes.spike_times(vm, dt=1.0), [0.5, 2.25])
+        self.assertEqual(spikes.spike_count(vm, dt=1.0, refractory=2.0), 1)
+        # plain arrays carry no sampling period
+        with self.assertRaises(ValueError):
+            spikes.spike_times(vm)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import functools
+import unittest
+import numpy as np
+
+from jithub.models.evaluator import population_features, feature_fitness
+from jithub.models.surrogate import NearestNeighbourSurrogate, SurrogateScreen
+from jithub.models.backends.batched import IZHI_PARAM_NAMES
+
+
+class TestSurrogate(unittest.TestCase):
+    def test_nearest_neighbour_recovers_samples(self):
+        rs = np.random.RandomState(0)
+        x = rs.rand(50, 3)
+        y = np.column_stack([x.sum(axis=1), np.where(x[:, 0] > 0.5, np.nan, 1.0)])
+        surrogate = NearestNeighbourSurrogate(k=1)
+        surrogate.add(x, y)
+        predicted, distance = surrogate.predict(x[:5])
+        np.testing.assert_array_equal(predicted, y[:5])
+        np.testing.assert_array_equal(distance, 0)
+
+    def test_screen_saves_simulations(self):
+        stimulus = {'amplitude': 300, 'delay': 100, 'duration': 500}
+        base = np.array([89.8, 0.01, 15, -60, 10, 1.6, 21.1, -65.2, -50, 3])
+        a = IZHI_PARAM_NAMES.index('a')
+        d = IZHI_PARAM_NAMES.index('d')
+
+        def population(n, rs):
+            params = np.repeat(base[np.newaxis], n, axis=0)
+            params[:, a] = rs.uniform(0.001, 0.1, n)
+            params[:, d] = rs.uniform(1, 200, n)
+            return params
+
+        simulate = functools.partial(population_features, "IZHI", stimulus=stimulus)
+        score = functools.partial(feature_fitness, target={'spike_count': 10})
+        screen = SurrogateScreen(simulate, score, keep=0.2, explore=0.1, min_samples=100)
+        rs = np.random.RandomState(1)
+        for generation in range(4):
+            features, simulated = screen.evaluate(population(100, rs))
+            self.assertEqual(features.shape[0], 100)
+        stats = screen.stats()
+        self.assertEqual(stats['simulated'], 100 + 3 * 30)
+        self.assertEqual(stats['screened_out'], 3 * 70)
+        self.assertEqual(stats['hits'] + stats['false_alarms'], 3 * 20)
+        self.assertGreater(stats['hits'], stats['false_alarms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from jithub.models.sweep import GridDesign, LatinHypercube, Sweep
+
+
+class Crash(Exception):
+    pass
+
+
+class Unsaveable(object):
+    def __reduce__(self):
+        raise Crash()
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_designs(self):
+        grid = GridDesign([[0, 1], [10, 20]], [3, 2])
+        np.testing.assert_array_equal(grid.block(0, 6)[:3], [[0, 10], [0, 20], [0.5, 10]])
+        lhs = LatinHypercube([[0, 1], [-1, 1]], 50, seed=3)
+        unit = (lhs.block(0, 50) - [0, -1]) / [1, 2]
+        for column in unit.T:
+            np.testing.assert_array_equal(np.sort(np.floor(column * 50)), np.arange(50))
+        np.testing.assert_array_equal(lhs.block(10, 20), LatinHypercube([[0, 1], [-1, 1]], 50, seed=3).block(10, 20))
+        self.assertFalse(np.array_equal(lhs.block(0, 50), LatinHypercube([[0, 1], [-1, 1]], 50, seed=4).block(0, 50)))
+
+    def test_lhs_is_generated_per_block(self):
+        lhs = LatinHypercube([[0, 1]] * 3, 1000, seed=0)
+        unit = lhs.block(0, 1000)
+        for column in unit.T:
+            np.testing.assert_array_equal(np.sort(np.floor(column * 1000)), np.arange(1000))
+        np.testing.assert_array_equal(lhs.block(400, 410), unit[400:410])
+        # nothing proportional to n_rows is stored
+        huge = LatinHypercube([[0, 1]] * 3, 10 ** 9, seed=0)
+        self.assertLess(sum(np.asarray(v).nbytes for v in vars(huge).values()), 1024)
+        self.assertTrue(np.all((huge.block(10 ** 9 - 5, 10 ** 9) >= 0) & (huge.block(10 ** 9 - 5, 10 ** 9) < 1)))
+
+    def test_interrupted_write_leaves_no_files(self):
+        design = GridDesign([[0, 1]], [4])
+        with self.assertRaises(Crash):
+            Sweep(self.directory, design, lambda p: [Unsaveable()] * len(p), block_size=2).run()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["manifest.json"])
+        # files from a process killed mid write are removed on resume
+        open(os.path.join(self.directory, ".block-stale.npy"), "wb").close()
+        sweep = Sweep(self.directory, design, lambda p: p, block_size=2)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["manifest.json"])
+        sweep.run()
+        np.testing.assert_array_equal(sweep.results()[:, 0], [0, 1 / 3, 2 / 3, 1])
+
+    def test_resume_after_crash(self):
+        design = LatinHypercube([[0, 1], [0, 1]], 100, seed=1)
+        calls = []
+
+        def evaluate(params):
+            calls.append(len(params))
+            if len(calls) == 3:
+                raise Crash()
+            return params.sum(axis=1, keepdims=True)
+
+        with self.assertRaises(Crash):
+            Sweep(self.directory, design, evaluate, block_size=30).run()
+        sweep = Sweep(self.directory, LatinHypercube([[0, 1], [0, 1]], 100, seed=1), evaluate, block_size=30)
+        self.assertEqual(sweep.completed, {0, 1})
+        report = sweep.run()
+        self.assertEqual(calls, [30, 30, 30, 30, 10])
+        self.assertEqual(report['rows_done'], 100)
+        self.assertGreater(report['rows_per_second'], 0)
+        np.testing.assert_array_equal(sweep.results()[:, 0], design.block(0, 100).sum(axis=1))
+        with self.assertRaises(ValueError):
+            Sweep(self.directory, design, evaluate, block_size=50)
+
+
+if __name__ == '__main__':
+    unittest.main()
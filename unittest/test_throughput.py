@@ -0,0 +1,32 @@
+import copy
+import unittest
+
+from jithub.benchmarks import throughput
+
+SMALL = dict(duration=50.0, n_models=8, min_time=0.0, lengths=(20.0, 40.0), threads=[1])
+
+
+class TestThroughput(unittest.TestCase):
+    def test_measure_case(self):
+        result = throughput.measure_case("IZHI-5", **SMALL)
+        self.assertEqual(result["status"], "ok")
+        self.assertGreater(result["single"]["sim_ms_per_s"], 0)
+        self.assertGreater(result["batched"]["sim_ms_per_s"], 0)
+        self.assertGreater(result["batched_soa"]["sim_ms_per_s"], 0)
+        self.assertEqual([r["threads"] for r in result["threads"]], [1])
+        self.assertEqual([r["duration"] for r in result["trace_length"]], [20.0, 40.0])
+
+    def test_isolated_case_and_compare(self):
+        report = throughput.run_suite(cases=("ADEXP",), **SMALL)
+        result = report["results"][0]
+        self.assertEqual(result["status"], "ok", result.get("error"))
+        self.assertIn("numba", report["environment"])
+        self.assertEqual(throughput.compare(report, report), [])
+        slower = copy.deepcopy(report)
+        slower["results"][0]["single"]["sim_ms_per_s"] /= 2
+        regressions = throughput.compare(report, slower)
+        self.assertEqual([r["metric"] for r in regressions], ["single.sim_ms_per_s"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from jithub.models.tracestore import TraceStore
+from jithub.models.backends import noise
+from jithub.models.backends.batched import IZHI_PARAM_NAMES, ADEXP_PARAM_NAMES, simulate_square
+from jithub.models import model_classes
+from jithub.models.sensitivity import kernel_evaluator
+from jithub.analysis.spikes import spike_times
+
+
+class TestTraceStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_across_chunks(self):
+        store = TraceStore(self.directory, n_samples=5, param_names=("a", "b"))
+        vm = np.arange(35, dtype=float).reshape(7, 5)
+        params = np.arange(14, dtype=float).reshape(7, 2)
+        spikes = [np.arange(r) * 1.5 for r in range(7)]
+        with store.writer(chunk_size=3) as writer:
+            writer.append(vm[:4], params[:4], spikes[:4])
+            self.assertEqual(len(TraceStore(self.directory)), 3)
+            writer.append(vm[4:], params[4:], spikes[4:])
+        store.refresh()
+        self.assertEqual((len(store), store.n_chunks), (7, 3))
+        for row in range(7):
+            trace, p, times = store[row]
+            np.testing.assert_array_equal(trace, vm[row])
+            np.testing.assert_array_equal(p, params[row])
+            np.testing.assert_array_equal(times, spikes[row])
+        self.assertIsInstance(store.vm(-1).base, np.memmap)
+
+    def test_parallel_writers(self):
+        store = TraceStore(self.directory, n_samples=2)
+        first, second = store.writer(), store.writer()
+        first.append(np.ones((2, 2)), np.empty((2, 0)))
+        second.append(np.zeros((1, 2)), np.empty((1, 0)))
+        first.close()
+        second.close()
+        store.refresh()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sum(c["vm"].sum() for c in store.iter_chunks()), 4)
+
+    def test_noisy_trials_sink(self):
+        attrs = {'C':89.8, 'a':0.01, 'b':15, 'c':-60, 'd':10, 'k':1.6,
+                 'vPeak':(86.3-65.2), 'vr':-65.2, 'vt':-50, 'celltype':3}
+        population = [attrs, dict(attrs, a=0.02)]
+        kwargs = dict(mean=300, sigma=20, tau=5, delay=100, duration=500)
+        vm, counts = noise.simulate_noisy_trials("IZHI", population, [0, 1], **kwargs)
+        store = TraceStore(self.directory, n_samples=vm.shape[-1], dt=0.25,
+                           param_names=IZHI_PARAM_NAMES)
+        with store.writer() as writer:
+            noise.simulate_noisy_trials("IZHI", population, [0, 1], sink=writer, **kwargs)
+        store.refresh()
+        self.assertEqual(len(store), 4)
+        np.testing.assert_array_equal(store.vm(3), vm[1, 1])
+        self.assertEqual(store.params(2)[1], 0.02)
+        self.assertEqual(len(store.spike_times(0)), counts[0, 0])
+
+    def test_batched_sinks(self):
+        stimulus = dict(amplitude=300, delay=20, duration=100, padding=10, dt=0.25)
+        model = model_classes.IzhiModel()
+        vectors = np.array([[1.5], [1.6], [1.7]])
+        vm, counts = model.evaluate_population(vectors, names=("k",), **stimulus)
+        store = TraceStore(self.directory, n_samples=vm.shape[1], dt=0.25,
+                           param_names=IZHI_PARAM_NAMES)
+        with store.writer() as writer:
+            model.evaluate_population(vectors, names=("k",), layout="soa", sink=writer, **stimulus)
+            evaluate = kernel_evaluator("IZHI", model.attrs, ("k",), stimulus, sink=writer)
+            evaluate(vectors[:2])
+        store.refresh()
+        self.assertEqual(len(store), 5)
+        for row in range(3):
+            np.testing.assert_array_equal(store.vm(row), vm[row])
+            self.assertEqual(store.params(row)[IZHI_PARAM_NAMES.index("k")], vectors[row, 0])
+            self.assertEqual(len(store.spike_times(row)), counts[row])
+            np.testing.assert_array_equal(store.spike_times(row), spike_times(vm[row], dt=0.25))
+        np.testing.assert_array_equal(store.vm(4), vm[1])
+
+    def test_adexp_sink(self):
+        params = np.repeat(model_classes.ADEXPModel().kernel_row()[np.newaxis], 2, axis=0)
+        vm, _ = simulate_square("ADEXP", params, 50, 20, 100, 10, 0.1)
+        store = TraceStore(self.directory, n_samples=vm.shape[1], dt=0.1,
+                           param_names=ADEXP_PARAM_NAMES)
+        with store.writer() as writer:
+            simulate_square("ADEXP", params, 50, 20, 100, 10, 0.1, sink=writer)
+        store.refresh()
+        np.testing.assert_array_equal(store.vm(1), vm[1])
+        np.testing.assert_array_equal(store.params(0), params[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+import numpy as np
+import quantities as pq
+from neo import AnalogSignal
+
+# capabilities.py lives at the top of the repository, outside the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capabilities
+from jithub.models import model_classes
+
+
+class StatsModel(capabilities.ProducesMembranePotential, model_classes.IzhiModel):
+    get_membrane_potential = model_classes.IzhiModel.get_membrane_potential
+
+
+class TestVmStats(unittest.TestCase):
+    def test_matches_numpy(self):
+        values = np.random.RandomState(0).normal(-65.0, 5.0, size=1001)
+        for trace in (values, values[:1000], values[:2]):
+            vm = AnalogSignal(trace, units=pq.mV, sampling_period=0.25*pq.ms)
+            stats = capabilities.VmStats(vm)
+            self.assertAlmostEqual(stats.mean, np.mean(trace))
+            self.assertAlmostEqual(stats.std, np.std(trace))
+            self.assertAlmostEqual(stats.median, np.median(trace))
+            self.assertAlmostEqual(stats.iqr, np.percentile(trace, 75) - np.percentile(trace, 25))
+            np.testing.assert_array_equal(stats.initial, vm[0])
+
+    def test_cached_per_trace(self):
+        model = StatsModel()
+        model.inject_square_current(amplitude=300*pq.pA, delay=100*pq.ms, duration=400*pq.ms)
+        stats = model.get_vm_stats()
+        self.assertIs(model.get_vm_stats(), stats)
+        vm = model.get_membrane_potential().magnitude.ravel()
+        self.assertAlmostEqual(model.get_mean_vm(), np.mean(vm))
+        self.assertAlmostEqual(model.get_median_vm(), np.median(vm))
+        self.assertEqual(model.get_iqr_vm().units, pq.mV)
+        # a new simulation produces a new trace
+        model.inject_square_current(amplitude=500*pq.pA, delay=100*pq.ms, duration=400*pq.ms)
+        fresh = model.get_vm_stats()
+        self.assertIsNot(fresh, stats)
+        self.assertAlmostEqual(fresh.mean, np.mean(model.get_membrane_potential().magnitude))
+        model.invalidate_vm_stats()
+        self.assertIsNot(model.get_vm_stats(), fresh)
+
+
+if __name__ == '__main__':
+    unittest.main()